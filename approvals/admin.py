@@ -1,3 +1,15 @@
 from django.contrib import admin
+from .models import WorkItem, InboxCounter
 
-# Register your models here.
+@admin.register(WorkItem)
+class WorkItemAdmin(admin.ModelAdmin):
+    list_display = ['title', 'kind', 'assignee', 'status', 'created_at', 'resolved_by', 'resolved_at']
+    list_filter = ['kind', 'status']
+    search_fields = ['title', 'project__project_id']
+    readonly_fields = ['item_id', 'created_at', 'resolved_at']
+    raw_id_fields = ['assignee', 'project', 'nomination', 'stage', 'resolved_by']
+
+@admin.register(InboxCounter)
+class InboxCounterAdmin(admin.ModelAdmin):
+    list_display = ['user', 'open_count', 'approved_count', 'rejected_count']
+    raw_id_fields = ['user']
@@ -0,0 +1,219 @@
+# approvals/inbox.py
+"""
+Maintains the materialized approval inbox.
+
+Workflows call open_items() when a decision becomes due and resolve_items()
+when it is taken; open_batch() and resolve_batch() do the same for many
+records in a few statements. All must run inside the workflow's transaction
+so the inbox and its counters never disagree with the underlying records.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from projects import live
+from .models import WorkItem, InboxCounter
+
+User = get_user_model()
+
+# Offices that approve projects and stages
+APPROVER_OFFICES = ['executive_director', 'general_manager']
+
+
+def approvers(offices=None):
+    """Active users holding any of the given offices"""
+    return User.objects.filter(office__in=offices or APPROVER_OFFICES, is_active=True)
+
+
+def _ensure_counters(user_ids):
+    InboxCounter.objects.bulk_create(
+        [InboxCounter(user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+
+
+@transaction.atomic
+def open_items(kind, assignees, project, title, summary='', link='', nomination=None, stage=None):
+    """Put one open item per assignee in their inbox"""
+    user_ids = {user.pk if hasattr(user, 'pk') else user for user in assignees}
+    if not user_ids:
+        return []
+
+    # Don't queue the same decision twice for the same person
+    already_open = set(_targets(kind, project, nomination, stage).filter(
+        status='open', assignee_id__in=user_ids,
+    ).values_list('assignee_id', flat=True))
+    user_ids -= already_open
+    if not user_ids:
+        return []
+
+    now = timezone.now()
+    items = WorkItem.objects.bulk_create([
+        WorkItem(
+            assignee_id=user_id,
+            kind=kind,
+            project=project,
+            nomination=nomination,
+            stage=stage,
+            title=title,
+            summary=summary,
+            link=link,
+            created_at=now,
+        )
+        for user_id in user_ids
+    ])
+
+    _ensure_counters(user_ids)
+    InboxCounter.objects.filter(user_id__in=user_ids).update(open_count=F('open_count') + 1)
+    live.counts_changed(user_ids)
+    return items
+
+
+def _add_open_counts(counts, sign=1):
+    """Add {user_id: n} (or subtract, with sign=-1) to the users' open counts"""
+    by_amount = {}
+    for user_id, n in counts.items():
+        by_amount.setdefault(n, []).append(user_id)
+    for n, user_ids in by_amount.items():
+        InboxCounter.objects.filter(user_id__in=user_ids).update(open_count=F('open_count') + sign * n)
+
+
+@transaction.atomic
+def open_batch(kind, assignees, entries):
+    """
+    open_items() for many records at once. ``entries`` are dicts with the
+    project, nomination or stage, title, summary and link of each decision.
+    """
+    user_ids = {user.pk if hasattr(user, 'pk') else user for user in assignees}
+    if not user_ids or not entries:
+        return []
+
+    # Don't queue the same decision twice for the same person
+    target = 'nomination' if entries[0].get('nomination') else 'stage' if entries[0].get('stage') else 'project'
+    already_open = set(WorkItem.objects.filter(
+        kind=kind, status='open', assignee_id__in=user_ids,
+        **{f'{target}__in': [entry[target] for entry in entries]},
+    ).values_list(f'{target}_id', 'assignee_id'))
+
+    now = timezone.now()
+    items = WorkItem.objects.bulk_create([
+        WorkItem(
+            assignee_id=user_id,
+            kind=kind,
+            project=entry['project'],
+            nomination=entry.get('nomination'),
+            stage=entry.get('stage'),
+            title=entry['title'],
+            summary=entry.get('summary', ''),
+            link=entry.get('link', ''),
+            created_at=now,
+        )
+        for entry in entries
+        for user_id in user_ids
+        if (entry[target].pk, user_id) not in already_open
+    ])
+    if not items:
+        return []
+
+    counts = Counter(item.assignee_id for item in items)
+    _ensure_counters(counts)
+    _add_open_counts(counts)
+    live.counts_changed(counts)
+    return items
+
+
+def _targets(kind, project=None, nomination=None, stage=None):
+    items = WorkItem.objects.filter(kind=kind)
+    if nomination is not None:
+        items = items.filter(nomination=nomination)
+    elif stage is not None:
+        items = items.filter(stage=stage)
+    else:
+        items = items.filter(project=project)
+    return items
+
+
+@transaction.atomic
+def resolve_items(kind, status, user=None, project=None, nomination=None, stage=None):
+    """
+    Close every open item for a decision. The acting user's item takes
+    ``status`` and counts towards their tallies; everyone else's is closed.
+    """
+    open_qs = _targets(kind, project, nomination, stage).filter(status='open')
+    assignee_ids = list(open_qs.select_for_update().values_list('assignee_id', flat=True))
+    if not assignee_ids:
+        return 0
+
+    now = timezone.now()
+    acting_id = user.pk if user is not None else None
+    if acting_id in assignee_ids and status != 'closed':
+        open_qs.filter(assignee_id=acting_id).update(status=status, resolved_at=now, resolved_by=user)
+        tally = {'approved': 'approved_count', 'rejected': 'rejected_count'}[status]
+        InboxCounter.objects.filter(user_id=acting_id).update(**{tally: F(tally) + 1})
+    open_qs.update(status='closed', resolved_at=now, resolved_by=user)
+
+    InboxCounter.objects.filter(user_id__in=assignee_ids).update(open_count=F('open_count') - 1)
+    live.counts_changed(assignee_ids)
+    return len(assignee_ids)
+
+
+@transaction.atomic
+def resolve_batch(kind, status, user=None, projects=None, nominations=None):
+    """resolve_items() for many projects, or many nominations, at once"""
+    if nominations is not None:
+        open_qs = WorkItem.objects.filter(kind=kind, status='open', nomination__in=nominations)
+    else:
+        open_qs = WorkItem.objects.filter(kind=kind, status='open', project__in=projects)
+    assignee_ids = list(open_qs.select_for_update().values_list('assignee_id', flat=True))
+    if not assignee_ids:
+        return 0
+
+    now = timezone.now()
+    if user is not None and status != 'closed':
+        decided = open_qs.filter(assignee_id=user.pk).update(status=status, resolved_at=now, resolved_by=user)
+        if decided:
+            tally = {'approved': 'approved_count', 'rejected': 'rejected_count'}[status]
+            InboxCounter.objects.filter(user_id=user.pk).update(**{tally: F(tally) + decided})
+    open_qs.update(status='closed', resolved_at=now, resolved_by=user)
+
+    counts = Counter(assignee_ids)
+    _add_open_counts(counts, sign=-1)
+    live.counts_changed(counts)
+    return len(assignee_ids)
+
+
+def inbox(user):
+    """The user's open items, oldest first (one range scan of workitem_inbox_idx)"""
+    return WorkItem.objects.filter(assignee=user, status='open').order_by('created_at')
+
+
+def open_count(user):
+    counter = InboxCounter.objects.filter(user=user).only('open_count').first()
+    return counter.open_count if counter else 0
+
+
+@transaction.atomic
+def rebuild_counters():
+    """Recount open items for every user, e.g. after bulk deletes in the admin"""
+    open_by_user = dict(
+        WorkItem.objects.filter(status='open').values('assignee_id')
+        .annotate(n=Count('id')).values_list('assignee_id', 'n')
+    )
+    _ensure_counters(open_by_user)
+    InboxCounter.objects.exclude(user_id__in=open_by_user).update(open_count=0)
+    for user_id, count in open_by_user.items():
+        InboxCounter.objects.filter(user_id=user_id).update(open_count=count)
+    InboxCounter.objects.update(approved_count=0, rejected_count=0)
+    tallies = WorkItem.objects.filter(Q(status='approved') | Q(status='rejected')).values('resolved_by_id').annotate(
+        approved=Count('id', filter=Q(status='approved')),
+        rejected=Count('id', filter=Q(status='rejected')),
+    )
+    _ensure_counters(row['resolved_by_id'] for row in tallies if row['resolved_by_id'])
+    for row in tallies:
+        if row['resolved_by_id']:
+            InboxCounter.objects.filter(user_id=row['resolved_by_id']).update(
+                approved_count=row['approved'], rejected_count=row['rejected'],
+            )
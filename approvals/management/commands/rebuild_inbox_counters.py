@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from approvals.inbox import rebuild_counters
+
+class Command(BaseCommand):
+    help = 'Recount open approval items and tallies for every user'
+    
+    def handle(self, *args, **kwargs):
+        rebuild_counters()
+        self.stdout.write(self.style.SUCCESS('Inbox counters rebuilt.'))
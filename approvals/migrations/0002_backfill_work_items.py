@@ -0,0 +1,77 @@
+from django.db import migrations
+from django.utils import timezone
+
+APPROVER_OFFICES = ['executive_director', 'general_manager']
+
+
+def backfill(apps, schema_editor):
+    """Queue everything that was already pending before the inbox existed."""
+    User = apps.get_model('accounts', 'User')
+    Project = apps.get_model('projects', 'Project')
+    ProjectNomination = apps.get_model('projects', 'ProjectNomination')
+    ProjectStage = apps.get_model('projects', 'ProjectStage')
+    WorkItem = apps.get_model('approvals', 'WorkItem')
+    InboxCounter = apps.get_model('approvals', 'InboxCounter')
+
+    def active(offices):
+        return list(User.objects.filter(office__in=offices, is_active=True).values_list('pk', flat=True))
+
+    approvers = active(APPROVER_OFFICES)
+    gms = active(['general_manager'])
+    eds = active(['executive_director'])
+    items = []
+
+    for project in Project.objects.filter(status='submitted'):
+        for user_id in approvers:
+            items.append(WorkItem(
+                assignee_id=user_id, kind='project', project=project,
+                title=f"Project Approval - {project.project_id}", summary=project.title,
+                link=f"/projects/{project.project_id}/",
+                created_at=project.submitted_at or project.updated_at,
+            ))
+
+    for nomination in ProjectNomination.objects.filter(status__in=['pending_gm', 'pending_ed']):
+        kind, assignees = ('nomination_gm', gms) if nomination.status == 'pending_gm' else ('nomination_ed', eds)
+        for user_id in assignees:
+            items.append(WorkItem(
+                assignee_id=user_id, kind=kind, project_id=nomination.project_id, nomination=nomination,
+                title=f"Nomination - {nomination.project_id}",
+                link=f"/projects/nominations/approve/{nomination.nomination_id}/",
+                created_at=nomination.gm_approved_at or nomination.created_at,
+            ))
+
+    stages = ProjectStage.objects.exclude(stage_type='nominate_pm')
+    for stage in stages.filter(status='requires_approval'):
+        for user_id in approvers:
+            items.append(WorkItem(
+                assignee_id=user_id, kind='stage', project_id=stage.project_id, stage=stage,
+                title=f"{stage.stage_type} - {stage.project_id}",
+                link=f"/projects/{stage.project_id}/", created_at=stage.updated_at,
+            ))
+    for stage in ProjectStage.objects.filter(forward_to__isnull=False):
+        items.append(WorkItem(
+            assignee_id=stage.forward_to_id, kind='stage_forward', project_id=stage.project_id, stage=stage,
+            title=f"{stage.stage_type} - {stage.project_id}",
+            link=f"/projects/{stage.project_id}/", created_at=stage.updated_at,
+        ))
+
+    WorkItem.objects.bulk_create(items, batch_size=1000)
+
+    open_counts = {}
+    for item in items:
+        open_counts[item.assignee_id] = open_counts.get(item.assignee_id, 0) + 1
+    InboxCounter.objects.bulk_create(
+        [InboxCounter(user_id=user_id, open_count=count) for user_id, count in open_counts.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('approvals', '0001_initial'),
+        ('projects', '0011_stagetransition'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
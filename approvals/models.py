@@ -0,0 +1,66 @@
+# approvals/models.py
+from django.db import models
+from django.conf import settings
+from django.utils import timezone
+import uuid
+
+
+class WorkItem(models.Model):
+    """One pending decision in one approver's inbox"""
+    KIND_CHOICES = [
+        ('project', 'Project Approval'),
+        ('nomination_gm', 'Nomination (GM Approval)'),
+        ('nomination_ed', 'Nomination (ED Approval)'),
+        ('stage', 'Stage Approval'),
+        ('stage_forward', 'Forwarded Stage'),
+    ]
+
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('approved', 'Approved'),
+        ('rejected', 'Rejected'),
+        ('closed', 'Closed'),  # resolved by another approver or withdrawn
+    ]
+
+    item_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    assignee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='work_items')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+
+    # What the decision is about
+    project = models.ForeignKey('projects.Project', on_delete=models.CASCADE, related_name='work_items')
+    nomination = models.ForeignKey('projects.ProjectNomination', on_delete=models.CASCADE, null=True, blank=True,
+                                   related_name='work_items')
+    stage = models.ForeignKey('projects.ProjectStage', on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='work_items')
+
+    # Copied at creation so the inbox renders without joins
+    title = models.CharField(max_length=200)
+    summary = models.TextField(blank=True)
+    link = models.CharField(max_length=500, blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+    resolved_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='resolved_work_items')
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['assignee', 'status', 'created_at'], name='workitem_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.title} ({self.assignee})"
+
+
+class InboxCounter(models.Model):
+    """Per-user inbox tallies, kept in step with WorkItem by approvals.inbox"""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='inbox_counter')
+    open_count = models.IntegerField(default=0)
+    approved_count = models.IntegerField(default=0)
+    rejected_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} - {self.open_count} open"
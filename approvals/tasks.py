@@ -0,0 +1,9 @@
+# approvals/tasks.py
+from datetime import timedelta
+
+from jobs.queue import task
+from .inbox import rebuild_counters
+
+@task(name='approvals.rebuild_inbox_counters', every=timedelta(days=1))
+def rebuild_inbox_counters():
+    rebuild_counters()
@@ -4,6 +4,8 @@ from . import views
 
 urlpatterns = [
     path('', views.approval_list, name='approval_list'),
+    path('batch/approve/', views.approve_selected, name='approve_selected'),
+    path('batch/reject/', views.reject_selected, name='reject_selected'),
     path('<str:approval_type>/<uuid:object_id>/', views.approval_detail, name='approval_detail'),
     path('<str:approval_type>/<uuid:object_id>/approve/', views.approve_item, name='approve_item'),
     path('<str:approval_type>/<uuid:object_id>/reject/', views.reject_item, name='reject_item'),
@@ -1,36 +1,142 @@
 # approvals/views.py
+import uuid
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.utils import timezone
+from django.db import transaction
+from django.views.decorators.http import require_POST
+
+from projects import workflows
+from .models import WorkItem, InboxCounter
+from . import inbox
 
 @login_required
 def approval_list(request):
     """List all pending approvals for the user"""
+    counter = InboxCounter.objects.filter(user=request.user).first()
     context = {
         'page_title': 'Pending Approvals',
-        'pending_approvals': [],
+        'pending_approvals': inbox.inbox(request.user),
+        'counter': counter,
+        'batch_kinds': BATCH_KINDS,
     }
     return render(request, 'approvals/approval_list.html', context)
 
 @login_required
 def approval_detail(request, approval_type, object_id):
-    """View details of a specific approval item"""
-    context = {
-        'page_title': 'Approval Details',
-        'approval_type': approval_type,
-        'object_id': object_id,
-    }
-    return render(request, 'approvals/approval_detail.html', context)
+    """Open the record behind an inbox item"""
+    item = get_object_or_404(WorkItem, item_id=object_id, kind=approval_type, assignee=request.user)
+    return redirect(item.link or 'approval_list')
+
+
+def _decide(item, user, approve, reason=''):
+    """Apply an approve/reject decision to the record behind a work item"""
+    if item.kind == 'project':
+        if approve:
+            workflows.approve_project(item.project, user)
+        else:
+            workflows.reject_project(item.project, user, reason)
+    elif item.kind in ['nomination_gm', 'nomination_ed']:
+        if approve:
+            workflows.approve_nomination(item.nomination, user)
+        else:
+            workflows.reject_nomination(item.nomination, user, reason)
+    elif item.kind == 'stage':
+        if approve:
+            workflows.approve_stage(item.stage, user)
+        else:
+            workflows.reject_stage(item.stage, user, reason)
+    elif item.kind == 'stage_forward':
+        workflows.acknowledge_forward(item.stage, user, accept=approve)
+
+
+def _act(request, approval_type, object_id, approve):
+    item = get_object_or_404(
+        WorkItem.objects.select_related('project', 'nomination', 'stage'),
+        item_id=object_id, kind=approval_type, assignee=request.user,
+    )
+    if item.status != 'open':
+        messages.info(request, 'This item has already been dealt with.')
+        return redirect('approval_list')
+
+    try:
+        _decide(item, request.user, approve, request.POST.get('reason', ''))
+    except workflows.WorkflowError as e:
+        messages.error(request, str(e))
+        return redirect('approval_list')
+
+    if approve:
+        messages.success(request, f'{item.title} approved.')
+    else:
+        messages.warning(request, f'{item.title} rejected.')
+    return redirect('approval_list')
 
 @login_required
+@require_POST
 def approve_item(request, approval_type, object_id):
     """Approve an item"""
-    messages.success(request, f'Item approved successfully!')
-    return redirect('approval_list')
+    return _act(request, approval_type, object_id, approve=True)
 
 @login_required
+@require_POST
 def reject_item(request, approval_type, object_id):
     """Reject an item"""
-    messages.warning(request, f'Item rejected.')
-    return redirect('approval_list')
\ No newline at end of file
+    return _act(request, approval_type, object_id, approve=False)
+
+
+# Kinds the inbox can decide in batches
+BATCH_KINDS = ['project', 'nomination_gm', 'nomination_ed']
+
+
+def _act_on_selected(request, approve):
+    try:
+        selected = {uuid.UUID(value) for value in request.POST.getlist('items')}
+    except ValueError:
+        selected = set()
+    if not selected:
+        messages.info(request, 'Select the items to decide first.')
+        return redirect('approval_list')
+    items = list(WorkItem.objects.filter(
+        item_id__in=selected, kind__in=BATCH_KINDS, assignee=request.user, status='open',
+    ).values_list('kind', 'project_id', 'nomination_id'))
+    if len(items) != len(selected):
+        messages.error(request, 'Some of the selected items have already been dealt with. Nothing was changed.')
+        return redirect('approval_list')
+
+    project_ids = [project_id for kind, project_id, nomination_id in items if kind == 'project']
+    nomination_ids = [nomination_id for kind, project_id, nomination_id in items if kind != 'project']
+    reason = request.POST.get('reason', '')
+    try:
+        with transaction.atomic():
+            if project_ids:
+                if approve:
+                    workflows.approve_projects(project_ids, request.user)
+                else:
+                    workflows.reject_projects(project_ids, request.user, reason)
+            if nomination_ids:
+                if approve:
+                    workflows.approve_nominations(nomination_ids, request.user)
+                else:
+                    workflows.reject_nominations(nomination_ids, request.user, reason)
+    except workflows.WorkflowError as e:
+        messages.error(request, f'{e} Nothing was changed.')
+        return redirect('approval_list')
+
+    if approve:
+        messages.success(request, f'{len(items)} items approved.')
+    else:
+        messages.warning(request, f'{len(items)} items rejected.')
+    return redirect('approval_list')
+
+@login_required
+@require_POST
+def approve_selected(request):
+    """Approve the selected project and nomination items together"""
+    return _act_on_selected(request, approve=True)
+
+@login_required
+@require_POST
+def reject_selected(request):
+    """Reject the selected project and nomination items together"""
+    return _act_on_selected(request, approve=False)
@@ -1,11 +1,29 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from datetime import datetime
+from decimal import Decimal
 import json
 
+from npa_core import singleflight
+
 User = get_user_model()
 
+def _statistics(projects, pending_approvals):
+    totals = projects.aggregate(
+        total_projects=Count('pk'),
+        active_projects=Count('pk', filter=Q(status='in_progress')),
+        # Overdue projects (flagged nightly by projects.overdue)
+        overdue_projects=Count('pk', filter=Q(is_overdue=True)),
+        total_budget=Coalesce(Sum('estimated_budget'), Value(Decimal('0'))),
+        spent_budget=Coalesce(Sum('spent_budget'), Value(Decimal('0'))),
+    )
+    totals['pending_approvals'] = pending_approvals.count() if pending_approvals is not None else 0
+    return totals
+
+
 @login_required
 def dashboard(request):
     user = request.user
@@ -13,54 +31,43 @@ def dashboard(request):
     # Import Project model here to avoid circular imports
     from projects.models import Project
     
-    # Get user-specific projects
+    # Get user-specific projects; scope names the set for the shared cache
     if user.office == 'executive_director':
         projects = Project.objects.all()
+        scope = 'all'
     elif user.office == 'general_manager':
         projects = Project.objects.filter(
             status__in=['submitted', 'under_review', 'approved']
         )
+        scope = 'gm'
     elif user.office in ['assistant_general_manager', 'chief_port_engineer', 'unit_head']:
         projects = Project.objects.filter(
             created_by__department=user.department
         )
+        scope = f'department:{user.department}'
     else:  # Engineers
         projects = Project.objects.filter(
             created_by=user
         )
-    
-    # Statistics
-    total_projects = projects.count()
-    active_projects = projects.filter(status='in_progress').count()
-    
-    # Calculate overdue projects
-    overdue_projects = 0
-    for project in projects.filter(status='in_progress'):
-        if project.approved_end_date and project.approved_end_date < datetime.now().date():
-            overdue_projects += 1
+        scope = f'user:{user.pk}'
     
     # Projects requiring attention
     if user.office in ['executive_director', 'general_manager']:
-        pending_approvals = Project.objects.filter(status='submitted').count()
+        pending_approvals = Project.objects.filter(status='submitted')
+        scope += ':approver'
     else:
-        pending_approvals = 0
-    
-    # Recent projects
-    recent_projects = list(projects.order_by('-created_at')[:5])
+        pending_approvals = None
     
-    # Budget statistics (simplified)
-    total_budget = sum([p.estimated_budget for p in projects])
-    spent_budget = sum([p.spent_budget for p in projects])
+    # Statistics, computed once for everyone with the same scope
+    statistics = singleflight.get_or_compute(
+        f'dashboard:statistics:{scope}', lambda: _statistics(projects, pending_approvals),
+        fresh=60, stale=600,
+    )
     
     context = {
         'user': user,
-        'total_projects': total_projects,
-        'active_projects': active_projects,
-        'overdue_projects': overdue_projects,
-        'pending_approvals': pending_approvals,
+        **statistics,
         'recent_projects': [],
-        'total_budget': total_budget,
-        'spent_budget': spent_budget,
         'page_title': 'Dashboard',
     }
     
@@ -72,22 +79,25 @@ def analytics_view(request):
     if not request.user.office in ['executive_director', 'general_manager', 'assistant_general_manager']:
         return redirect('dashboard')
     
-    # Import Project model here
-    from projects.models import Project
-    
-    # Get all projects for analytics
-    projects = Project.objects.all()
-    
-    # Status distribution
-    status_counts = {}
-    for project in projects:
-        status = project.get_status_display()
-        status_counts[status] = status_counts.get(status, 0) + 1
+    # Status distribution, computed once for all management viewers
+    data = singleflight.get_or_compute('dashboard:analytics', _analytics_data, fresh=300, stale=3600)
     
     context = {
-        'status_counts': json.dumps(status_counts),
-        'total_projects': projects.count(),
+        'status_counts': json.dumps(data['status_counts']),
+        'total_projects': data['total_projects'],
         'page_title': 'Analytics',
     }
     
-    return render(request, 'dashboard/analytics.html', context)
\ No newline at end of file
+    return render(request, 'dashboard/analytics.html', context)
+
+
+def _analytics_data():
+    from projects.models import Project
+    
+    labels = dict(Project.STATUS_CHOICES)
+    counts = Project.objects.order_by('status').values_list('status').annotate(n=Count('pk'))
+    status_counts = {labels.get(status, status): n for status, n in counts}
+    return {
+        'status_counts': status_counts,
+        'total_projects': sum(status_counts.values()),
+    }
@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import Job
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'progress', 'attempts', 'run_at', 'worker', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'key', 'job_id']
+    readonly_fields = ['job_id', 'created_at', 'started_at', 'finished_at', 'last_error', 'result']
+    raw_id_fields = ['created_by']
@@ -0,0 +1,51 @@
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from jobs import queue
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs. Several workers may run at once, on one or more hosts.'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help='Jobs run in parallel threads')
+        parser.add_argument('--interval', type=float, default=2, help='Seconds between polls when idle')
+        parser.add_argument('--once', action='store_true', help='Run what is due now, then exit')
+    
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        queue.ensure_periodic()
+        self.stdout.write(f'Worker {worker} running {len(queue.registry)} task type(s), concurrency {concurrency}.')
+        
+        running = set()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                running = {future for future in running if not future.done()}
+                free = concurrency - len(running)
+                # Drop a connection the database closed (restart, failover) before using it again
+                close_old_connections()
+                try:
+                    jobs = queue.claim(worker, free) if free else []
+                    polled = True
+                except DatabaseError as e:
+                    self.stderr.write(self.style.ERROR(f'Could not claim jobs, retrying: {e}'))
+                    jobs, polled = [], False
+                for job in jobs:
+                    running.add(pool.submit(self.run_job, job))
+                
+                if options['once'] and polled and not jobs and not running:
+                    break
+                if not jobs:
+                    time.sleep(options['interval'] if not running else 0.2)
+    
+    def run_job(self, job):
+        close_old_connections()
+        try:
+            ok = queue.execute(job)
+            self.stdout.write(f"{'Done' if ok else 'Failed'}: {job.name} {job.job_id}")
+        finally:
+            close_old_connections()
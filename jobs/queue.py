@@ -0,0 +1,191 @@
+# jobs/queue.py
+"""
+A small job queue kept in the project database.
+
+Register work with @task in an app's tasks.py, hand it off from a view with
+enqueue(), and run ``manage.py run_jobs`` to execute it. A job row is written
+in the caller's transaction, so a rolled-back request never runs its jobs.
+
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED where the database
+supports it (PostgreSQL). Elsewhere (SQLite) each candidate is claimed with a
+compare-and-set UPDATE, so two workers can never run the same job.
+"""
+import logging
+import threading
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# How long a running job may go without finishing before another worker retries it
+LEASE = timedelta(minutes=30)
+
+
+@dataclass
+class Task:
+    name: str
+    func: object
+    max_attempts: int = 3
+    retry_delay: int = 30  # seconds, doubled on each attempt
+    every: timedelta = None  # periodic tasks are re-queued after each run
+    pass_job_id: bool = False  # call with job_id=... so the task can report progress
+
+
+registry = {}
+
+
+def task(name=None, max_attempts=3, retry_delay=30, every=None, pass_job_id=False):
+    """Register a function as a task; it is called with the job's kwargs"""
+    def register(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        registry[task_name] = Task(task_name, func, max_attempts, retry_delay, every, pass_job_id)
+        func.task_name = task_name
+        return func
+    return register
+
+
+def enqueue(task_name, run_at=None, delay=None, key='', priority=0, user=None, **kwargs):
+    """
+    Queue a task. ``task_name`` is a registered name or an @task function.
+    With a ``key``, an equivalent job already waiting is returned instead of
+    queueing a second one.
+    """
+    name = getattr(task_name, 'task_name', task_name)
+    if name not in registry:
+        raise KeyError(f"Unknown task: {name}")
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta(0))
+
+    job = Job(name=name, kwargs=kwargs, key=key, priority=priority, run_at=run_at,
+              max_attempts=registry[name].max_attempts,
+              created_by=user if user is not None and user.is_authenticated else None)
+    if not key:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        return Job.objects.get(key=key, status__in=['queued', 'running'])
+
+
+def _due():
+    # Queued jobs that are due, and running jobs with attempts left whose worker stopped renewing
+    now = timezone.now()
+    return Job.objects.filter(
+        Q(status='queued') | Q(status='running', attempts__lt=F('max_attempts')), run_at__lte=now,
+    ).order_by('priority', 'run_at')
+
+
+def _fail_abandoned():
+    """
+    Fail running jobs whose lease ran out on their last attempt. Their worker
+    died mid-run (killed, out of memory) without reaching execute()'s error
+    handling, and claiming them again would likely take down another one.
+    """
+    now = timezone.now()
+    abandoned = Job.objects.filter(status='running', run_at__lte=now, attempts__gte=F('max_attempts'))
+    for job in abandoned.only('pk', 'job_id', 'name', 'kwargs', 'run_at', 'started_at', 'attempts'):
+        # Compare-and-set, so only one worker fails it and schedules the next periodic run
+        if Job.objects.filter(pk=job.pk, status='running', run_at=job.run_at).update(
+                status='failed', finished_at=now,
+                last_error=f"Lease expired on attempt {job.attempts}: the worker stopped while running the job."):
+            logger.warning("Job %s (%s) abandoned by its worker on its last attempt", job.job_id, job.name)
+            _schedule_next(registry.get(job.name), job)
+
+
+_claim_lock = threading.Lock()
+
+
+def claim(worker, limit=1):
+    """Take up to ``limit`` due jobs for this worker"""
+    _fail_abandoned()
+    now = timezone.now()
+    claimed_fields = dict(status='running', worker=worker, run_at=now + LEASE,
+                          attempts=F('attempts') + 1, started_at=now)
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(_due().select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claimed_fields)
+        return list(Job.objects.filter(pk__in=ids))
+
+    ids = []
+    with _claim_lock:
+        for job in _due().only('pk', 'status', 'run_at')[:limit * 4]:
+            # Compare-and-set: only one worker sees its UPDATE match the row
+            if Job.objects.filter(pk=job.pk, status=job.status, run_at=job.run_at).update(**claimed_fields):
+                ids.append(job.pk)
+                if len(ids) == limit:
+                    break
+    return list(Job.objects.filter(pk__in=ids))
+
+
+def set_progress(job_id, progress, message=''):
+    """Record progress (0-100) for a running job and renew its lease"""
+    Job.objects.filter(job_id=job_id, status='running').update(
+        progress=max(0, min(100, int(progress))), message=message[:200],
+        run_at=timezone.now() + LEASE,
+    )
+
+
+def execute(job):
+    """Run a claimed job and record the outcome"""
+    entry = registry.get(job.name)
+    try:
+        if entry is None:
+            raise KeyError(f"Unknown task: {job.name}")
+        kwargs = dict(job.kwargs)
+        if entry.pass_job_id:
+            kwargs['job_id'] = str(job.job_id)
+        result = entry.func(**kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) failed on attempt %s", job.job_id, job.name, job.attempts)
+        retry = entry is not None and job.attempts < job.max_attempts
+        Job.objects.filter(pk=job.pk).update(
+            status='queued' if retry else 'failed',
+            run_at=timezone.now() + timedelta(seconds=(entry.retry_delay if entry else 0) * 2 ** (job.attempts - 1)),
+            last_error=error[-5000:],
+            finished_at=None if retry else timezone.now(),
+        )
+        if not retry:
+            _schedule_next(entry, job)
+        return False
+
+    Job.objects.filter(pk=job.pk).update(
+        status='succeeded', progress=100, result=result if _is_json(result) else None,
+        finished_at=timezone.now(), last_error='',
+    )
+    _schedule_next(entry, job)
+    return True
+
+
+def _is_json(value):
+    return value is None or isinstance(value, (dict, list, str, int, float, bool))
+
+
+def _schedule_next(entry, job):
+    if entry is not None and entry.every:
+        enqueue(entry.name, run_at=job.started_at + entry.every, key=f"periodic:{entry.name}", **job.kwargs)
+
+
+def ensure_periodic():
+    """Queue the first run of every periodic task that has none waiting"""
+    for entry in registry.values():
+        if entry.every:
+            enqueue(entry.name, key=f"periodic:{entry.name}")
+
+
+def purge(older_than=timedelta(days=30)):
+    """Delete finished jobs older than the cutoff"""
+    return Job.objects.filter(status__in=['succeeded', 'failed'],
+                              finished_at__lt=timezone.now() - older_than).delete()[0]
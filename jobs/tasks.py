@@ -0,0 +1,9 @@
+# jobs/tasks.py
+from datetime import timedelta
+
+from .queue import task, purge
+
+@task(name='jobs.purge_finished', every=timedelta(days=1))
+def purge_finished():
+    """Drop finished jobs after a month"""
+    return {'deleted': purge()}
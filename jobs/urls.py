@@ -0,0 +1,7 @@
+# jobs/urls.py
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('<uuid:job_id>/', views.job_status, name='job_status'),
+]
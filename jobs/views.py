@@ -0,0 +1,26 @@
+# jobs/views.py
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, Http404
+from django.shortcuts import get_object_or_404
+
+from .models import Job
+
+@login_required
+def job_status(request, job_id):
+    """Progress of a background job, for polling from the page that queued it"""
+    job = get_object_or_404(Job, job_id=job_id)
+    if job.created_by_id != request.user.pk and not request.user.is_staff:
+        raise Http404
+    return JsonResponse({
+        'job_id': str(job.job_id),
+        'name': job.name,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result': job.result,
+        'error': job.last_error.strip().splitlines()[-1] if job.status == 'failed' and job.last_error else '',
+        'attempts': job.attempts,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    })
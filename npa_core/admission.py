@@ -0,0 +1,149 @@
+"""
+Admission control for heavy views.
+
+settings.ADMISSION_VIEWS puts views (by URL name, optionally prefixed with a
+method, e.g. "POST boq_beme") into classes such as pdf, export and analytics;
+settings.ADMISSION_CONTROL gives each class a number of requests it may run
+at once and a bounded queue of requests that may wait for a slot. A request
+that finds the queue full, or waits longer than the class allows, gets 503
+with Retry-After instead of tying up another server thread, so a burst of
+heavy requests cannot starve ordinary page loads.
+
+Limits and counters are per server process.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.shortcuts import render
+
+
+class Gate:
+    """A concurrency limit with a bounded, time-limited wait queue"""
+
+    def __init__(self, name, concurrency, queue=0, wait=5, retry_after=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.wait = wait
+        self.retry_after = retry_after or max(1, int(wait))
+        self._condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        # Counters since the process started
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def enter(self):
+        """Take a slot, waiting if allowed; returns False if the request is turned away"""
+        with self._condition:
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+
+            self.waiting += 1
+            started = time.monotonic()
+            deadline = started + self.wait
+            try:
+                while self.active >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+                waited = time.monotonic() - started
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.active += 1
+            self.admitted += 1
+            return True
+
+    def leave(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            waits = self.admitted + self.timed_out
+            return {
+                'concurrency': self.concurrency,
+                'queue_limit': self.queue,
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'wait_seconds_total': round(self.wait_seconds, 3),
+                'wait_seconds_avg': round(self.wait_seconds / waits, 3) if waits else 0.0,
+                'wait_seconds_max': round(self.max_wait_seconds, 3),
+            }
+
+
+gates = {
+    name: Gate(name, **limits)
+    for name, limits in getattr(settings, 'ADMISSION_CONTROL', {}).items()
+}
+VIEWS = getattr(settings, 'ADMISSION_VIEWS', {})
+
+
+def gate_for(request):
+    match = request.resolver_match
+    if match is None or not match.url_name:
+        return None
+    name = VIEWS.get(f"{request.method} {match.url_name}") or VIEWS.get(match.url_name)
+    return gates.get(name)
+
+
+def stats():
+    return {name: gate.stats() for name, gate in gates.items()}
+
+
+class AdmissionControlMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            gate = getattr(request, '_admission_gate', None)
+            if gate is not None:
+                gate.leave()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        gate = gate_for(request)
+        if gate is None:
+            return None
+        if gate.enter():
+            request._admission_gate = gate
+            return None
+        return busy(request, gate)
+
+
+def busy(request, gate):
+    """503 telling the client when to try again"""
+    message = "The server is busy with other requests of this kind. Please try again shortly."
+    if request.headers.get('Accept', '').startswith('application/json'):
+        response = JsonResponse({'error': message, 'retry_after': gate.retry_after}, status=503)
+    else:
+        response = render(request, 'busy.html', {'message': message, 'retry_after': gate.retry_after}, status=503)
+    response['Retry-After'] = str(gate.retry_after)
+    return response
+
+
+@staff_member_required
+def status_view(request):
+    """Per-class slots, queue depth and wait times for this process"""
+    return JsonResponse(stats())
@@ -2,6 +2,9 @@
 ASGI config for npa_core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve through this (e.g. ``uvicorn npa_core.asgi:application``) with
+LIVE_NOTIFICATIONS=True to enable the live notification stream; its broker
+is in-process, so use one worker process per host.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
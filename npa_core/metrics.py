@@ -0,0 +1,283 @@
+"""
+Prometheus metrics for the application, served at /metrics.
+
+Each process (web workers, the jobs worker, export render processes) keeps
+its counters and histograms in memory and writes them to its own file,
+METRICS_DIR/<pid>.json, at most every FLUSH_INTERVAL seconds and on exit.
+The /metrics view adds up the files of all processes, so numbers survive
+whichever worker happens to answer the scrape. Gauges such as queue depths
+are read at scrape time, and per-process gauges from processes that have
+exited are dropped. Clear METRICS_DIR when restarting the service, as
+Prometheus expects counters to start again from zero.
+
+Access needs the bearer token METRICS_TOKEN (Authorization: Bearer ...) or a
+staff login. METRICS_ALLOWED_IPS also admits scrapers by REMOTE_ADDR, but is
+empty by default and only safe when the application is reached directly:
+behind a reverse proxy on the same host (nginx in front of uvicorn) every
+request arrives from 127.0.0.1, so allowing localhost would open /metrics
+to everyone.
+"""
+import atexit
+import hmac
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+
+METRICS_DIR = getattr(settings, 'METRICS_DIR', settings.BASE_DIR / 'var' / 'metrics')
+TOKEN = getattr(settings, 'METRICS_TOKEN', '')
+ALLOWED_IPS = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+FLUSH_INTERVAL = 5  # seconds
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+RENDER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HELP = {
+    'npa_http_requests_total': ('counter', 'Requests by view, method and status code'),
+    'npa_http_request_duration_seconds': ('histogram', 'Request latency by view'),
+    'npa_db_queries': ('histogram', 'Database queries per request by view'),
+    'npa_pdf_render_seconds': ('histogram', 'PDF render time by document kind'),
+    'npa_cache_requests_total': ('counter', 'Single-flight cache lookups by cache and result'),
+    'npa_admission_requests_total': ('counter', 'Admission decisions by endpoint class'),
+    'npa_admission_wait_seconds_total': ('counter', 'Time spent queueing for admission by endpoint class'),
+    'npa_admission_active': ('gauge', 'Requests running per endpoint class'),
+    'npa_admission_queue_depth': ('gauge', 'Requests waiting for admission per endpoint class'),
+    'npa_jobs': ('gauge', 'Background jobs by status'),
+    'npa_outbox_emails': ('gauge', 'Outbound emails by status'),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_buckets = {}     # name -> bucket bounds
+_last_flush = time.monotonic()
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _buckets.setdefault(name, buckets)
+        row = _histograms.get(key)
+        if row is None:
+            row = _histograms[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+
+@contextmanager
+def timer(name, buckets=LATENCY_BUCKETS, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, buckets, **labels)
+
+
+# Per-process files
+
+def _path(pid):
+    return os.path.join(METRICS_DIR, f"{pid}.json")
+
+
+def _snapshot():
+    from . import admission
+
+    with _lock:
+        state = {
+            'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, labels, _buckets[name], row] for (name, labels), row in _histograms.items()],
+            'gauges': [],
+        }
+    # Admission counters are kept by the gates since the process started
+    for endpoint, stats in admission.stats().items():
+        label = [['class', endpoint]]
+        for result in ('admitted', 'rejected', 'timed_out'):
+            state['counters'].append(['npa_admission_requests_total', label + [['result', result]], stats[result]])
+        state['counters'].append(['npa_admission_wait_seconds_total', label, stats['wait_seconds_total']])
+        state['gauges'].append(['npa_admission_active', label, stats['active']])
+        state['gauges'].append(['npa_admission_queue_depth', label, stats['queue_depth']])
+    return state
+
+
+def flush(force=False):
+    """Write this process's numbers to its file if FLUSH_INTERVAL has passed"""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    temp = _path(f"{os.getpid()}.tmp")
+    with open(temp, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(temp, _path(os.getpid()))
+
+
+@atexit.register
+def _flush_at_exit():
+    # Management commands that recorded nothing leave no file behind
+    if _counters or _histograms:
+        flush(force=True)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Counters, histograms and gauges added up over every process's file"""
+    counters, histograms, gauges, buckets = {}, {}, {}, {}
+    for file_name in os.listdir(METRICS_DIR) if os.path.isdir(METRICS_DIR) else []:
+        pid, ext = os.path.splitext(file_name)
+        if ext != '.json' or not pid.isdigit():
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, file_name)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in state['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, bounds, row in state['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            buckets.setdefault(name, bounds)
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], row)]
+            else:
+                histograms[key] = list(row)
+        if _alive(int(pid)):
+            for name, labels, value in state['gauges']:
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = gauges.get(key, 0) + value
+    return counters, histograms, gauges, buckets
+
+
+def _queue_gauges(gauges):
+    from django.db.models import Count
+    from jobs.models import Job
+    from projects.models import OutboundEmail
+
+    for name, model in (('npa_jobs', Job), ('npa_outbox_emails', OutboundEmail)):
+        counts = dict(model.objects.order_by().values_list('status').annotate(n=Count('pk')))
+        for status, label in model.STATUS_CHOICES:
+            if status in ('succeeded', 'sent'):
+                continue  # grows without bound; finished work is in the logs
+            gauges[(name, (('status', status),))] = counts.get(status, 0)
+
+
+# Exposition
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    flush(force=True)
+    counters, histograms, gauges, buckets = collect()
+    _queue_gauges(gauges)
+
+    series = {}
+    for (name, labels), value in sorted(list(counters.items()) + list(gauges.items())):
+        series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_number(value)}")
+    for (name, labels), row in sorted(histograms.items()):
+        lines = series.setdefault(name, [])
+        # observe() counts a value in every bucket it fits, so counts are already cumulative
+        for bound, count in zip(buckets[name], row):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', _number(float(bound)))])} {count}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {row[-1]}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_number(float(row[-2]))}")
+        lines.append(f"{name}_count{_format_labels(labels)} {row[-1]}")
+
+    output = []
+    for name in sorted(series):
+        kind, description = HELP.get(name, ('untyped', ''))
+        output.append(f"# HELP {name} {description}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(series[name])
+    return '\n'.join(output) + '\n'
+
+
+def _has_token(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return bool(TOKEN) and scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), TOKEN.encode())
+
+
+def metrics_view(request):
+    allowed = _has_token(request) or request.META.get('REMOTE_ADDR') in ALLOWED_IPS or (
+        request.user.is_authenticated and request.user.is_staff)
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware:
+    """Request counts, latency and queries per request, labelled by view"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        status = 500
+        try:
+            with connection.execute_wrapper(count):
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            view = _view_name(request)
+            if view != 'metrics_view':
+                elapsed = time.perf_counter() - started
+                inc('npa_http_requests_total', view=view, method=request.method, status=status)
+                observe('npa_http_request_duration_seconds', elapsed, view=view)
+                observe('npa_db_queries', queries[0], QUERY_BUCKETS, view=view)
+                flush()
+
+
+def _view_name(request):
+    """The view's function or class name, e.g. boq_beme_view or ProjectListView"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    func = getattr(match.func, 'view_class', match.func)
+    return getattr(func, '__name__', func.__class__.__name__)
@@ -0,0 +1,261 @@
+"""
+On-demand profiling of single requests, for staff.
+
+A staff user gets a signed trigger from /ops/profiles/ and adds it to the
+slow page as ``?_profile=<trigger>`` (or sends it in an X-Profile header).
+That request runs under cProfile, or under a sampling profiler that reads
+the request thread's stack every few milliseconds and costs far less, and
+every SQL statement it runs is timed. The result is written to PROFILE_DIR:
+
+    <capture>.prof    cProfile stats, for pstats or snakeviz
+    <capture>.folded  sampled stacks in folded format, for flamegraph.pl or speedscope
+    <capture>.json    request, timings and the SQL list
+
+Only the newest PROFILE_MAX_CAPTURES captures are kept. Triggers are tied to
+the user who created them and expire after PROFILE_TRIGGER_MAX_AGE seconds.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.db import connection
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect, render
+from django.utils import timezone
+
+PROFILE_DIR = getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'var' / 'profiles')
+MAX_CAPTURES = getattr(settings, 'PROFILE_MAX_CAPTURES', 50)
+TRIGGER_MAX_AGE = getattr(settings, 'PROFILE_TRIGGER_MAX_AGE', 3600)
+SAMPLE_INTERVAL = 0.005  # seconds
+MAX_QUERIES = 2000
+MODES = {
+    'cprofile': 'cProfile (every call, slower)',
+    'sample': 'Sampling (stacks every 5 ms, low overhead)',
+}
+SALT = 'npa_core.profiling'
+
+
+def make_trigger(user, mode):
+    return signing.dumps({'user': user.pk, 'mode': mode}, salt=SALT, compress=True)
+
+
+def _requested_mode(request):
+    """The profiling mode a request asks for, if it carries a valid trigger of its user"""
+    trigger = request.GET.get('_profile') or request.headers.get('X-Profile')
+    if not trigger or not request.user.is_authenticated or not request.user.is_staff:
+        return None
+    try:
+        data = signing.loads(trigger, salt=SALT, max_age=TRIGGER_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if data.get('user') != request.user.pk or data.get('mode') not in MODES:
+        return None
+    return data['mode']
+
+
+class Sampler(threading.Thread):
+    """Counts the stacks of one thread every SAMPLE_INTERVAL seconds"""
+
+    def __init__(self, thread_id):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _short_path(path):
+    for marker in ('site-packages' + os.sep, str(settings.BASE_DIR) + os.sep):
+        if marker in path:
+            return path.split(marker, 1)[1]
+    return path
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = _requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                if len(queries) < MAX_QUERIES:
+                    queries.append({'sql': sql, 'ms': round((time.perf_counter() - started) * 1000, 2)})
+
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+        else:
+            profiler = Sampler(threading.get_ident())
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(record):
+            if mode == 'cprofile':
+                response = profiler.runcall(self.get_response, request)
+            else:
+                profiler.start()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.stop()
+        elapsed = time.perf_counter() - started
+
+        capture = _save(request, response, mode, profiler, queries, elapsed)
+        response['X-Profile-Capture'] = capture
+        return response
+
+
+def _save(request, response, mode, profiler, queries, elapsed):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    capture = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+    if mode == 'cprofile':
+        profiler.dump_stats(os.path.join(PROFILE_DIR, f"{capture}.prof"))
+    else:
+        with open(os.path.join(PROFILE_DIR, f"{capture}.folded"), 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in profiler.stacks.most_common())
+
+    match = request.resolver_match
+    meta = {
+        'capture': capture,
+        'mode': mode,
+        'path': request.path,
+        'method': request.method,
+        'view': match.view_name if match else '',
+        'status': response.status_code,
+        'user': request.user.username,
+        'created_at': timezone.now().isoformat(),
+        'seconds': round(elapsed, 4),
+        'sql_ms': round(sum(q['ms'] for q in queries), 2),
+        'queries': queries,
+    }
+    with open(os.path.join(PROFILE_DIR, f"{capture}.json"), 'w') as f:
+        json.dump(meta, f)
+    _prune()
+    return capture
+
+
+def _captures():
+    """Metadata of the stored captures, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    names = sorted((n for n in os.listdir(PROFILE_DIR) if n.endswith('.json')), reverse=True)
+    captures = []
+    for name in names:
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                captures.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return captures
+
+
+def _prune():
+    for meta in _captures()[MAX_CAPTURES:]:
+        for extension in ('prof', 'folded', 'json'):
+            path = os.path.join(PROFILE_DIR, f"{meta['capture']}.{extension}")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _load(capture):
+    for meta in _captures():
+        if meta['capture'] == capture:
+            return meta
+    raise Http404
+
+
+def _summary(meta):
+    """Text summary of the profile for the detail page"""
+    if meta['mode'] == 'cprofile':
+        out = io.StringIO()
+        stats = pstats.Stats(os.path.join(PROFILE_DIR, f"{meta['capture']}.prof"), stream=out)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(40)
+        return out.getvalue()
+
+    # Samples per function at the top of the stack, i.e. where time was spent
+    leaves, total = Counter(), 0
+    with open(os.path.join(PROFILE_DIR, f"{meta['capture']}.folded")) as f:
+        for line in f:
+            stack, count = line.rsplit(' ', 1)
+            leaves[stack.rsplit(';', 1)[-1]] += int(count)
+            total += int(count)
+    lines = [f"{total} samples at {SAMPLE_INTERVAL * 1000:g} ms", '']
+    lines += [f"{count:7d} {count * 100 / total:5.1f}%  {leaf}" for leaf, count in leaves.most_common(40)]
+    return '\n'.join(lines)
+
+
+@staff_member_required
+def profile_list(request):
+    if request.method == 'POST':
+        mode = request.POST.get('mode')
+        if mode in MODES:
+            request.session['profile_trigger'] = make_trigger(request.user, mode)
+            messages.success(request, f"Trigger created. It is valid for {TRIGGER_MAX_AGE // 60} minutes.")
+        return redirect('profile_list')
+
+    context = {
+        'captures': _captures(),
+        'modes': MODES,
+        'trigger': request.session.pop('profile_trigger', None),
+        'max_captures': MAX_CAPTURES,
+        'page_title': 'Request Profiles',
+    }
+    return render(request, 'ops/profile_list.html', context)
+
+
+@staff_member_required
+def profile_detail(request, capture):
+    meta = _load(capture)
+    statements = Counter(q['sql'] for q in meta['queries'])
+    context = {
+        'meta': meta,
+        'summary': _summary(meta),
+        'slowest': sorted(meta['queries'], key=lambda q: q['ms'], reverse=True)[:50],
+        'repeated': [(sql, n) for sql, n in statements.most_common(20) if n > 1],
+        'page_title': f"Profile {capture}",
+    }
+    return render(request, 'ops/profile_detail.html', context)
+
+
+@staff_member_required
+def profile_download(request, capture, extension):
+    meta = _load(capture)
+    if extension not in ('prof', 'folded', 'json'):
+        raise Http404
+    path = os.path.join(PROFILE_DIR, f"{meta['capture']}.{extension}")
+    if not os.path.exists(path):
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     'dashboard.apps.DashboardConfig',
     'approvals.apps.ApprovalsConfig',
     'reports.apps.ReportsConfig',
+    'jobs.apps.JobsConfig',
     
     
 ]
@@ -50,6 +51,7 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 # Middleware
 MIDDLEWARE = [
+    'npa_core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +59,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'npa_core.admission.AdmissionControlMiddleware',
+    'npa_core.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'npa_core.urls'
@@ -101,6 +105,23 @@ if DEBUG:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+    # Covering-index INCLUDE columns only apply on PostgreSQL
+    SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Shared by all worker processes so npa_core.singleflight can coalesce across
+# them; create the table with `manage.py createcachetable` when deploying.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'npa_cache',
+    }
+}
+if DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -157,4 +178,52 @@ if not DEBUG:
     EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
     EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 else:
-    EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file
+    # Set EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend to try the
+    # outbox against a local stand-in, e.g. python -m smtpd -n -c DebuggingServer localhost:1025
+    EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+    EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+    EMAIL_PORT = int(os.getenv('EMAIL_PORT', 1025))
+
+# Mail is only sent by the send_outbox worker, never during a request
+EMAIL_TIMEOUT = 30
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'NPA Engineering <no-reply@nigerianports.gov.ng>')
+SITE_URL = os.getenv('SITE_URL', 'http://localhost:8000')
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_BACKOFF_SECONDS = 60
+OUTBOX_DIGEST_SECONDS = 60
+
+# Live notification stream (Server-Sent Events). Only enable when serving
+# through npa_core.asgi: each open stream would hold a WSGI worker.
+LIVE_NOTIFICATIONS = os.getenv('LIVE_NOTIFICATIONS', 'False') == 'True'
+
+# Admission control for heavy views (npa_core.admission). Per server process:
+# at most `concurrency` requests of a class run at once, up to `queue` more
+# wait for a slot for at most `wait` seconds, and the rest get 503.
+ADMISSION_CONTROL = {
+    'pdf': {'concurrency': 4, 'queue': 8, 'wait': 10},
+    'export': {'concurrency': 2, 'queue': 4, 'wait': 10},
+    'analytics': {'concurrency': 4, 'queue': 8, 'wait': 5},
+}
+ADMISSION_VIEWS = {
+    'certificate_pdf': 'pdf',
+    'beme_pdf': 'pdf',
+    'POST boq_beme': 'pdf',
+    'POST document_export': 'export',
+    'export_download': 'export',
+    'analytics': 'analytics',
+    'stage_bottlenecks': 'analytics',
+    'financial_reports': 'analytics',
+}
+
+# Prometheus metrics (npa_core.metrics): one file per process, added up at /metrics
+METRICS_DIR = os.getenv('METRICS_DIR', str(BASE_DIR / 'var' / 'metrics'))
+# Scrapers send "Authorization: Bearer <METRICS_TOKEN>"; staff users may also look
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Opt-in only: behind a reverse proxy on the same host every request comes from 127.0.0.1
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+# Staff request profiling (npa_core.profiling), managed at /ops/profiles/
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'var' / 'profiles'))
+PROFILE_MAX_CAPTURES = 50
+PROFILE_TRIGGER_MAX_AGE = 3600
@@ -0,0 +1,76 @@
+"""
+Single-flight caching for expensive computations shared by many users.
+
+get_or_compute() keeps a value in the default cache together with the time
+it stops being fresh. When there is no value, the first caller takes a lock
+(cache.add, atomic on every backend) and computes it while concurrent callers
+wait for the result instead of running the same queries. Once the value is
+stale, the caller that takes the lock recomputes it and everyone else is
+served the old value in the meantime.
+
+The lock lives for ``lock_ttl`` seconds, longer than any computation should
+take, and is deleted as soon as the computation ends; it only expires on
+its own when the holder died. How long callers wait for it is ``wait``.
+"""
+import time
+
+from django.core.cache import cache
+
+from . import metrics
+
+POLL_INTERVAL = 0.05
+LOCK_TTL = 300  # seconds
+
+
+def get_or_compute(key, compute, fresh=60, stale=600, wait=10, lock_ttl=LOCK_TTL):
+    """
+    Cached ``compute()`` under ``key``: fresh for ``fresh`` seconds, then
+    served stale for up to ``stale`` more while one caller refreshes it.
+    Callers with nothing to serve wait up to ``wait`` seconds for another
+    caller's result before computing it themselves; ``lock_ttl`` bounds how
+    long a refresh may run before another caller may start one.
+    """
+    name = ':'.join(key.split(':')[:2])
+    entry = cache.get(key)
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            metrics.inc('npa_cache_requests_total', cache=name, result='hit')
+            return value
+        if not _lock(key, lock_ttl):
+            metrics.inc('npa_cache_requests_total', cache=name, result='stale')
+            return value
+        metrics.inc('npa_cache_requests_total', cache=name, result='refresh')
+        return _refresh(key, compute, fresh, stale)
+
+    if _lock(key, lock_ttl):
+        metrics.inc('npa_cache_requests_total', cache=name, result='miss')
+        return _refresh(key, compute, fresh, stale)
+
+    metrics.inc('npa_cache_requests_total', cache=name, result='wait')
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    # The computing caller died or is too slow: don't keep this one waiting
+    return compute()
+
+
+def invalidate(key):
+    cache.delete(key)
+
+
+def _lock(key, timeout):
+    # Expires on its own if the holder dies mid-computation
+    return cache.add(f"{key}:lock", 1, timeout=max(1, int(timeout)))
+
+
+def _refresh(key, compute, fresh, stale):
+    try:
+        value = compute()
+        cache.set(key, (value, time.time() + fresh), timeout=fresh + stale)
+        return value
+    finally:
+        cache.delete(f"{key}:lock")
@@ -4,9 +4,15 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from accounts.views import CustomLoginView
+from npa_core import admission, metrics, profiling
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('ops/admission/', admission.status_view, name='admission_status'),
+    path('metrics', metrics.metrics_view, name='metrics'),
+    path('ops/profiles/', profiling.profile_list, name='profile_list'),
+    path('ops/profiles/<str:capture>/', profiling.profile_detail, name='profile_detail'),
+    path('ops/profiles/<str:capture>.<str:extension>', profiling.profile_download, name='profile_download'),
     
     # Authentication
     path('login/', CustomLoginView.as_view(), name='login'),
@@ -40,6 +46,7 @@ urlpatterns = [
     path('projects/', include('projects.urls')),
     path('approvals/', include('approvals.urls')),
     path('reports/', include('reports.urls')),
+    path('jobs/', include('jobs.urls')),
 ]
 
 if settings.DEBUG:
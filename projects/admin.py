@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Project, Contractor, ProjectStage, ProgressReport, ProjectDocument, TechnicalReview, BOQItem, PaymentCertificate
+from .models import Project, Contractor, ProjectStage, ProgressReport, ProjectDocument, TechnicalReview, BOQItem, PaymentCertificate, StageTransition, CertificateLedger, OutboundEmail, BEMESummary, RateCatalogEntry, BEMEVersion
+from . import artefacts, beme, certificates, rates, versions
 
 @admin.register(Contractor)
 class ContractorAdmin(admin.ModelAdmin):
@@ -13,7 +14,7 @@ class ProjectAdmin(admin.ModelAdmin):
     list_display = ['project_id', 'title', 'project_type', 'status', 'priority', 'created_by', 'contractor']
     list_filter = ['status', 'priority', 'project_type', 'other_location']
     search_fields = ['project_id', 'title', 'description']
-    readonly_fields = ['project_id', 'created_at', 'updated_at']
+    readonly_fields = ['project_id', 'spent_budget', 'created_at', 'updated_at']
     raw_id_fields = ['created_by', 'project_manager', 'supervisor', 'contractor', 'reviewed_by', 'approved_by']
     
     fieldsets = (
@@ -54,6 +55,16 @@ class ProjectStageAdmin(admin.ModelAdmin):
     readonly_fields = ['stage_id', 'created_at', 'updated_at']
     raw_id_fields = ['project', 'assigned_to', 'contractor', 'approved_by']
 
+@admin.register(StageTransition)
+class StageTransitionAdmin(admin.ModelAdmin):
+    list_display = ['stage', 'from_status', 'to_status', 'department', 'location', 'changed_by', 'changed_at']
+    list_filter = ['to_status', 'stage_type', 'department', 'location']
+    search_fields = ['project__project_id']
+    raw_id_fields = ['stage', 'project', 'changed_by']
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(ProgressReport)
 class ProgressReportAdmin(admin.ModelAdmin):
     list_display = ['project', 'report_date', 'period_start', 'period_end', 'percentage_complete']
@@ -63,10 +74,10 @@ class ProgressReportAdmin(admin.ModelAdmin):
 
 @admin.register(ProjectDocument)
 class ProjectDocumentAdmin(admin.ModelAdmin):
-    list_display = ['title', 'project', 'document_type', 'uploaded_by', 'uploaded_at']
-    list_filter = ['document_type', 'uploaded_at']
+    list_display = ['title', 'project', 'document_type', 'uploaded_by', 'uploaded_at', 'is_stale']
+    list_filter = ['document_type', 'is_stale', 'uploaded_at']
     search_fields = ['title', 'project__project_id', 'description']
-    readonly_fields = ['document_id', 'uploaded_at']
+    readonly_fields = ['document_id', 'uploaded_at', 'source_key', 'content_hash', 'is_stale']
 
 @admin.register(TechnicalReview)
 class TechnicalReviewAdmin(admin.ModelAdmin):
@@ -82,10 +93,107 @@ class BOQItemAdmin(admin.ModelAdmin):
     list_filter = ['section', 'unit']
     search_fields = ['description', 'project_stage__project__project_id']
     readonly_fields = ['boq_id']
+    
+    # BOQ items send no signals: do what a BEME save does for their stages
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self._items_changed([obj.project_stage_id])
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self._items_changed([obj.project_stage_id])
+    
+    def delete_queryset(self, request, queryset):
+        stage_ids = set(queryset.values_list('project_stage_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self._items_changed(stage_ids)
+    
+    def _items_changed(self, stage_ids):
+        stages = list(ProjectStage.objects.filter(pk__in=stage_ids))
+        versions.bump_projects(*{stage.project_id for stage in stages})
+        for stage in stages:
+            artefacts.mark_beme_stale(stage)
+            beme.refresh_summary(stage.pk)
+            rates.queue(stage.pk)
+
+@admin.register(BEMESummary)
+class BEMESummaryAdmin(admin.ModelAdmin):
+    list_display = ['project', 'stage', 'item_count', 'section_count', 'subtotal', 'grand_total', 'updated_at']
+    list_select_related = ['project', 'stage']
+    search_fields = ['project__project_id', 'project__title']
+    # Maintained from the BOQ items by projects.beme
+    readonly_fields = ['stage', 'project', 'item_count', 'section_count', 'subtotal', 'contingency', 'vat',
+                       'grand_total', 'updated_at']
+
+@admin.register(BEMEVersion)
+class BEMEVersionAdmin(admin.ModelAdmin):
+    list_display = ['stage', 'number', 'item_count', 'subtotal', 'created_by', 'created_at']
+    list_select_related = ['stage__project', 'created_by']
+    search_fields = ['stage__project__project_id', 'stage__project__title']
+    # Versions are never changed once saved
+    readonly_fields = ['stage', 'number', 'content_hash', 'item_count', 'subtotal', 'created_by', 'created_at']
+    exclude = ['rows']
+
+@admin.register(RateCatalogEntry)
+class RateCatalogEntryAdmin(admin.ModelAdmin):
+    list_display = ['description', 'unit', 'location', 'uses', 'median_rate', 'last_rate', 'last_used_at']
+    list_filter = ['unit', 'location']
+    search_fields = ['description_key']
+    # Maintained from saved BOQs by projects.rates
+    readonly_fields = ['description_key', 'description', 'unit', 'location', 'uses', 'median_rate', 'last_rate',
+                       'min_rate', 'max_rate', 'last_used_at']
 
 @admin.register(PaymentCertificate)
 class PaymentCertificateAdmin(admin.ModelAdmin):
-    list_display = ['certificate_no', 'project', 'certificate_date', 'amount_now_payable']
+    list_display = ['certificate_no', 'project', 'certificate_date', 'estimated_total_cost',
+                    'retention_amount', 'amount_now_payable']
     list_filter = ['certificate_date']
+    list_select_related = ['project']
     search_fields = ['certificate_no', 'project__project_id']
-    readonly_fields = ['certificate_id', 'created_at', 'updated_at']
\ No newline at end of file
+    readonly_fields = ['certificate_id', 'sequence', 'amount_previously_certified', 'created_at', 'updated_at']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_figures()
+    
+    # Route changes through the ledger so carried-forward totals stay right
+    def save_model(self, request, obj, form, change):
+        if change:
+            certificates.revise(obj)
+        else:
+            certificates.issue(obj)
+    
+    def delete_model(self, request, obj):
+        certificates.delete(obj)
+    
+    def delete_queryset(self, request, queryset):
+        for certificate in queryset.order_by('-sequence'):
+            certificates.delete(certificate)
+    
+    @admin.display(description='Estimated total cost', ordering='estimated_total_cost')
+    def estimated_total_cost(self, obj):
+        return obj.estimated_total_cost
+    
+    @admin.display(description='Retention', ordering='retention_amount')
+    def retention_amount(self, obj):
+        return obj.retention_amount
+    
+    @admin.display(description='Amount now payable', ordering='amount_now_payable')
+    def amount_now_payable(self, obj):
+        return obj.amount_now_payable
+
+@admin.register(CertificateLedger)
+class CertificateLedgerAdmin(admin.ModelAdmin):
+    list_display = ['project', 'last_sequence', 'certified_to_date', 'updated_at']
+    search_fields = ['project__project_id']
+    readonly_fields = ['project', 'last_sequence', 'certified_to_date', 'updated_at']
+    
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'to_address', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['to_address', 'subject']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+    raw_id_fields = ['user']
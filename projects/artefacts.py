@@ -0,0 +1,192 @@
+# projects/artefacts.py
+"""
+Stored PDFs of finalized payment certificates and BEMEs.
+
+Finalizing renders the certificate or BEME once and keeps the PDF as a
+ProjectDocument whose source_key names what it was rendered from. A stored
+file is never rewritten: a re-render with different content is saved under a
+new name and the document points at it, so downloads can be served with a
+year-long immutable cache from a URL that carries the content hash.
+
+Saving the source data marks its artefacts stale and queues a re-render on
+the jobs worker; BOQ items are written in bulk without signals, so their
+writers call mark_beme_stale() once per save. While an artefact is stale the print pages render live.
+"""
+import hashlib
+import io
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.core.files.base import ContentFile
+from django.db.models.signals import post_delete, post_save
+from django.urls import reverse
+
+from jobs.queue import enqueue
+from npa_core import metrics
+from .models import Contractor, Project, ProjectStage, PaymentCertificate, ProjectDocument
+from . import certificate_pdf, pdf_utils, versions
+
+# Give a burst of edits time to finish before re-rendering
+RERENDER_DELAY = timedelta(seconds=10)
+
+
+def certificate_key(certificate):
+    return f"certificate:{certificate.certificate_id}"
+
+
+def beme_key(stage):
+    return f"beme:{stage.stage_id}"
+
+
+def _render_certificate(certificate_id, document):
+    certificate = PaymentCertificate.objects.select_related('project__contractor').get(certificate_id=certificate_id)
+    return certificate_pdf.render([certificate], io.BytesIO()).getvalue()
+
+
+def _render_beme(stage_id, document):
+    stage = ProjectStage.objects.select_related('project', 'assigned_to', 'forward_to', 'approved_by').get(stage_id=stage_id)
+    items = stage.boq_items.all().order_by('order', 'item_number')
+    # Dated and signed by whoever finalized it, otherwise by the stage
+    dated = document.uploaded_at if document else stage.updated_at
+    preparer = document.uploaded_by if document else stage.assigned_to
+    form_data = {
+        'boq_number': f"BEME/{stage.project.project_id}/{dated.year}",
+        'boq_date': dated.strftime('%d-%m-%Y'),
+        'prepared_by': (preparer.get_full_name() or preparer.username) if preparer else '',
+        'reviewed_by': stage.forward_to.get_full_name() if stage.forward_to else '',
+        'approved_by': stage.approved_by.get_full_name() if stage.approved_by else '',
+    }
+    return pdf_utils.generate_boq_pdf(stage.project, stage, items, form_data, output=io.BytesIO()).getvalue()
+
+
+# source_key prefix -> (document_type, renderer)
+RENDERERS = {
+    'certificate': ('payment_cert', _render_certificate),
+    'beme': ('boq', _render_beme),
+}
+
+
+def render(source_key, document=None):
+    """PDF bytes for a source; ``document`` is its stored artefact, if there is one"""
+    kind, source_id = source_key.split(':', 1)
+    with metrics.timer('npa_pdf_render_seconds', metrics.RENDER_BUCKETS, kind=kind):
+        content = RENDERERS[kind][1](source_id, document)
+    metrics.flush()
+    return content
+
+
+def _store(document, content):
+    """Point the document at ``content``, saving it as a new file if it changed"""
+    content_hash = hashlib.sha256(content).hexdigest()
+    if content_hash == document.content_hash:
+        return False
+    old_file = document.file.name
+    kind = document.source_key.split(':', 1)[0]
+    document.file.save(f"{kind}-{content_hash[:16]}.pdf", ContentFile(content), save=False)
+    document.content_hash = content_hash
+    ProjectDocument.objects.filter(pk=document.pk).update(file=document.file.name, content_hash=content_hash)
+    versions.bump_projects(document.project_id)
+    if old_file:
+        storage = document.file.storage
+        transaction.on_commit(lambda: storage.delete(old_file))
+    return True
+
+
+def finalize(project, source_key, title, user):
+    """Render a certificate or BEME and keep the PDF; returns its document"""
+    document_type = RENDERERS[source_key.split(':', 1)[0]][0]
+    document = ProjectDocument.objects.filter(source_key=source_key).first()
+    if document is None:
+        try:
+            with transaction.atomic():
+                document = ProjectDocument.objects.create(
+                    project=project, document_type=document_type, title=title,
+                    source_key=source_key, uploaded_by=user,
+                )
+        except IntegrityError:  # finalized concurrently
+            document = ProjectDocument.objects.get(source_key=source_key)
+    ProjectDocument.objects.filter(pk=document.pk).update(is_stale=False)
+    _store(document, render(source_key, document))
+    return document
+
+
+def rerender(source_key):
+    """Bring a stale artefact up to date (run by the jobs worker)"""
+    document = ProjectDocument.objects.select_related('uploaded_by').filter(source_key=source_key).first()
+    if document is None or not document.is_stale:
+        return {'changed': False}
+    # Clear first: an edit made while rendering marks it stale again
+    ProjectDocument.objects.filter(pk=document.pk).update(is_stale=False)
+    return {'changed': _store(document, render(source_key, document))}
+
+
+def _queue(source_key):
+    enqueue('projects.render_artefact', key=f"artefact:{source_key}", delay=RERENDER_DELAY, source_key=source_key)
+
+
+def mark_stale(documents):
+    """Flag these artefacts as out of date and queue their re-render"""
+    documents = documents.exclude(source_key='')
+    keys = list(documents.filter(is_stale=False).values_list('source_key', flat=True))
+    if keys:
+        ProjectDocument.objects.filter(source_key__in=keys).update(is_stale=True)
+        for source_key in keys:
+            _queue(source_key)
+    return len(keys)
+
+
+def current(source_key):
+    """The up-to-date artefact for a source, or None if there is none yet"""
+    document = ProjectDocument.objects.filter(source_key=source_key).only('document_id', 'content_hash', 'is_stale').first()
+    if document is None or not document.content_hash:
+        return None
+    if document.is_stale:
+        _queue(source_key)  # in case its re-render was missed
+        return None
+    return document
+
+
+def download_url(document):
+    return reverse('artefact_download', kwargs={'document_id': document.document_id,
+                                                'content_hash': document.content_hash})
+
+
+# What each artefact is rendered from
+
+def _certificate_saved(sender, instance, **kwargs):
+    mark_stale(ProjectDocument.objects.filter(source_key=certificate_key(instance)))
+
+
+def _certificate_deleted(sender, instance, **kwargs):
+    for document in ProjectDocument.objects.filter(source_key=certificate_key(instance)):
+        storage, name = document.file.storage, document.file.name
+        document.delete()
+        if name:
+            transaction.on_commit(lambda storage=storage, name=name: storage.delete(name))
+
+
+def _project_saved(sender, instance, **kwargs):
+    mark_stale(ProjectDocument.objects.filter(project=instance))
+
+
+def _contractor_saved(sender, instance, **kwargs):
+    mark_stale(ProjectDocument.objects.filter(project__contractor=instance, source_key__startswith='certificate:'))
+
+
+def _stage_saved(sender, instance, **kwargs):
+    if instance.stage_type == 'prepare_boq':
+        mark_stale(ProjectDocument.objects.filter(source_key=beme_key(instance)))
+
+
+def mark_beme_stale(stage):
+    """Call in the transaction that rewrote a stage's BOQ items"""
+    return mark_stale(ProjectDocument.objects.filter(source_key=beme_key(stage)))
+
+
+def connect():
+    """Hook staleness up to model signals; called from ProjectsConfig.ready()"""
+    post_save.connect(_certificate_saved, sender=PaymentCertificate, dispatch_uid='artefact-certificate-save')
+    post_delete.connect(_certificate_deleted, sender=PaymentCertificate, dispatch_uid='artefact-certificate-delete')
+    post_save.connect(_project_saved, sender=Project, dispatch_uid='artefact-project-save')
+    post_save.connect(_contractor_saved, sender=Contractor, dispatch_uid='artefact-contractor-save')
+    post_save.connect(_stage_saved, sender=ProjectStage, dispatch_uid='artefact-stage-save')
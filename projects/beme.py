@@ -0,0 +1,84 @@
+# projects/beme.py
+"""
+BEME section subtotals and the stored BEMESummary of each BOQ stage.
+
+section_totals() gets every section's subtotal, item count and position in
+one GROUP BY; on PostgreSQL the same statement adds the BEME subtotal with
+ROLLUP. BEMESummary keeps subtotal, contingency, VAT and grand total per
+stage, so listings and reports read one row per stage. BOQ items are
+written in bulk and send no signals: whatever rewrites a stage's items
+calls refresh_summary() in the same transaction (and queues the stage for
+the rate catalog, projects.rates, when the prices are new).
+"""
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Count, Min, Sum
+
+from .models import BEMESummary, BOQItem, ProjectStage
+from .money import to_decimal
+
+CONTINGENCY_RATE = Decimal('0.05')
+VAT_RATE = Decimal('0.075')
+
+
+def section_totals(stage_id):
+    """
+    ([(section, subtotal, item count)] in BEME order, BEME subtotal) for a
+    stage, where BEME order is that of each section's first item.
+    """
+    if connection.vendor == 'postgresql':
+        return _section_totals_rollup(stage_id)
+    rows = (BOQItem.objects.filter(project_stage_id=stage_id).order_by()
+            .values('section').annotate(total=Sum('amount'), items=Count('pk'), first=Min('order'))
+            .order_by('first', 'section'))
+    sections = [(row['section'], row['total'], row['items']) for row in rows]
+    return sections, sum((total for _, total, _ in sections), Decimal('0'))
+
+
+def _section_totals_rollup(stage_id):
+    table = BOQItem._meta.db_table
+    with connection.cursor() as cursor:
+        # GROUPING(section) is 1 on the rollup row, which carries the BEME subtotal
+        cursor.execute(f'''
+            SELECT section, SUM(amount), COUNT(*), MIN("order"), GROUPING(section)
+            FROM {table} WHERE project_stage_id = %s
+            GROUP BY ROLLUP(section)
+            ORDER BY GROUPING(section), MIN("order"), section
+        ''', [stage_id])
+        rows = cursor.fetchall()
+    sections = [(section, total, items) for section, total, items, first, rollup in rows if not rollup]
+    subtotal = next((total for section, total, items, first, rollup in rows if rollup), None)
+    return sections, subtotal or Decimal('0')
+
+
+def figures(subtotal):
+    """Contingency, VAT and grand total on a BEME subtotal, as the BEME prints them"""
+    contingency = subtotal * CONTINGENCY_RATE
+    vat = subtotal * VAT_RATE
+    return {
+        'subtotal': subtotal,
+        'contingency': contingency,
+        'vat': vat,
+        'grand_total': subtotal + contingency + vat,
+    }
+
+
+def refresh_summary(stage_id):
+    """Recompute a stage's BEMESummary from its items"""
+    project_id = ProjectStage.objects.filter(pk=stage_id).values_list('project_id', flat=True).first()
+    if project_id is None:  # the stage itself was deleted
+        return None
+    sections, subtotal = section_totals(stage_id)
+    values = {name: to_decimal(value) for name, value in figures(subtotal).items()}
+    summary, created = BEMESummary.objects.update_or_create(
+        stage_id=stage_id,
+        defaults={
+            'project_id': project_id,
+            'item_count': sum(items for _, _, items in sections),
+            'section_count': len(sections),
+            **values,
+        },
+    )
+    return summary
+
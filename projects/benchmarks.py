@@ -0,0 +1,166 @@
+# projects/benchmarks.py
+"""
+Microbenchmarks for the computations that run on every certificate and BEME
+render, for ``manage.py benchmark``.
+
+Every case works on unsaved model instances built in memory, so timings do
+not depend on the database. Each case is a function taking the size (number
+of BOQ items, or of numbers to convert) and returning the callable to time.
+"""
+import io
+import random
+import statistics
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import BOQItem, PaymentCertificate, Project, ProjectStage, User
+from . import beme, money, pdf_utils
+
+SECTIONS = ['Preliminaries', 'Substructure', 'Superstructure', 'Finishes', 'External Works', 'Services']
+UNITS = [unit for unit, label in BOQItem.UNIT_CHOICES]
+
+
+def _project():
+    return Project(project_id='NPA-BENCH-0001', title='Rehabilitation of Quay Apron and Drainage',
+                   location='Apapa', contract_sum=Decimal('1250000000.00'))
+
+
+def _boq_items(count):
+    rng = random.Random(count)
+    stage = ProjectStage(project=_project(), stage_type='prepare_boq')
+    items = []
+    for i in range(count):
+        quantity = Decimal(rng.randint(1, 5000)) / 4
+        rate = Decimal(rng.randint(100, 50_000_000)) / 100
+        items.append(BOQItem(
+            project_stage=stage, section=SECTIONS[i * len(SECTIONS) // count],
+            item_number=str(i + 1), description=f"Supply and install item {i + 1} complete as specified",
+            quantity=quantity, unit=UNITS[i % len(UNITS)], rate=rate, amount=quantity * rate, order=i,
+        ))
+    return items
+
+
+def _amounts(count):
+    rng = random.Random(count)
+    return [Decimal(rng.randint(0, 99_999_999_999)) / 100 for _ in range(count)]
+
+
+# Cases: name -> (sizes, setup(size) -> callable)
+
+def amount_in_words(size):
+    amounts = _amounts(size)
+
+    def convert():
+        money._words.cache_clear()  # time the conversion, not the cache
+        return [money.amount_in_words(amount) for amount in amounts]
+    return convert
+
+
+def format_amounts(size):
+    amounts = _amounts(size)
+
+    def format_column():
+        money._figures.cache_clear()
+        return money.format_amounts(amounts)
+    return format_column
+
+
+def certificate_figures(size):
+    project = _project()
+    certificates = [
+        PaymentCertificate(project=project, certificate_no=f"IPC-{i}", certificate_date=date(2026, 1, 1),
+                           work_completed_to_date=amount, cost_of_escalation=amount / 20,
+                           materials_on_site=amount / 10, fluctuation_claims=amount / 50,
+                           refund_advance_payment=amount / 15, amount_previously_certified=amount / 2,
+                           retention_rate=Decimal('5.00'))
+        for i, amount in enumerate(_amounts(size))
+    ]
+    return lambda: [(c.estimated_total_cost, c.amount_now_payable) for c in certificates]
+
+
+def beme_figures(size):
+    subtotals = [sum((item.amount for item in _boq_items(10)), Decimal('0')) for _ in range(size)]
+    return lambda: [beme.figures(subtotal) for subtotal in subtotals]
+
+
+def boq_pdf(size):
+    project, items = _project(), _boq_items(size)
+    stage = items[0].project_stage
+    form_data = {'boq_number': f"BEME/{project.project_id}/2026", 'boq_date': '01-01-2026',
+                 'prepared_by': 'Benchmark'}
+    return lambda: pdf_utils.generate_boq_pdf(project, stage, items, form_data, output=io.BytesIO())
+
+
+def beme_template(size):
+    items = _boq_items(size)
+    project = items[0].project_stage.project
+    sections = {}
+    for item in items:
+        sections.setdefault(item.section, []).append(item)
+    section_totals = {section: sum(item.amount for item in rows) for section, rows in sections.items()}
+    totals = {'sections': sections, 'section_totals': section_totals,
+              **beme.figures(sum(section_totals.values()))}
+    context = {
+        'project': project,
+        'stage': items[0].project_stage,
+        **totals,
+        'grand_total_words': money.amount_in_words(totals['grand_total']),
+        'prepared_by': User(username='bench', first_name='Bench', last_name='Mark'),
+        'beme_number': f"BEME/{project.project_id}/2026/001",
+        'generated_date': timezone.now(),
+    }
+    return lambda: render_to_string('stages/beme_pdf_print.html', context)
+
+
+CASES = {
+    'money.amount_in_words': ([100], amount_in_words),
+    'money.format_amounts': ([100], format_amounts),
+    'certificate.figures': ([100], certificate_figures),
+    'beme.figures': ([100], beme_figures),
+    'beme.template': ([10, 100, 1000], beme_template),
+    'boq.pdf': ([10, 100, 500], boq_pdf),
+}
+
+
+def measure(func, rounds=5, min_time=0.2):
+    """
+    Seconds per call: calls are batched until a batch takes ``min_time``,
+    then ``rounds`` batches are timed, as timeit's autorange does.
+    """
+    func()  # warm up caches (styles, templates, fonts)
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - started >= min_time or loops >= 1_000_000:
+            break
+        loops *= 2
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - started) / loops)
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'rounds': rounds,
+        'loops': loops,
+    }
+
+
+def run(pattern='', rounds=5, min_time=0.2):
+    """Yield (benchmark name, stats) for the cases whose name contains ``pattern``"""
+    for name, (sizes, setup) in CASES.items():
+        for size in sizes:
+            full_name = f"{name}[{size}]"
+            if pattern in full_name:
+                yield full_name, measure(setup(size), rounds, min_time)
@@ -0,0 +1,255 @@
+# projects/certificate_pdf.py
+"""
+Native reportlab renderer for interim payment certificates.
+
+Everything that is the same on every certificate - letterhead, watermark,
+table rules and row labels - is drawn once per document into a form XObject
+and stamped onto each page, so each certificate only costs its own figures.
+The decoded NPA logo and the layout are set up once per process; the fonts
+are the PDF built-ins, so nothing has to be registered or embedded.
+"""
+import io
+from functools import lru_cache
+
+from django.conf import settings
+from PIL import Image
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+from .money import amount_in_words, format_amount
+
+LOGO = settings.BASE_DIR / 'static' / 'images' / 'npa3.png'
+NPA_BLUE = colors.HexColor('#003087')
+TOTAL_FILL = colors.HexColor('#e8f5e8')
+GRAND_FILL = colors.HexColor('#d4edda')
+SECTION_FILL = colors.HexColor('#f0f0f0')
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+LEFT = 42
+RIGHT = PAGE_WIDTH - 42
+WIDTH = RIGHT - LEFT
+FORM_NAME = 'certificate-page'
+
+# Certificate and project details: (label, x of label, x of value, width of value)
+INFO_TOP = 728
+INFO_ROW = 18
+INFO_COLUMNS = [(LEFT, LEFT + 85, 170), (LEFT + 280, LEFT + 370, WIDTH - 375)]
+
+CONTRACT_TOP = 640
+CONTRACT_ROW = 16
+CONTRACT_LABELS = ["Contractor:", "Address:", "Contact:", "Contract Award Ref:",
+                   "Contract Award Date:", "Contract Sum:"]
+
+# Calculation table: (label, figure, row style)
+CALCULATION_TOP = 522
+CALCULATION_HEADER = 20
+CALCULATION_ROW = 18
+AMOUNT_X = RIGHT - 8
+CALCULATION_ROWS = [
+    ("CONTRACT SUM", 'contract_sum', ''),
+    ("LESS CONTINGENCIES", 'contingencies', ''),
+    ("SCHEDULE OF WORKS", None, 'section'),
+    ("LESS ESTIMATED OMISSION", 'estimated_omission', ''),
+    ("ADD ESTIMATED ADDITION", 'estimated_addition', ''),
+    ("ESTIMATED TOTAL COST OF WORKS", 'estimated_total_cost', 'total'),
+    ("1. WORK COMPLETED TO DATE", 'work_completed_to_date', ''),
+    ("2. ADD COST OF ESCALATION", 'cost_of_escalation', ''),
+    ("3. MATERIALS ON SITE", 'materials_on_site', ''),
+    ("4. TOTAL VALUE OF WORKS AND MATERIALS ON SITE", 'total_value_works', ''),
+    ("5. LESS RETENTION", 'retention_amount', ''),
+    ("6. FLUCTUATION AND OTHER CLAIMS", 'fluctuation_claims', ''),
+    ("7. TOTAL NET PAYMENT IN RESPECT OF WORKS", 'total_net_payment', 'total'),
+    ("8. LESS REFUND OF ADVANCE PAYMENT", 'refund_advance_payment', ''),
+    ("9. TOTAL NET AMOUNT PAYABLE TO DATE", 'total_net_amount_payable', 'total'),
+    ("10. LESS AMOUNT PREVIOUSLY CERTIFIED", 'amount_previously_certified', ''),
+    ("11. AMOUNT NOW PAYABLE", 'amount_now_payable', 'grand'),
+]
+RETENTION_ROW = 10
+WORDS_TOP = CALCULATION_TOP - CALCULATION_HEADER - CALCULATION_ROW * len(CALCULATION_ROWS) - 24
+
+
+@lru_cache(maxsize=None)
+def _logo():
+    """
+    The NPA logo, prepared once per process: flattened onto white and saved
+    as a JPEG, which reportlab embeds without decoding or recompressing it.
+    """
+    if not LOGO.exists():
+        return None
+    with Image.open(LOGO) as logo:
+        logo = logo.convert('RGBA')
+        flat = Image.new('RGB', logo.size, 'white')
+        flat.paste(logo, mask=logo.getchannel('A'))
+    jpeg = io.BytesIO()
+    flat.save(jpeg, 'JPEG', quality=85)
+    return ImageReader(jpeg)
+
+
+@lru_cache(maxsize=None)
+def _row_baselines():
+    """Text baseline of each calculation row"""
+    top = CALCULATION_TOP - CALCULATION_HEADER
+    return [top - CALCULATION_ROW * (i + 1) + 6 for i in range(len(CALCULATION_ROWS))]
+
+
+def _fit(text, font, size, width):
+    """Cut text to fit within width"""
+    text = str(text)
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + '...', font, size) > width:
+        text = text[:-1]
+    return text + '...'
+
+
+def _draw_template(c):
+    """Draw the parts shared by every certificate into the page form"""
+    c.beginForm(FORM_NAME)
+    logo = _logo()
+
+    # Watermark
+    if logo:
+        c.saveState()
+        c.setFillAlpha(0.08)
+        c.translate(PAGE_WIDTH / 2, PAGE_HEIGHT / 2)
+        c.rotate(45)
+        c.drawImage(logo, -150, -158, 300, 316)
+        c.restoreState()
+
+    # Letterhead
+    if logo:
+        c.drawImage(logo, LEFT, 762, 48, 50)
+    c.setFillColor(NPA_BLUE)
+    c.setFont('Helvetica-Bold', 16)
+    c.drawCentredString(PAGE_WIDTH / 2, 792, "NIGERIAN PORTS AUTHORITY")
+    c.setFont('Helvetica', 12)
+    c.drawCentredString(PAGE_WIDTH / 2, 775, "ENGINEERING DIVISION")
+    c.setStrokeColor(NPA_BLUE)
+    c.setLineWidth(2)
+    c.line(LEFT, 758, RIGHT, 758)
+    c.setFont('Helvetica-Bold', 14)
+    c.drawCentredString(PAGE_WIDTH / 2, 738, "PAYMENT CERTIFICATE")
+
+    # Certificate and project details
+    c.setFillColor(colors.black)
+    c.setStrokeColor(colors.grey)
+    c.setLineWidth(0.5)
+    c.rect(LEFT, INFO_TOP - INFO_ROW * 4, WIDTH, INFO_ROW * 4)
+    for row in (1, 2):
+        c.line(LEFT, INFO_TOP - INFO_ROW * row, RIGHT, INFO_TOP - INFO_ROW * row)
+    c.setFont('Helvetica-Bold', 9)
+    for row, labels in enumerate([("Certificate No:", "Date:"), ("Project ID:", "Project Type:")]):
+        for (label_x, value_x, width), label in zip(INFO_COLUMNS, labels):
+            c.drawString(label_x + 4, INFO_TOP - INFO_ROW * row - 12, label)
+    c.drawString(LEFT + 4, INFO_TOP - INFO_ROW * 2 - 12, "Project Title:")
+
+    # Contract information
+    box_bottom = CONTRACT_TOP - CONTRACT_ROW * (len(CONTRACT_LABELS) + 1) - 4
+    c.setFillColor(SECTION_FILL)
+    c.rect(LEFT, CONTRACT_TOP - CONTRACT_ROW, WIDTH, CONTRACT_ROW, stroke=0, fill=1)
+    c.setFillColor(colors.black)
+    c.rect(LEFT, box_bottom, WIDTH, CONTRACT_TOP - box_bottom)
+    c.setFont('Helvetica-Bold', 10)
+    c.drawString(LEFT + 4, CONTRACT_TOP - 12, "CONTRACT INFORMATION")
+    c.setFont('Helvetica-Bold', 9)
+    for row, label in enumerate(CONTRACT_LABELS, 1):
+        c.drawString(LEFT + 4, CONTRACT_TOP - CONTRACT_ROW * row - 12, label)
+
+    # Calculation table
+    header_bottom = CALCULATION_TOP - CALCULATION_HEADER
+    table_bottom = header_bottom - CALCULATION_ROW * len(CALCULATION_ROWS)
+    c.setFillColor(NPA_BLUE)
+    c.rect(LEFT, header_bottom, WIDTH, CALCULATION_HEADER, stroke=0, fill=1)
+    c.setFillColor(colors.white)
+    c.setFont('Helvetica-Bold', 10)
+    c.drawCentredString(PAGE_WIDTH / 2, header_bottom + 6, "PAYMENT CERTIFICATE CALCULATION")
+    for (label, figure, style), baseline in zip(CALCULATION_ROWS, _row_baselines()):
+        row_bottom = baseline - 6
+        fill = {'section': colors.lightgrey, 'total': TOTAL_FILL, 'grand': GRAND_FILL}.get(style)
+        if fill:
+            c.setFillColor(fill)
+            c.rect(LEFT, row_bottom, WIDTH, CALCULATION_ROW, stroke=0, fill=1)
+        c.setFillColor(colors.black)
+        c.setFont('Helvetica-Bold' if style else 'Helvetica', 9)
+        c.drawString(LEFT + 6, baseline, label)
+        c.line(LEFT, row_bottom, RIGHT, row_bottom)
+    c.rect(LEFT, table_bottom, WIDTH, CALCULATION_TOP - table_bottom)
+    c.line(RIGHT - 140, table_bottom, RIGHT - 140, header_bottom)
+
+    # Amount in words and footer
+    c.setStrokeColor(NPA_BLUE)
+    c.setLineWidth(2)
+    c.line(LEFT, WORDS_TOP + 14, RIGHT, WORDS_TOP + 14)
+    c.setFont('Helvetica-Bold', 9)
+    c.drawString(LEFT, WORDS_TOP, "Amount in Words:")
+    c.setStrokeColor(colors.grey)
+    c.setLineWidth(0.5)
+    c.line(LEFT, 60, RIGHT, 60)
+    c.setFont('Helvetica-Oblique', 8)
+    c.drawCentredString(PAGE_WIDTH / 2, 36, "This is a computer-generated document. No signature is required.")
+    c.endForm()
+
+
+def _draw_certificate(c, certificate):
+    """Draw one certificate's own details and figures over the page form"""
+    project = certificate.project
+    contractor = project.contractor
+    c.setFillColor(colors.black)
+
+    c.setFont('Helvetica', 9)
+    values = [
+        (certificate.certificate_no, certificate.certificate_date.strftime('%d/%m/%Y')),
+        (project.project_id, project.get_project_type_display()),
+    ]
+    for row, row_values in enumerate(values):
+        for (label_x, value_x, width), value in zip(INFO_COLUMNS, row_values):
+            c.drawString(value_x, INFO_TOP - INFO_ROW * row - 12, _fit(value, 'Helvetica', 9, width))
+    c.setFont('Helvetica-Bold', 9)
+    for line, text in enumerate(simpleSplit(project.title, 'Helvetica-Bold', 9, WIDTH - 95)[:2]):
+        c.drawString(LEFT + 85, INFO_TOP - INFO_ROW * 2 - 12 - 12 * line, text)
+
+    value_x, value_width = LEFT + 110, WIDTH - 114
+    contract_values = [
+        f"MESSRS {contractor.name}" if contractor else "—",
+        ' '.join(contractor.address.split()) if contractor else "—",
+        f"{contractor.phone} | {contractor.email}" if contractor else "—",
+        project.contract_award_ref or "—",
+        project.contract_award_date.strftime('%d/%m/%Y') if project.contract_award_date else "—",
+        format_amount(project.contract_sum),
+    ]
+    for row, value in enumerate(contract_values, 1):
+        c.setFont('Helvetica-Bold' if row == len(contract_values) else 'Helvetica', 9)
+        c.drawString(value_x, CONTRACT_TOP - CONTRACT_ROW * row - 12, _fit(value, 'Helvetica', 9, value_width))
+
+    for row, ((label, figure, style), baseline) in enumerate(zip(CALCULATION_ROWS, _row_baselines())):
+        if figure is None:
+            continue
+        c.setFont('Helvetica-Bold' if style else 'Helvetica', 9)
+        if row == RETENTION_ROW:
+            c.drawString(LEFT + 6 + stringWidth(label + ' ', 'Helvetica', 9), baseline, f"({certificate.retention_rate}%)")
+        c.drawRightString(AMOUNT_X, baseline, format_amount(getattr(certificate, figure)))
+
+    c.setFont('Helvetica-Oblique', 9)
+    words = amount_in_words(certificate.amount_now_payable)
+    for line, text in enumerate(simpleSplit(words, 'Helvetica-Oblique', 9, WIDTH - 90)[:3]):
+        c.drawString(LEFT + 85, WORDS_TOP - 12 * line, text)
+
+    c.setFont('Helvetica', 8)
+    c.drawCentredString(PAGE_WIDTH / 2, 48, f"Certificate Ref: {certificate.certificate_no}")
+
+
+def render(certificates, output):
+    """Write the certificates, one per page, as a PDF into ``output`` (a file object)"""
+    c = canvas.Canvas(output, pagesize=A4, invariant=1)
+    if len(certificates) == 1:
+        c.setTitle(f"Payment Certificate {certificates[0].certificate_no}")
+    _draw_template(c)
+    for certificate in certificates:
+        c.doForm(FORM_NAME)
+        _draw_certificate(c, certificate)
+        c.showPage()
+    c.save()
+    return output
@@ -0,0 +1,143 @@
+# projects/certificates.py
+"""
+Issuing, revising and deleting interim payment certificates.
+
+Each project's CertificateLedger holds the running certified total, so a new
+certificate takes its amount previously certified from one locked row instead
+of re-summing the earlier certificates. Every change locks the ledger first,
+which serialises concurrent edits to the same project's certificates.
+
+The same transaction moves Project.spent_budget and the charged allocation's
+remaining_balance with F() updates, so neither is ever recomputed from the
+certificates.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Project, ProjectBudgetAllocation, PaymentCertificate, CertificateLedger, ProjectDocument
+from . import artefacts, versions
+
+
+CENT = Decimal('0.01')
+
+
+def _lock_ledger(project):
+    ledger, created = CertificateLedger.objects.select_for_update().get_or_create(project=project)
+    return ledger
+
+
+def _next_certificate(certificate):
+    return (PaymentCertificate.objects.filter(project=certificate.project_id, sequence__gt=certificate.sequence)
+            .order_by('sequence').first())
+
+
+def _charged_allocation(project):
+    """The budget allocation certificates are paid from: the one for the project's
+    budget head if it has one, otherwise its first allocation"""
+    allocations = ProjectBudgetAllocation.objects.filter(project=project)
+    if project.budget_head:
+        allocation = allocations.filter(budget__budget_code=project.budget_head).values_list('pk', flat=True).first()
+        if allocation:
+            return allocation
+    return allocations.order_by('created_at', 'pk').values_list('pk', flat=True).first()
+
+
+def _apply(ledger, project, delta):
+    """
+    Move the project's certified total by delta, and with it the project's
+    spend and its allocation's remaining balance.
+    """
+    if not delta:
+        return
+    CertificateLedger.objects.filter(pk=ledger.pk).update(certified_to_date=F('certified_to_date') + delta)
+    Project.objects.filter(pk=project.pk).update(spent_budget=F('spent_budget') + delta, version=F('version') + 1)
+    allocation = _charged_allocation(project)
+    if allocation:
+        ProjectBudgetAllocation.objects.filter(pk=allocation).update(
+            remaining_balance=F('remaining_balance') - delta
+        )
+        versions.bump_budgets(*ProjectBudgetAllocation.objects.filter(pk=allocation).values_list('budget_id', flat=True))
+
+
+def next_certificate_no(project, date):
+    """Default number for the project's next certificate"""
+    ledger = CertificateLedger.objects.filter(project=project).first()
+    sequence = (ledger.last_sequence if ledger else 0) + 1
+    return f"CERT/{project.project_id}/{date.year}/{sequence:03d}"
+
+
+def previously_certified(project):
+    """What the next certificate will show as amount previously certified"""
+    ledger = CertificateLedger.objects.filter(project=project).first()
+    return ledger.certified_to_date if ledger else 0
+
+
+@transaction.atomic
+def issue(certificate):
+    """Save a new certificate as the project's next interim certificate"""
+    ledger = _lock_ledger(certificate.project)
+
+    certificate.clear_figures()
+    certificate.sequence = ledger.last_sequence + 1
+    certificate.amount_previously_certified = ledger.certified_to_date
+    certificate.save()
+
+    CertificateLedger.objects.filter(pk=ledger.pk).update(last_sequence=certificate.sequence)
+    delta = Decimal(certificate.amount_now_payable).quantize(CENT)
+    _apply(ledger, certificate.project, delta)
+    return delta
+
+
+@transaction.atomic
+def revise(certificate):
+    """
+    Save changes to an issued certificate. A change in its net amount payable
+    is carried into the next certificate's amount previously certified, or
+    into the ledger if this is the latest one.
+    """
+    ledger = _lock_ledger(certificate.project)
+    stored = PaymentCertificate.objects.select_for_update().get(pk=certificate.pk)
+
+    # Issued numbering and carried-forward amounts are not editable
+    certificate.clear_figures()
+    certificate.sequence = stored.sequence
+    certificate.amount_previously_certified = stored.amount_previously_certified
+    certificate.save()
+
+    delta = Decimal(certificate.total_net_amount_payable - stored.total_net_amount_payable).quantize(CENT)
+    if not delta:
+        return 0
+
+    following = _next_certificate(certificate)
+    if following:
+        PaymentCertificate.objects.filter(pk=following.pk).update(
+            amount_previously_certified=F('amount_previously_certified') + delta
+        )
+        versions.bump_projects(certificate.project_id)
+        artefacts.mark_stale(ProjectDocument.objects.filter(source_key=artefacts.certificate_key(following)))
+        return 0
+    _apply(ledger, certificate.project, delta)
+    return delta
+
+
+@transaction.atomic
+def delete(certificate):
+    """Delete a certificate, folding its amount into the next one's carried-forward total"""
+    ledger = _lock_ledger(certificate.project)
+    stored = PaymentCertificate.objects.select_for_update().get(pk=certificate.pk)
+    amount = Decimal(stored.amount_now_payable).quantize(CENT)
+
+    following = _next_certificate(stored)
+    stored.delete()
+
+    if following:
+        PaymentCertificate.objects.filter(pk=following.pk).update(
+            amount_previously_certified=F('amount_previously_certified') - amount
+        )
+        versions.bump_projects(stored.project_id)
+        artefacts.mark_stale(ProjectDocument.objects.filter(source_key=artefacts.certificate_key(following)))
+        return 0
+    _apply(ledger, stored.project, -amount)
+    return -amount
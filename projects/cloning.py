@@ -0,0 +1,112 @@
+# projects/cloning.py
+"""
+Cloning a project as the starting point for a similar one.
+
+clone_project() copies the project's description of the works, its stages
+and, optionally, the BOQ/BEME items of its stages into a new draft project
+whose ID comes from Project.generate_project_id(), the next after the
+year's highest; if another project takes that ID first, the insert is
+retried with the next one. Stages are written with one bulk_create and the
+items with a single INSERT ... SELECT (chunked bulk_create on databases
+without a UUID function), so the size of a BEME hardly matters. Progress
+on the original (status, dates, approvals, contract award, documents,
+certificates and budget allocations) is not copied.
+"""
+from django.db import IntegrityError, connection, transaction
+
+from .models import BOQItem, Project, ProjectStage, StageTransition
+from . import beme, snapshots
+
+BATCH_SIZE = 1000
+ID_ATTEMPTS = 5
+
+# What is copied
+PROJECT_FIELDS = ['description', 'project_type', 'location', 'other_location', 'department', 'estimated_budget',
+                  'priority', 'budget_head', 'project_manager', 'supervisor']
+STAGE_FIELDS = ['stage_type', 'order', 'assigned_to', 'notes']
+BOQ_FIELDS = ['section', 'item_number', 'description', 'quantity', 'unit', 'rate', 'amount', 'notes', 'order']
+
+
+def _attnames(model, names):
+    return [model._meta.get_field(name).attname for name in names]
+
+
+def clone_project(project, user, title, include_boq=True):
+    """The new draft project, with its stages and BOQ items"""
+    with transaction.atomic():
+        clone = Project(title=title, created_by=user, status='draft',
+                        **{name: getattr(project, name) for name in _attnames(Project, PROJECT_FIELDS)})
+        # A clash with an existing project ID fails rather than overwriting that project;
+        # then allocate again, as a concurrent create took the ID
+        for attempt in range(ID_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    clone.save(force_insert=True)
+                break
+            except IntegrityError:
+                if attempt == ID_ATTEMPTS - 1:
+                    raise
+                clone.project_id = ''
+
+        stage_fields = _attnames(ProjectStage, STAGE_FIELDS)
+        originals = list(project.stages.order_by('order').values('pk', *stage_fields))
+        ProjectStage.objects.bulk_create([
+            ProjectStage(project=clone, **{name: row[name] for name in stage_fields})
+            for row in originals
+        ], batch_size=BATCH_SIZE)
+        stages = list(clone.stages.all())
+        StageTransition.objects.bulk_create(
+            [StageTransition.from_stage(stage, user=user) for stage in stages], batch_size=BATCH_SIZE)
+
+        if include_boq:
+            with_items = _copy_boq_items(project, clone, stages, originals)
+
+            # Bulk inserts send no signals: summarise and version the copied BEMEs here.
+            # They stay out of the rate catalog, as they are not new prices.
+            for stage in stages:
+                if stage.pk in with_items:
+                    beme.refresh_summary(stage.pk)
+                    snapshots.record(stage, user)
+    return clone
+
+
+# New boq_id values generated by the database, per vendor
+UUID_SQL = {
+    'postgresql': 'gen_random_uuid()',
+    'sqlite': 'lower(hex(randomblob(16)))',
+}
+
+
+def _copy_boq_items(project, clone, stages, originals):
+    """Copy the items into the clone's stages; returns the ids of the stages that got items"""
+    uuid_sql = UUID_SQL.get(connection.vendor)
+    if uuid_sql is None:
+        return _bulk_copy_boq_items(stages, originals)
+
+    # One INSERT ... SELECT, pairing old and new stages by stage type (unique within a project)
+    items, stage_table = BOQItem._meta.db_table, ProjectStage._meta.db_table
+    columns = ', '.join(connection.ops.quote_name(column) for column in _attnames(BOQItem, BOQ_FIELDS))
+    selected = ', '.join(f"item.{connection.ops.quote_name(column)}" for column in _attnames(BOQItem, BOQ_FIELDS))
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            INSERT INTO {items} (boq_id, project_stage_id, {columns})
+            SELECT {uuid_sql}, target.id, {selected}
+            FROM {items} item
+            JOIN {stage_table} source ON source.id = item.project_stage_id
+            JOIN {stage_table} target ON target.project_id = %s AND target.stage_type = source.stage_type
+            WHERE source.project_id = %s
+        ''', [clone.pk, project.pk])
+    return set(BOQItem.objects.filter(project_stage__project=clone).order_by()
+               .values_list('project_stage_id', flat=True).distinct())
+
+
+def _bulk_copy_boq_items(stages, originals):
+    new_ids = {stage.stage_type: stage.pk for stage in stages}
+    stage_map = {row['pk']: new_ids[row['stage_type']] for row in originals}
+    items = list(BOQItem.objects.filter(project_stage_id__in=stage_map).order_by()
+                 .values_list('project_stage_id', *BOQ_FIELDS))
+    BOQItem.objects.bulk_create([
+        BOQItem(project_stage_id=stage_map[stage_id], **dict(zip(BOQ_FIELDS, values)))
+        for stage_id, *values in items
+    ], batch_size=BATCH_SIZE)
+    return {stage_map[stage_id] for stage_id, *values in items}
@@ -1,36 +1,33 @@
 from projects.models import Project
-from django.db.models import Count
+from approvals import inbox
+from . import notifications
+from django.conf import settings
+from django.db.models import Count, Q
 
 from django.utils import timezone
 
 
+def quick_stats(user):
+    """The sidebar's counts of the user's projects, in one aggregate"""
+    return Project.objects.filter(created_by=user).aggregate(
+        total_projects=Count('pk'),
+        active_projects=Count('pk', filter=Q(status='in_progress')),
+        overdue_projects=Count('pk', filter=Q(is_overdue=True)),
+    )
+
+
 def project_context(request):
     context = {}
     
     if request.user.is_authenticated:
         # Get user-specific stats
-        if request.user.is_approving_officer:
-            pending_approvals = Project.objects.filter(
-                status='submitted'
-            ).count()
-        else:
-            pending_approvals = 0
+        pending_approvals = inbox.open_count(request.user)
         
         context.update({
-            'total_projects': Project.objects.filter(
-                created_by=request.user
-            ).count(),
-            'active_projects': Project.objects.filter(
-                created_by=request.user,
-                status='in_progress'
-            ).count(),
-            'overdue_projects': Project.objects.filter(
-                created_by=request.user,
-                status='in_progress'
-            ).filter(
-                approved_end_date__lt=timezone.now().date()
-            ).count(),
+            **quick_stats(request.user),
             'pending_approvals': pending_approvals,
+            'unread_notifications': notifications.unread_count(request.user),
+            'live_notifications': settings.LIVE_NOTIFICATIONS,
         })
     
     return context
\ No newline at end of file
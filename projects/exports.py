@@ -0,0 +1,167 @@
+# projects/exports.py
+"""
+Batch export of payment certificates and BEMEs for audit requests.
+
+export_documents() runs on the jobs worker. Documents with a current stored
+PDF (see artefacts.py) are copied from storage; the rest are rendered in a
+pool of processes sized to the CPU count, a chunk of documents per task.
+Each rendered PDF goes into the ZIP as soon as its chunk finishes, or is
+merged into a single PDF in document order at the end. Progress is reported
+through the job, which the export page polls.
+"""
+import io
+import math
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from jobs.queue import set_progress
+from .models import PaymentCertificate, ProjectStage, ProjectDocument
+from . import render_pool
+
+WORKERS = getattr(settings, 'EXPORT_WORKERS', 0) or os.cpu_count() or 1
+MAX_CHUNK_SIZE = 25
+# Finished exports are kept this long for download
+RETENTION = timedelta(days=getattr(settings, 'EXPORT_RETENTION_DAYS', 7))
+EXPORT_DIR = 'exports'
+
+
+def _period(year, quarter=None):
+    """[start, end) of a year or one of its quarters"""
+    if not quarter:
+        return date(year, 1, 1), date(year + 1, 1, 1)
+    start = date(year, 3 * quarter - 2, 1)
+    end = date(year + 1, 1, 1) if quarter == 4 else date(year, 3 * quarter + 1, 1)
+    return start, end
+
+
+def select(kind, year, quarter=None, location='', contractor=None):
+    """[(source_key, file name)] of the documents an export covers, in filing order"""
+    start, end = _period(year, quarter)
+    if kind == 'certificate':
+        rows = PaymentCertificate.objects.filter(certificate_date__gte=start, certificate_date__lt=end)
+    else:
+        rows = ProjectStage.objects.filter(stage_type='prepare_boq', boq_items__isnull=False,
+                                           updated_at__date__gte=start, updated_at__date__lt=end).distinct()
+    if location:
+        rows = rows.filter(project__location=location)
+    if contractor:
+        rows = rows.filter(project__contractor=contractor)
+
+    if kind == 'certificate':
+        return [
+            (f"certificate:{certificate_id}", f"{project_id}/certificate-{sequence:03d}.pdf")
+            for certificate_id, project_id, sequence in rows.order_by('project__project_id', 'sequence')
+            .values_list('certificate_id', 'project__project_id', 'sequence')
+        ]
+    return [
+        (f"beme:{stage_id}", f"{project_id}/beme.pdf")
+        for stage_id, project_id in rows.order_by('project__project_id').values_list('stage_id', 'project__project_id')
+    ]
+
+
+def _chunks(keys, workers):
+    # Several chunks per worker keeps them all busy to the end
+    size = max(1, min(MAX_CHUNK_SIZE, math.ceil(len(keys) / (workers * 4))))
+    return [keys[i:i + size] for i in range(0, len(keys), size)]
+
+
+def _results(keys):
+    """Yield (source_key, pdf bytes or None, error) as chunks finish rendering"""
+    if not keys:
+        return
+    chunks = _chunks(keys, WORKERS)
+    with ProcessPoolExecutor(max_workers=min(WORKERS, len(chunks)), initializer=render_pool.init,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(render_pool.render_chunk, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def export_documents(job_id, kind, year, quarter=None, location='', contractor=None, output='zip'):
+    """Write the selected documents to one ZIP or merged PDF in storage"""
+    documents = select(kind, year, quarter, location, contractor)
+    names = dict(documents)
+    total = len(documents)
+    set_progress(job_id, 0, f"0 of {total} documents")
+
+    stored = dict(
+        ProjectDocument.objects.filter(source_key__in=names, is_stale=False)
+        .exclude(content_hash='').values_list('source_key', 'file')
+    )
+    to_render = [key for key, name in documents if key not in stored]
+
+    done, failed, parts = 0, [], {}
+    with tempfile.TemporaryFile() as target:
+        archive = zipfile.ZipFile(target, 'w', zipfile.ZIP_STORED) if output == 'zip' else None  # PDFs are already compressed
+
+        def add(source_key, content, error):
+            nonlocal done
+            done += 1
+            if content is None:
+                failed.append(f"{names[source_key]}: {error}")
+            elif archive:
+                archive.writestr(names[source_key], content)
+            else:
+                parts[source_key] = content
+            if done % MAX_CHUNK_SIZE == 0 or done == total:
+                set_progress(job_id, done * 100 // total, f"{done} of {total} documents")
+
+        try:
+            for source_key, file_name in stored.items():
+                try:
+                    with default_storage.open(file_name, 'rb') as f:
+                        add(source_key, f.read(), '')
+                except OSError:  # file missing: render it instead
+                    to_render.append(source_key)
+            for result in _results(to_render):
+                add(*result)
+        finally:
+            if archive:
+                archive.close()
+        if not archive:
+            _merge([parts[key] for key, name in documents if key in parts], target)
+
+        extension = 'zip' if output == 'zip' else 'pdf'
+        target.seek(0)
+        file_name = default_storage.save(f"{EXPORT_DIR}/{job_id}.{extension}", File(target))
+
+    return {
+        'file': file_name,
+        'count': total - len(failed),
+        'failed': len(failed),
+        'errors': failed[:20],
+        'download_name': f"{kind}s-{year}{f'-q{quarter}' if quarter else ''}.{extension}",
+    }
+
+
+def _merge(pdfs, target):
+    """Concatenate PDFs into ``target``"""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for pdf in pdfs:
+        writer.append(io.BytesIO(pdf))
+    writer.write(target)
+
+
+def purge():
+    """Delete exports older than RETENTION"""
+    if not default_storage.exists(EXPORT_DIR):
+        return 0
+    cutoff = timezone.now() - RETENTION
+    removed = 0
+    for name in default_storage.listdir(EXPORT_DIR)[1]:
+        path = f"{EXPORT_DIR}/{name}"
+        if default_storage.get_modified_time(path) < cutoff:
+            default_storage.delete(path)
+            removed += 1
+    return removed
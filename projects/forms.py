@@ -364,6 +364,11 @@ class PaymentCertificateForm(forms.ModelForm):
             'refund_advance_payment': 'REFUND OF ADVANCE PAYMENT',
             'amount_previously_certified': 'AMOUNT PREVIOUSLY CERTIFIED',
         }
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Carried forward from the project's certificate ledger
+        self.fields['amount_previously_certified'].disabled = True
 
 
 from .models import ProjectNomination
@@ -431,4 +436,48 @@ class ProjectNominationForm(forms.Form):
         if not pms and not sups:
             raise forms.ValidationError("Please nominate at least one Project Manager or Supervisor.")
         
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+class DocumentExportForm(forms.Form):
+    KIND_CHOICES = [
+        ('certificate', 'Payment Certificates'),
+        ('beme', 'BEMEs'),
+    ]
+    OUTPUT_CHOICES = [
+        ('zip', 'ZIP of PDFs'),
+        ('pdf', 'One merged PDF'),
+    ]
+    QUARTER_CHOICES = [('', 'Whole year'), (1, 'Q1'), (2, 'Q2'), (3, 'Q3'), (4, 'Q4')]
+    
+    kind = forms.ChoiceField(choices=KIND_CHOICES, widget=forms.Select(attrs={'class': 'form-control'}),
+                             label="Documents")
+    year = forms.IntegerField(min_value=2000, max_value=2100, initial=lambda: timezone.now().year,
+                              widget=forms.NumberInput(attrs={'class': 'form-control'}))
+    quarter = forms.TypedChoiceField(choices=QUARTER_CHOICES, coerce=int, empty_value=None, required=False,
+                                     widget=forms.Select(attrs={'class': 'form-control'}))
+    location = forms.ChoiceField(choices=[('', 'All ports')] + PORT_LOCATION_CHOICES, required=False,
+                                 widget=forms.Select(attrs={'class': 'form-control'}), label="Port")
+    contractor = forms.ModelChoiceField(queryset=Contractor.objects.order_by('name'), required=False,
+                                        empty_label="All contractors",
+                                        widget=forms.Select(attrs={'class': 'form-control'}))
+    output = forms.ChoiceField(choices=OUTPUT_CHOICES, widget=forms.Select(attrs={'class': 'form-control'}),
+                               label="Format")
+    
+    def export_filters(self):
+        """Job arguments for exports.export_documents()"""
+        data = self.cleaned_data
+        return {
+            'kind': data['kind'],
+            'year': data['year'],
+            'quarter': data['quarter'],
+            'location': data['location'],
+            'contractor': data['contractor'].pk if data['contractor'] else None,
+            'output': data['output'],
+        }
+
+
+class ProjectCloneForm(forms.Form):
+    title = forms.CharField(max_length=200, widget=forms.TextInput(attrs={'class': 'form-control'}),
+                            label="Title of the new project")
+    include_boq = forms.BooleanField(required=False, initial=True, label="Copy the BOQ/BEME items",
+                                     widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
@@ -0,0 +1,100 @@
+# projects/live.py
+"""
+In-process broker for the live notification stream.
+
+Each open /notifications/stream/ connection subscribes an asyncio queue for its
+user. Services call the publish helpers from transaction.on_commit hooks, so
+only committed changes are pushed and idle connections never touch the
+database. The broker lives in one server process: run the ASGI server with a
+single worker per host, or users connected to other workers will only see
+changes on their next page load.
+"""
+import json
+import threading
+
+from django.db import transaction
+
+_subscribers = {}  # user_id -> {(loop, queue)}
+_lock = threading.Lock()
+
+
+def subscribe(user_id, loop, queue):
+    with _lock:
+        _subscribers.setdefault(user_id, set()).add((loop, queue))
+
+
+def unsubscribe(user_id, loop, queue):
+    with _lock:
+        queues = _subscribers.get(user_id)
+        if queues:
+            queues.discard((loop, queue))
+            if not queues:
+                del _subscribers[user_id]
+
+
+def connected(user_ids):
+    """The given users that have at least one open stream"""
+    with _lock:
+        return {user_id for user_id in user_ids if user_id in _subscribers}
+
+
+def event(name, data):
+    """Format one Server-Sent Event"""
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def _send(user_id, message):
+    with _lock:
+        targets = list(_subscribers.get(user_id, ()))
+    for loop, queue in targets:
+        # Publishers run in worker threads; hand over to the connection's loop
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+        except RuntimeError:  # loop already closed
+            unsubscribe(user_id, loop, queue)
+
+
+def counts(user_ids):
+    """Current unread and inbox counts for each user, read from the counters"""
+    from approvals.models import InboxCounter
+    from .models import NotificationCounter
+
+    result = {user_id: {'unread': 0, 'pending_approvals': 0} for user_id in user_ids}
+    for user_id, unread in NotificationCounter.objects.filter(user_id__in=user_ids).values_list('user_id', 'unread_count'):
+        result[user_id]['unread'] = unread
+    for user_id, open_count in InboxCounter.objects.filter(user_id__in=user_ids).values_list('user_id', 'open_count'):
+        result[user_id]['pending_approvals'] = open_count
+    return result
+
+
+def _push_counts(user_ids):
+    user_ids = connected(user_ids)
+    if user_ids:
+        for user_id, data in counts(user_ids).items():
+            _send(user_id, event('counts', data))
+
+
+def _push_notifications(notifications):
+    user_ids = connected({n.user_id for n in notifications})
+    if not user_ids:
+        return
+    for notification in notifications:
+        if notification.user_id in user_ids:
+            _send(notification.user_id, event('notification', {
+                'id': notification.pk,
+                'title': notification.title,
+                'message': notification.message,
+                'link': notification.link,
+            }))
+    _push_counts(user_ids)
+
+
+def counts_changed(user_ids):
+    """Push fresh counts to these users once the current transaction commits"""
+    user_ids = set(user_ids)
+    transaction.on_commit(lambda: _push_counts(user_ids), robust=True)
+
+
+def notifications_created(notifications):
+    """Push new notifications to their users once the current transaction commits"""
+    transaction.on_commit(lambda: _push_notifications(notifications), robust=True)
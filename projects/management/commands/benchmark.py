@@ -0,0 +1,67 @@
+import json
+import platform
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from projects import benchmarks
+
+# Committed with the code; refresh it with --save on the reference machine when a change is meant to be slower
+BASELINE = Path(getattr(settings, 'BENCHMARK_BASELINE', settings.BASE_DIR / 'benchmarks' / 'baseline.json'))
+
+class Command(BaseCommand):
+    help = 'Time number-to-words, certificate figures, BEME totals and BEME rendering against a saved baseline'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('-k', dest='pattern', default='', help='Only run benchmarks whose name contains this')
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--save', action='store_true', help='Save the results as the new baseline')
+        parser.add_argument('--baseline', default=str(BASELINE), help='Baseline JSON file')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Fail when a median is this fraction slower than the baseline (default 0.2)')
+    
+    def handle(self, *args, **options):
+        path = Path(options['baseline'])
+        baseline = json.loads(path.read_text())['benchmarks'] if path.exists() else {}
+        if not baseline and not options['save']:
+            self.stdout.write(self.style.WARNING(f"No baseline at {path}: nothing to compare against. "
+                                                 f"Run with --save to create one."))
+        
+        results, slower = {}, []
+        self.stdout.write(f"{'benchmark':<34}{'min':>12}{'median':>12}{'stddev':>12}{'vs baseline':>14}")
+        for name, stats in benchmarks.run(options['pattern'], options['rounds']):
+            results[name] = stats
+            change = ''
+            if name in baseline:
+                ratio = stats['median'] / baseline[name]['median'] - 1
+                change = f"{ratio:>+14.1%}"
+                if ratio > options['threshold']:
+                    slower.append(name)
+                    change = self.style.ERROR(change)
+            self.stdout.write(f"{name:<34}{_duration(stats['min']):>12}{_duration(stats['median']):>12}"
+                              f"{_duration(stats['stddev']):>12}{change}")
+        
+        if options['save']:
+            if path.exists() and options['pattern']:
+                results = {**baseline, **results}  # keep the benchmarks that were not run
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps({
+                'saved_at': timezone.now().isoformat(),
+                'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                            'processor': platform.processor()},
+                'benchmarks': results,
+            }, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {path}"))
+        
+        if slower:
+            raise CommandError(f"Slower than the baseline by more than {options['threshold']:.0%}: {', '.join(slower)}")
+        if baseline and not options['save']:
+            self.stdout.write(self.style.SUCCESS('No benchmark is slower than the baseline.'))
+
+
+def _duration(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('µs', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
@@ -0,0 +1,36 @@
+import io
+import time
+from itertools import cycle, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from projects import certificate_pdf
+from projects.models import PaymentCertificate
+
+class Command(BaseCommand):
+    help = 'Measure payment certificate PDF rendering throughput'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help='Certificates to render')
+        parser.add_argument('--per-document', type=int, default=1,
+                            help='Certificates per PDF; more than one shares the page form between them')
+    
+    def handle(self, *args, **options):
+        certificates = list(PaymentCertificate.objects.select_related('project__contractor')[:50])
+        if not certificates:
+            raise CommandError('There are no payment certificates to render.')
+        count, per_document = options['count'], max(1, options['per_document'])
+        
+        # Warm up: loads the logo and layout once, as a long-running worker would
+        certificate_pdf.render(certificates[:1], io.BytesIO())
+        
+        pending = islice(cycle(certificates), count)
+        size = 0
+        started = time.perf_counter()
+        while batch := list(islice(pending, per_document)):
+            size += len(certificate_pdf.render(batch, io.BytesIO()).getvalue())
+        elapsed = time.perf_counter() - started
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} certificates in {elapsed:.2f}s: {count / elapsed:.1f} certificates/s "
+            f"({per_document} per document, {size // max(1, count // per_document)} bytes per PDF)"
+        ))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from projects.notifications import rebuild_counters
+
+class Command(BaseCommand):
+    help = 'Recount unread notifications for every user'
+    
+    def handle(self, *args, **kwargs):
+        rebuild_counters()
+        self.stdout.write(self.style.SUCCESS('Notification counters rebuilt.'))
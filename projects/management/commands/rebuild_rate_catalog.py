@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from projects.rates import rebuild
+
+class Command(BaseCommand):
+    help = 'Build the rate catalog from every saved BOQ'
+    
+    def handle(self, *args, **kwargs):
+        recorded = rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rate catalog rebuilt from {recorded} BOQ lines.'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from projects import outbox
+
+class Command(BaseCommand):
+    help = ('Send queued notification emails in batches. Run with --loop as a worker. '
+            'To try it locally, start a stand-in SMTP server '
+            '(python -m smtpd -n -c DebuggingServer localhost:1025, or aiosmtpd) '
+            'and set EMAIL_BACKEND=django.core.mail.backends.smtp.EmailBackend.')
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between polls when idle')
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            sent, failed = outbox.drain(batch_size)
+            if sent or failed:
+                self.stdout.write(f'Sent {sent}, deferred {failed}.')
+            # Go straight on to the next batch while there is a backlog
+            if sent + failed < batch_size:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS('Outbox drained.'))
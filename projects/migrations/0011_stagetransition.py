@@ -0,0 +1,62 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_transitions(apps, schema_editor):
+    """Give every existing stage a starting point in the transition log."""
+    ProjectStage = apps.get_model('projects', 'ProjectStage')
+    StageTransition = apps.get_model('projects', 'StageTransition')
+    
+    batch = []
+    stages = ProjectStage.objects.select_related('project').iterator(chunk_size=1000)
+    for stage in stages:
+        common = {
+            'stage_id': stage.pk,
+            'project_id': stage.project_id,
+            'stage_type': stage.stage_type,
+            'department': stage.project.department,
+            'location': stage.project.location,
+        }
+        batch.append(StageTransition(to_status='pending', changed_at=stage.created_at, **common))
+        if stage.status != 'pending':
+            batch.append(StageTransition(from_status='pending', to_status=stage.status,
+                                         changed_at=stage.updated_at, **common))
+        if len(batch) >= 1000:
+            StageTransition.objects.bulk_create(batch)
+            batch = []
+    StageTransition.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0010_alter_projectnomination_unique_together_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage_type', models.CharField(choices=[('site_inspection', 'Site Inspection'), ('project_proposal', 'Project Proposal Preparation'), ('feasibility_study', 'Feasibility Study'), ('due_diligence', 'Due Diligence (Terms of Reference)'), ('prepare_boq', 'Prepare BOQ/BEME'), ('technical_review', 'Technical Review Committee'), ('forward_gm', 'Forward to General Manager Engineering'), ('forward_ed', 'Forward to Executive Director Engineering'), ('tender_process', 'Tender Process'), ('contract_award', 'Contract Award'), ('nominate_pm', 'Nomination of Project Manager/Supervisor'), ('commencement', 'Commencement of Project'), ('supervision', 'Supervision (Monitoring & Evaluation)'), ('progress_report', 'Submission of Progress Report'), ('payment_certificate', 'Project Certification (Payment Certificate)'), ('completion', 'Project Completion/Commissioning'), ('retention_certificate', 'Certification of Retention'), ('final_report', 'Final Project Report')], max_length=50)),
+                ('from_status', models.CharField(blank=True, choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed'), ('blocked', 'Blocked'), ('requires_approval', 'Requires Approval')], max_length=20)),
+                ('to_status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed'), ('blocked', 'Blocked'), ('requires_approval', 'Requires Approval')], max_length=20)),
+                ('department', models.CharField(choices=[('civil', 'Civil Engineering'), ('electrical', 'Electrical Engineering'), ('mechanical', 'Mechanical Engineering'), ('marine', 'Marine Engineering'), ('planning', 'Planning & Design'), ('maintenance', 'Maintenance'), ('dredging', 'Dredging'), ('csr', 'Corporate Social Responsibility')], max_length=50)),
+                ('location', models.CharField(choices=[('hq', 'Headquarters (HQ)'), ('lpc', 'Lagos Port Complex (LPC)'), ('tincan', 'Tincan Island Port Complex (TCIPC)'), ('rivers', 'Rivers Port (RP)'), ('delta', 'Delta Port (DP)'), ('calabar', 'Calabar Port (CAL)'), ('lekki', 'Lekki Port'), ('flt', 'Federal Lighter Terminal Onne (FLT)'), ('fot', 'Federal Ocean Terminal (FOT)'), ('other', 'Other')], max_length=50)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stage_transitions', to=settings.AUTH_USER_MODEL)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_transitions', to='projects.project')),
+                ('stage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transitions', to='projects.projectstage')),
+            ],
+            options={
+                'ordering': ['changed_at', 'id'],
+                'indexes': [models.Index(fields=['stage', 'changed_at', 'id'], include=('to_status', 'stage_type', 'department', 'location'), name='stagetrans_stage_cover_idx')],
+            },
+        ),
+        migrations.RunPython(seed_transitions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:36
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def number_certificates(apps, schema_editor):
+    """Number existing certificates in date order and open each project's ledger"""
+    PaymentCertificate = apps.get_model('projects', 'PaymentCertificate')
+    CertificateLedger = apps.get_model('projects', 'CertificateLedger')
+
+    last = {}
+    for cert in PaymentCertificate.objects.order_by('project_id', 'certificate_date', 'created_at', 'id'):
+        cert.sequence = last[cert.project_id][0] + 1 if cert.project_id in last else 1
+        cert.save(update_fields=['sequence'])
+        last[cert.project_id] = (cert.sequence, cert)
+
+    ledgers = []
+    for project_id, (sequence, cert) in last.items():
+        # Total net amount payable (9) of the latest certificate
+        certified = (cert.work_completed_to_date + cert.cost_of_escalation + cert.materials_on_site
+                     - cert.work_completed_to_date * cert.retention_rate / Decimal('100')
+                     + cert.fluctuation_claims - cert.refund_advance_payment)
+        ledgers.append(CertificateLedger(project_id=project_id, last_sequence=sequence,
+                                         certified_to_date=round(certified, 2)))
+    CertificateLedger.objects.bulk_create(ledgers)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0011_stagetransition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CertificateLedger',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='certificate_ledger', serialize=False, to='projects.project')),
+                ('last_sequence', models.PositiveIntegerField(default=0)),
+                ('certified_to_date', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='paymentcertificate',
+            name='sequence',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Interim certificate number within the project'),
+        ),
+        migrations.RunPython(number_certificates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='paymentcertificate',
+            constraint=models.UniqueConstraint(fields=('project', 'sequence'), name='paymentcert_project_seq_uniq'),
+        ),
+    ]
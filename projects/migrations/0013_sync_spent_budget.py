@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:58
+
+from django.db import migrations
+
+
+def sync_spent_budget(apps, schema_editor):
+    """Start the maintained spend and balances from the certified totals"""
+    Project = apps.get_model('projects', 'Project')
+    ProjectBudgetAllocation = apps.get_model('projects', 'ProjectBudgetAllocation')
+    CertificateLedger = apps.get_model('projects', 'CertificateLedger')
+
+    for ledger in CertificateLedger.objects.select_related('project'):
+        project = ledger.project
+        Project.objects.filter(pk=project.pk).update(spent_budget=ledger.certified_to_date)
+
+        allocations = ProjectBudgetAllocation.objects.filter(project=project)
+        charged = None
+        if project.budget_head:
+            charged = allocations.filter(budget__budget_code=project.budget_head).first()
+        charged = charged or allocations.order_by('created_at', 'pk').first()
+        if charged:
+            charged.remaining_balance = charged.allocated_amount - ledger.certified_to_date
+            charged.save(update_fields=['remaining_balance'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0012_certificate_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(sync_spent_budget, migrations.RunPython.noop),
+    ]
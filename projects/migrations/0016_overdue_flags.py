@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0015_outbound_email'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='aging_bucket',
+            field=models.CharField(blank=True, choices=[('', 'On time'), ('0-7', '0-7 days late'), ('8-30', '8-30 days late'), ('30+', 'Over 30 days late')], max_length=5),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='is_overdue',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='overdue_since',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectstage',
+            name='aging_bucket',
+            field=models.CharField(blank=True, choices=[('', 'On time'), ('0-7', '0-7 days late'), ('8-30', '8-30 days late'), ('30+', 'Over 30 days late')], max_length=5),
+        ),
+        migrations.AddField(
+            model_name='projectstage',
+            name='is_overdue',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='projectstage',
+            name='overdue_since',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['is_overdue', 'aging_bucket'], name='project_overdue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='projectstage',
+            index=models.Index(fields=['is_overdue', 'aging_bucket'], name='stage_overdue_idx'),
+        ),
+    ]
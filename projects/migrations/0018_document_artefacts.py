@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 22:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0017_version_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectdocument',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='projectdocument',
+            name='is_stale',
+            field=models.BooleanField(default=False, editable=False, help_text='The source changed since the document was rendered'),
+        ),
+        migrations.AddField(
+            model_name='projectdocument',
+            name='source_key',
+            field=models.CharField(blank=True, default='', editable=False, help_text='What the document was rendered from, e.g. certificate:<uuid>', max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='projectdocument',
+            constraint=models.UniqueConstraint(condition=models.Q(('source_key', ''), _negated=True), fields=('source_key',), name='projectdocument_source_uniq'),
+        ),
+    ]
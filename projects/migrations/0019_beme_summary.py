@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:18
+
+import django.db.models.deletion
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+def summarize_bemes(apps, schema_editor):
+    """One summary per BOQ stage that has items, from a single GROUP BY"""
+    BOQItem = apps.get_model('projects', 'BOQItem')
+    BEMESummary = apps.get_model('projects', 'BEMESummary')
+
+    def cents(value):
+        return value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    summaries = []
+    rows = (BOQItem.objects.order_by().values('project_stage_id', 'project_stage__project_id')
+            .annotate(subtotal=models.Sum('amount'), items=models.Count('pk'),
+                      sections=models.Count('section', distinct=True)))
+    for row in rows:
+        subtotal = row['subtotal']
+        contingency = subtotal * Decimal('0.05')
+        vat = subtotal * Decimal('0.075')
+        summaries.append(BEMESummary(
+            stage_id=row['project_stage_id'], project_id=row['project_stage__project_id'],
+            item_count=row['items'], section_count=row['sections'],
+            subtotal=cents(subtotal), contingency=cents(contingency), vat=cents(vat),
+            grand_total=cents(subtotal + contingency + vat),
+        ))
+    BEMESummary.objects.bulk_create(summaries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0018_document_artefacts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BEMESummary',
+            fields=[
+                ('stage', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='beme_summary', serialize=False, to='projects.projectstage')),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('section_count', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('contingency', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('vat', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('grand_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='beme_summaries', to='projects.project')),
+            ],
+            options={
+                'verbose_name': 'BEME summary',
+                'verbose_name_plural': 'BEME summaries',
+            },
+        ),
+        migrations.RunPython(summarize_bemes, migrations.RunPython.noop),
+    ]
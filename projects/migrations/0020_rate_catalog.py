@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_trigram_index(apps, schema_editor):
+    # Suggestions match descriptions by trigram similarity; SQLite falls back
+    # to substring search and needs no index
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS projects_ratecatalog_key_trgm '
+        'ON projects_ratecatalogentry USING gin (description_key gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS projects_ratecatalog_key_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0019_beme_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateCatalogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description_key', models.CharField(help_text='Lower-cased description with spacing and punctuation normalised', max_length=255)),
+                ('description', models.TextField(help_text='Description as last written')),
+                ('unit', models.CharField(choices=[('item', 'Item'), ('nos', 'Nos'), ('sqm', 'Sqm'), ('m', 'M'), ('m2', 'M²'), ('m3', 'M³'), ('kg', 'Kg'), ('ton', 'Ton'), ('day', 'Day'), ('hour', 'Hour'), ('lot', 'Lot')], max_length=10)),
+                ('location', models.CharField(blank=True, choices=[('hq', 'Headquarters (HQ)'), ('lpc', 'Lagos Port Complex (LPC)'), ('tincan', 'Tincan Island Port Complex (TCIPC)'), ('rivers', 'Rivers Port (RP)'), ('delta', 'Delta Port (DP)'), ('calabar', 'Calabar Port (CAL)'), ('lekki', 'Lekki Port'), ('flt', 'Federal Lighter Terminal Onne (FLT)'), ('fot', 'Federal Ocean Terminal (FOT)'), ('other', 'Other')], max_length=50)),
+                ('uses', models.PositiveIntegerField(default=0, help_text='Number of BOQs with this item')),
+                ('median_rate', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('last_rate', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('min_rate', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('max_rate', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('last_used_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'rate catalog entries',
+                'constraints': [models.UniqueConstraint(fields=('description_key', 'unit', 'location'), name='unique_rate_catalog_entry')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RateObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('observed_at', models.DateTimeField()),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='observations', to='projects.ratecatalogentry')),
+                ('stage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rate_observations', to='projects.projectstage')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('entry', 'stage'), name='unique_rate_observation')],
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:26
+
+import django.db.models.deletion
+from django.conf import settings
+import hashlib
+import json
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+def record_first_versions(apps, schema_editor):
+    """Version 1 of every BEME that has items, hashed as projects.snapshots does"""
+    BOQItem = apps.get_model('projects', 'BOQItem')
+    BEMERow = apps.get_model('projects', 'BEMERow')
+    BEMEVersion = apps.get_model('projects', 'BEMEVersion')
+
+    def cents(value):
+        return str(Decimal(value).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+    stages = {}
+    items = BOQItem.objects.order_by('project_stage_id', 'order', 'item_number').values_list(
+        'project_stage_id', 'item_number', 'section', 'description', 'quantity', 'unit', 'rate', 'amount', 'notes')
+    for stage_id, item_number, section, description, quantity, unit, rate, amount, notes in items:
+        content = [section, description, cents(quantity), unit, cents(rate), notes]
+        content_hash = hashlib.sha256(json.dumps(content).encode()).hexdigest()
+        rows, entries = stages.setdefault(stage_id, ({}, []))
+        rows.setdefault(content_hash, BEMERow(
+            content_hash=content_hash, section=section, description=description, quantity=quantity,
+            unit=unit, rate=rate, amount=amount, notes=notes))
+        entries.append([item_number, content_hash])
+
+    for stage_id, (rows, entries) in stages.items():
+        BEMERow.objects.bulk_create(rows.values(), batch_size=500, ignore_conflicts=True)
+        BEMEVersion.objects.create(
+            stage_id=stage_id, number=1, rows=entries,
+            content_hash=hashlib.sha256(json.dumps(entries).encode()).hexdigest(),
+            item_count=len(entries), subtotal=sum((rows[key].amount for _, key in entries), Decimal('0')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0020_rate_catalog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BEMERow',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('section', models.CharField(max_length=100)),
+                ('description', models.TextField()),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('unit', models.CharField(choices=[('item', 'Item'), ('nos', 'Nos'), ('sqm', 'Sqm'), ('m', 'M'), ('m2', 'M²'), ('m3', 'M³'), ('kg', 'Kg'), ('ton', 'Ton'), ('day', 'Day'), ('hour', 'Hour'), ('lot', 'Lot')], max_length=10)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('notes', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'BEME row',
+            },
+        ),
+        migrations.CreateModel(
+            name='BEMEVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('rows', models.JSONField(default=list)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='beme_versions', to=settings.AUTH_USER_MODEL)),
+                ('stage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='beme_versions', to='projects.projectstage')),
+            ],
+            options={
+                'verbose_name': 'BEME version',
+                'ordering': ['stage', '-number'],
+                'constraints': [models.UniqueConstraint(fields=('stage', 'number'), name='unique_beme_version')],
+            },
+        ),
+        migrations.RunPython(record_first_versions, migrations.RunPython.noop),
+    ]
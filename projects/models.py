@@ -4,6 +4,8 @@ from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
 from django.utils import timezone
+from django.db.models.functions import Coalesce, Length
+from decimal import Decimal
 
 User = get_user_model()
 
@@ -60,6 +62,14 @@ DEPARTMENT_CHOICES = [
 ]
 
 # Project Model - MUST EXIST AND BE DEFINED FIRST
+# Days-late buckets set by the nightly overdue job (projects.overdue)
+AGING_BUCKET_CHOICES = [
+    ('', 'On time'),
+    ('0-7', '0-7 days late'),
+    ('8-30', '8-30 days late'),
+    ('30+', 'Over 30 days late'),
+]
+
 class Project(models.Model):
     STATUS_CHOICES = [
         ('draft', 'Draft'),
@@ -154,8 +164,22 @@ class Project(models.Model):
 
     budget_head = models.CharField(max_length=100, blank=True, help_text="Budget head code/reference")
 
+    # Set by the nightly overdue job
+    is_overdue = models.BooleanField(default=False)
+    overdue_since = models.DateField(null=True, blank=True)
+    aging_bucket = models.CharField(max_length=5, choices=AGING_BUCKET_CHOICES, blank=True)
+
+    # Bumped on every write to the project or its children (projects.versions)
+    version = models.PositiveBigIntegerField(default=1, editable=False)
+
+    # Kept up to date with UPDATEs elsewhere; a full save() leaves them alone
+    MAINTAINED_FIELDS = ['spent_budget', 'is_overdue', 'overdue_since', 'aging_bucket', 'version']
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_overdue', 'aging_bucket'], name='project_overdue_idx'),
+        ]
     
     def __str__(self):
         return f"{self.project_id} - {self.title}"
@@ -164,20 +188,22 @@ class Project(models.Model):
         # Generate project ID if not set
         if not self.project_id:
             self.project_id = self.generate_project_id()
+        # spent_budget (projects.certificates) and the overdue flags (projects.overdue)
+        # are maintained with UPDATEs, so a full save of a loaded project must not write them back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.MAINTAINED_FIELDS]
         super().save(*args, **kwargs)
     
     def generate_project_id(self):
-        year = timezone.now().year
-        count = Project.objects.filter(
-            project_id__startswith=f"NPA-ENG-{year}-"
-        ).count() + 1
-        return f"NPA-ENG-{year}-{count:03d}"
-    
-    @property
-    def is_overdue(self):
-        if self.status == 'in_progress' and self.approved_end_date:
-            return timezone.now().date() > self.approved_end_date
-        return False
+        # Next after the highest suffix this year, so IDs freed by deletions are not reissued;
+        # the longest ID sorts last once suffixes outgrow three digits
+        prefix = f"NPA-ENG-{timezone.now().year}-"
+        last = (Project.objects.filter(project_id__startswith=prefix)
+                .order_by(Length('project_id').desc(), '-project_id')
+                .values_list('project_id', flat=True).first())
+        number = int(last[len(prefix):]) + 1 if last and last[len(prefix):].isdigit() else 1
+        return f"{prefix}{number:03d}"
     
     @property
     def progress_percentage(self):
@@ -257,13 +283,80 @@ class ProjectStage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Set by the nightly overdue job
+    is_overdue = models.BooleanField(default=False)
+    overdue_since = models.DateField(null=True, blank=True)
+    aging_bucket = models.CharField(max_length=5, choices=AGING_BUCKET_CHOICES, blank=True)
+    
     class Meta:
         ordering = ['order']
         unique_together = ['project', 'stage_type']
+        indexes = [
+            models.Index(fields=['is_overdue', 'aging_bucket'], name='stage_overdue_idx'),
+        ]
     
     def __str__(self):
         return f"{self.project.project_id} - {self.get_stage_type_display()}"
 
+# Stage Transition Log (append-only)
+class StageTransition(models.Model):
+    """One row per status change of a ProjectStage. Rows are never updated."""
+    stage = models.ForeignKey(ProjectStage, on_delete=models.CASCADE, related_name='transitions')
+    project = models.ForeignKey('Project', on_delete=models.CASCADE, related_name='stage_transitions')
+    stage_type = models.CharField(max_length=50, choices=ProjectStage.STAGE_CHOICES)
+    from_status = models.CharField(max_length=20, choices=ProjectStage.STATUS_CHOICES, blank=True)
+    to_status = models.CharField(max_length=20, choices=ProjectStage.STATUS_CHOICES)
+    
+    # Copied from the project so portfolio reports never join back to it
+    department = models.CharField(max_length=50, choices=DEPARTMENT_CHOICES)
+    location = models.CharField(max_length=50, choices=PORT_LOCATION_CHOICES)
+    
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='stage_transitions')
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['changed_at', 'id']
+        indexes = [
+            # Covers the LEAD() window over each stage's history
+            models.Index(
+                fields=['stage', 'changed_at', 'id'],
+                include=['to_status', 'stage_type', 'department', 'location'],
+                name='stagetrans_stage_cover_idx',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.stage} - {self.from_status or 'new'} -> {self.to_status}"
+    
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Stage transitions are append-only")
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def from_stage(cls, stage, previous_status='', user=None):
+        project = stage.project
+        return cls(
+            stage=stage,
+            project=project,
+            stage_type=stage.stage_type,
+            from_status=previous_status or '',
+            to_status=stage.status,
+            department=project.department,
+            location=project.location,
+            changed_by=user,
+        )
+    
+    @classmethod
+    def record(cls, stage, previous_status, user=None):
+        """Log a stage status change. Does nothing if the status is unchanged."""
+        if previous_status == stage.status:
+            return None
+        transition = cls.from_stage(stage, previous_status, user)
+        transition.save()
+        return transition
+
 # Progress Report Model
 class ProgressReport(models.Model):
     report_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -319,8 +412,19 @@ class ProjectDocument(models.Model):
     uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
+    # PDFs rendered from a finalized certificate or BEME (see projects/artefacts.py)
+    source_key = models.CharField(max_length=100, blank=True, default='', editable=False,
+                                  help_text="What the document was rendered from, e.g. certificate:<uuid>")
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+    is_stale = models.BooleanField(default=False, editable=False,
+                                   help_text="The source changed since the document was rendered")
+    
     class Meta:
         ordering = ['-uploaded_at']
+        constraints = [
+            models.UniqueConstraint(fields=['source_key'], condition=~models.Q(source_key=''),
+                                    name='projectdocument_source_uniq'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.project.project_id}"
@@ -340,6 +444,8 @@ class Budget(models.Model):
     year = models.IntegerField()
     budget_type = models.CharField(max_length=20, choices=BUDGET_TYPE_CHOICES)
     total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    # Bumped on every write to the budget, its items or allocations (projects.versions)
+    version = models.PositiveBigIntegerField(default=1, editable=False)
     
     # Metadata
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
@@ -351,6 +457,13 @@ class Budget(models.Model):
     
     def __str__(self):
         return f"{self.budget_code} - {self.budget_head} ({self.get_department_display()})"
+    
+    def save(self, *args, **kwargs):
+        # version is bumped with UPDATEs, so a loaded budget must not write it back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'version']
+        super().save(*args, **kwargs)
 
 class BudgetItem(models.Model):
     item_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -469,6 +582,65 @@ class ProjectNomination(models.Model):
             self.nominator_office = self.nominated_by.get_office_display()
         super().save(*args, **kwargs)
 
+# Payment certificate figures as query expressions
+MONEY = models.DecimalField(max_digits=15, decimal_places=2)
+
+
+def certificate_figures(prefix=''):
+    """
+    The payment certificate formulas as ORM expressions, keyed by the
+    PaymentCertificate property they mirror. ``prefix`` lets other querysets
+    reach them through a relation, e.g. ``'payment_certificates__'`` from
+    Project.
+    """
+    def field(name):
+        return models.F(prefix + name)
+
+    def money(expression):
+        return models.ExpressionWrapper(expression, output_field=MONEY)
+
+    contract_sum = Coalesce(field('project__contract_sum'), models.Value(Decimal('0')), output_field=MONEY)
+    total_value_works = money(field('cost_of_escalation') + field('materials_on_site'))
+    retention_amount = money(field('work_completed_to_date') * field('retention_rate') / models.Value(Decimal('100')))
+    total_net_payment = money(field('work_completed_to_date') + total_value_works -
+                              retention_amount + field('fluctuation_claims'))
+    total_net_amount_payable = money(total_net_payment - field('refund_advance_payment'))
+
+    return {
+        'contract_sum': contract_sum,
+        'estimated_total_cost': money(contract_sum - field('contingencies') -
+                                      field('estimated_omission') + field('estimated_addition')),
+        'total_value_works': total_value_works,
+        'retention_amount': retention_amount,
+        'total_net_payment': total_net_payment,
+        'total_net_amount_payable': total_net_amount_payable,
+        'amount_now_payable': money(total_net_amount_payable - field('amount_previously_certified')),
+    }
+
+
+class PaymentCertificateQuerySet(models.QuerySet):
+    def with_figures(self, *names):
+        """Annotate the computed figures (all of them unless names are given)"""
+        figures = certificate_figures()
+        return self.annotate(**{name: figures[name] for name in names or figures})
+    
+    def figure_totals(self, *names):
+        """Sum the computed figures over the queryset in one query"""
+        figures = certificate_figures()
+        return self.aggregate(**{name: Coalesce(models.Sum(figures[name]), models.Value(Decimal('0')), output_field=MONEY)
+                                 for name in names or figures})
+
+
+class figure(property):
+    """A computed certificate figure that uses the with_figures() annotation when present."""
+    def __get__(self, instance, owner=None):
+        if instance is not None and self.fget.__name__ in instance.__dict__:
+            return instance.__dict__[self.fget.__name__]
+        return super().__get__(instance, owner)
+    
+    def __set__(self, instance, value):
+        instance.__dict__[self.fget.__name__] = value
+
 # projects/models.py
 class PaymentCertificate(models.Model):
     certificate_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -476,6 +648,8 @@ class PaymentCertificate(models.Model):
     stage = models.ForeignKey(ProjectStage, on_delete=models.CASCADE, related_name='payment_certificates')
     
     # Certificate info
+    sequence = models.PositiveIntegerField(default=0, editable=False,
+                                           help_text="Interim certificate number within the project")
     certificate_no = models.CharField(max_length=50)
     certificate_date = models.DateField()
     
@@ -491,52 +665,77 @@ class PaymentCertificate(models.Model):
     refund_advance_payment = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     amount_previously_certified = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     
-    # Calculated fields (can be properties instead of stored fields)
+    # Calculated fields are figures below; certificate_figures() has the SQL versions
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = PaymentCertificateQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-certificate_date']
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'sequence'], name='paymentcert_project_seq_uniq'),
+        ]
     
     def __str__(self):
         return f"{self.certificate_no} - {self.project.project_id}"
     
-    @property
+    def clear_figures(self):
+        """Drop with_figures() annotations so edited fields are recomputed"""
+        for name in certificate_figures():
+            self.__dict__.pop(name, None)
+    
+    @figure
     def contract_sum(self):
         return self.project.contract_sum or 0
     
-    @property
+    @figure
     def estimated_total_cost(self):
         """ESTIMATED TOTAL COST OF WORKS"""
         return (self.contract_sum - self.contingencies - 
                 self.estimated_omission + self.estimated_addition)
     
-    @property
+    @figure
     def total_value_works(self):
         """TOTAL VALUE OF WORKS AND MATERIALS ON SITE (4)"""
         return self.cost_of_escalation + self.materials_on_site
     
-    @property
+    @figure
     def retention_amount(self):
         """RETENTION AMOUNT (5)"""
         return self.work_completed_to_date * (self.retention_rate / 100)
     
-    @property
+    @figure
     def total_net_payment(self):
         """TOTAL NET PAYMENT (7)"""
         return (self.work_completed_to_date + self.total_value_works - 
                 self.retention_amount + self.fluctuation_claims)
     
-    @property
+    @figure
     def total_net_amount_payable(self):
         """TOTAL NET AMOUNT PAYABLE (9)"""
         return self.total_net_payment - self.refund_advance_payment
     
-    @property
+    @figure
     def amount_now_payable(self):
         """AMOUNT NOW PAYABLE (11)"""
         return self.total_net_amount_payable - self.amount_previously_certified
     
+class CertificateLedger(models.Model):
+    """
+    Running totals of a project's interim certificates, kept by
+    projects.certificates so issuing the next one never re-sums the rest.
+    certified_to_date equals the latest certificate's total net amount payable.
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='certificate_ledger')
+    last_sequence = models.PositiveIntegerField(default=0)
+    certified_to_date = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.project.project_id} - {self.last_sequence} certificate(s)"
+    
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     title = models.CharField(max_length=200)
@@ -546,7 +745,59 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_inbox_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} ({self.user})"
+
+
+class OutboundEmail(models.Model):
+    """
+    Email waiting to be sent by the send_outbox worker. Rows are written in the
+    same transaction as the event they report, so nothing is mailed for a
+    rolled-back approval and no request waits on the mail server.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='outbound_emails')
+    to_address = models.EmailField()
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+    link = models.CharField(max_length=500, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    # Earliest retry for queued rows; lease expiry for rows being sent
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} -> {self.to_address} ({self.status})"
+
+
+class NotificationCounter(models.Model):
+    """Per-user unread notification count, kept in step by projects.notifications"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='notification_counter')
+    unread_count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user} - {self.unread_count} unread"
 
 # Technical Review Committee Model
 class TechnicalReview(models.Model):
@@ -608,4 +859,108 @@ class BOQItem(models.Model):
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"{self.item_number} - {self.description[:50]}"
\ No newline at end of file
+        return f"{self.item_number} - {self.description[:50]}"
+
+class BEMESummary(models.Model):
+    """
+    Totals of a BOQ preparation stage's BEME, kept in step with its items by
+    projects.beme so listings and reports never load the line items.
+    """
+    stage = models.OneToOneField(ProjectStage, on_delete=models.CASCADE, primary_key=True,
+                                 related_name='beme_summary')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='beme_summaries')
+    item_count = models.PositiveIntegerField(default=0)
+    section_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    contingency = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    vat = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    grand_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'BEME summary'
+        verbose_name_plural = 'BEME summaries'
+    
+    def __str__(self):
+        return f"BEME {self.project.project_id} - {self.grand_total}"
+
+class BEMERow(models.Model):
+    """
+    One BOQ line's content, stored once however many BEME versions contain
+    it; the key is a SHA-256 of the content, see projects.snapshots.
+    """
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    section = models.CharField(max_length=100)
+    description = models.TextField()
+    quantity = models.DecimalField(max_digits=15, decimal_places=2)
+    unit = models.CharField(max_length=10, choices=BOQItem.UNIT_CHOICES)
+    rate = models.DecimalField(max_digits=15, decimal_places=2)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    notes = models.TextField(blank=True)
+    
+    class Meta:
+        verbose_name = 'BEME row'
+    
+    def __str__(self):
+        return f"{self.description[:50]} ({self.content_hash[:10]})"
+
+class BEMEVersion(models.Model):
+    """
+    A saved BEME, never changed afterwards. ``rows`` lists [item number,
+    BEMERow hash] in BEME order.
+    """
+    stage = models.ForeignKey(ProjectStage, on_delete=models.CASCADE, related_name='beme_versions')
+    number = models.PositiveIntegerField()
+    rows = models.JSONField(default=list)
+    content_hash = models.CharField(max_length=64)
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='beme_versions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['stage', '-number']
+        verbose_name = 'BEME version'
+        constraints = [
+            models.UniqueConstraint(fields=['stage', 'number'], name='unique_beme_version'),
+        ]
+    
+    def __str__(self):
+        return f"BEME v{self.number} - {self.stage}"
+
+class RateCatalogEntry(models.Model):
+    """
+    Rates paid for one BOQ description and unit, over all saved BOQs
+    (location '') and per project location, kept by projects.rates.
+    """
+    description_key = models.CharField(max_length=255, help_text="Lower-cased description with spacing and punctuation normalised")
+    description = models.TextField(help_text="Description as last written")
+    unit = models.CharField(max_length=10, choices=BOQItem.UNIT_CHOICES)
+    location = models.CharField(max_length=50, blank=True, choices=PORT_LOCATION_CHOICES)
+    uses = models.PositiveIntegerField(default=0, help_text="Number of BOQs with this item")
+    median_rate = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    last_rate = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    min_rate = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    max_rate = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name_plural = 'rate catalog entries'
+        constraints = [
+            models.UniqueConstraint(fields=['description_key', 'unit', 'location'], name='unique_rate_catalog_entry'),
+        ]
+    
+    def __str__(self):
+        return f"{self.description[:50]} ({self.unit}) - {self.median_rate}"
+
+class RateObservation(models.Model):
+    """The rate one BOQ stage gave a catalog entry"""
+    entry = models.ForeignKey(RateCatalogEntry, on_delete=models.CASCADE, related_name='observations')
+    stage = models.ForeignKey(ProjectStage, on_delete=models.CASCADE, related_name='rate_observations')
+    rate = models.DecimalField(max_digits=15, decimal_places=2)
+    observed_at = models.DateTimeField()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['entry', 'stage'], name='unique_rate_observation'),
+        ]
@@ -0,0 +1,108 @@
+# projects/money.py
+"""
+Naira amounts as figures and in words, for certificates, BEMEs, templates
+and exports.
+
+Everything works on Decimal: amounts are rounded half-up to the kobo and are
+never passed through float. Words for 0-999 are built once into a table, so
+an amount takes one lookup per group of three digits. Both formatters are
+cached, and format_amounts()/amounts_in_words() format a whole column,
+converting each distinct value once.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+
+CENT = Decimal('0.01')
+
+_ONES = ['', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine',
+         'Ten', 'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen',
+         'Seventeen', 'Eighteen', 'Nineteen']
+_TENS = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety']
+SCALES = ['', 'Thousand', 'Million', 'Billion', 'Trillion', 'Quadrillion']
+
+
+def _below_hundred(n):
+    if n < 20:
+        return _ONES[n]
+    return _TENS[n // 10] + (' ' + _ONES[n % 10] if n % 10 else '')
+
+
+def _below_thousand(n):
+    hundreds, rest = divmod(n, 100)
+    words = [f"{_ONES[hundreds]} Hundred"] if hundreds else []
+    if rest:
+        words.append(_below_hundred(rest))
+    return ' '.join(words)
+
+
+# Words for every number 0-999 ('' for 0)
+WORDS = tuple(_below_thousand(n) for n in range(1000))
+
+
+def integer_words(n):
+    """Words for a non-negative integer, e.g. 1002003 -> 'One Million Two Thousand Three'"""
+    if n < 1000:
+        return WORDS[n] or 'Zero'
+    groups = []
+    scale = 0
+    while n and scale < len(SCALES) - 1:
+        n, group = divmod(n, 1000)
+        if group:
+            groups.append(f"{WORDS[group]} {SCALES[scale]}".rstrip())
+        scale += 1
+    if n:  # beyond the largest scale: count in units of it
+        groups.append(f"{integer_words(n)} {SCALES[-1]}")
+    return ' '.join(reversed(groups))
+
+
+def to_decimal(value):
+    """``value`` as a Decimal rounded to the kobo; None and unparseable values are zero"""
+    if isinstance(value, float):
+        value = repr(value)  # the shortest decimal that round-trips, not the binary expansion
+    try:
+        return Decimal(value if value is not None else 0).quantize(CENT, rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError, ValueError):
+        return Decimal('0.00')
+
+
+@lru_cache(maxsize=4096)
+def _words(amount):
+    naira, kobo = divmod(abs(int(amount.scaleb(2))), 100)
+    words = f"{integer_words(naira)} Naira" if naira or not kobo else ''
+    if kobo:
+        words += f"{' ' if words else ''}{integer_words(kobo)} Kobo"
+    return f"{'Minus ' if amount < 0 else ''}{words} Only"
+
+
+def amount_in_words(value):
+    """e.g. 1250.5 -> 'One Thousand Two Hundred Fifty Naira Fifty Kobo Only'"""
+    return _words(to_decimal(value))
+
+
+@lru_cache(maxsize=8192)
+def _figures(amount):
+    return f"{amount:,.2f}"
+
+
+def format_amount(value):
+    """Thousands separators and two decimals, e.g. 1234567.891 -> '1,234,567.89'"""
+    return _figures(to_decimal(value))
+
+
+def format_currency(value):
+    return f"₦{format_amount(value)}"
+
+
+def _column(formatter, values):
+    seen = {}
+    return [seen[value] if value in seen else seen.setdefault(value, formatter(value)) for value in values]
+
+
+def format_amounts(values):
+    """format_amount() over a column, e.g. a BOQ's rates"""
+    return _column(format_amount, values)
+
+
+def amounts_in_words(values):
+    """amount_in_words() over a column"""
+    return _column(amount_in_words, values)
@@ -0,0 +1,122 @@
+# projects/notifications.py
+"""
+Notification fan-out and the per-user unread counters.
+
+Everything that notifies users goes through notify() or notify_each(), which
+write all rows with one bulk_create and bump NotificationCounter in the same
+transaction, so the unread badge never needs a COUNT over Notification.
+Users with an email address also get the notification queued in the outbox,
+and users with a live stream open get it pushed once the transaction commits.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Notification, NotificationCounter
+from . import outbox, live
+
+PAGE_SIZE = 20
+
+
+def _user_id(user):
+    return user.pk if hasattr(user, 'pk') else user
+
+
+def _bump(counts):
+    """Add {user_id: n} to the users' unread counters"""
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id) for user_id in counts],
+        ignore_conflicts=True,
+    )
+    # One UPDATE per distinct increment, usually just one
+    by_amount = {}
+    for user_id, n in counts.items():
+        by_amount.setdefault(n, []).append(user_id)
+    for n, user_ids in by_amount.items():
+        NotificationCounter.objects.filter(user_id__in=user_ids).update(unread_count=F('unread_count') + n)
+
+
+@transaction.atomic
+def notify_each(notifications):
+    """Save unsaved Notification instances in one INSERT"""
+    notifications = [n for n in notifications if n.user_id]
+    if not notifications:
+        return []
+    created = Notification.objects.bulk_create(notifications)
+    _bump(Counter(n.user_id for n in notifications))
+    if getattr(settings, 'NOTIFICATION_EMAILS', True):
+        outbox.queue(created)
+    live.notifications_created(created)
+    return created
+
+
+def notify(users, title, message, link=''):
+    """Send the same notification to every user"""
+    return notify_each([
+        Notification(user_id=_user_id(user), title=title, message=message, link=link)
+        for user in {_user_id(user) for user in users}
+    ])
+
+
+@transaction.atomic
+def mark_read(user, notification_id):
+    """Mark one notification read; returns False if it was not unread"""
+    updated = Notification.objects.filter(user=user, pk=notification_id, is_read=False).update(is_read=True)
+    if updated:
+        NotificationCounter.objects.filter(user=user).update(unread_count=F('unread_count') - updated)
+        live.counts_changed([user.pk])
+    return bool(updated)
+
+
+@transaction.atomic
+def mark_all_read(user):
+    """Mark every unread notification read with a single UPDATE"""
+    updated = Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+    if updated:
+        # Only what this UPDATE saw: a notification created meanwhile stays counted
+        NotificationCounter.objects.filter(user=user).update(unread_count=F('unread_count') - updated)
+        live.counts_changed([user.pk])
+    return updated
+
+
+def unread_count(user):
+    counter = NotificationCounter.objects.filter(user=user).only('unread_count').first()
+    return counter.unread_count if counter else 0
+
+
+def page(user, before=None, size=PAGE_SIZE):
+    """
+    One page of the user's notifications, newest first, starting after the
+    notification ``before``. Keyset pagination on (created_at, id) keeps every
+    page a single range scan of notification_inbox_idx however deep it is.
+    Returns (notifications, cursor for the next page or None).
+    """
+    notifications = Notification.objects.filter(user=user)
+    if before:
+        anchor = Notification.objects.filter(user=user, pk=before).values('created_at', 'pk').first()
+        if anchor:
+            notifications = notifications.filter(
+                Q(created_at__lt=anchor['created_at']) |
+                Q(created_at=anchor['created_at'], pk__lt=anchor['pk'])
+            )
+    rows = list(notifications.order_by('-created_at', '-id')[:size + 1])
+    cursor = rows[size - 1].pk if len(rows) > size else None
+    return rows[:size], cursor
+
+
+@transaction.atomic
+def rebuild_counters():
+    """Recount unread notifications for every user"""
+    unread = dict(
+        Notification.objects.filter(is_read=False).values('user_id')
+        .annotate(n=Count('id')).values_list('user_id', 'n')
+    )
+    NotificationCounter.objects.exclude(user_id__in=unread).update(unread_count=0)
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id) for user_id in unread],
+        ignore_conflicts=True,
+    )
+    for user_id, count in unread.items():
+        NotificationCounter.objects.filter(user_id=user_id).update(unread_count=count)
@@ -0,0 +1,138 @@
+# projects/outbox.py
+"""
+Transactional email outbox.
+
+notifications.notify_each() calls queue() so every notification that has an
+email recipient also gets an OutboundEmail row in the same transaction. The
+send_outbox command calls drain(), which claims due rows in batches, folds
+several rows for one recipient into a single digest and sends the batch over
+one SMTP connection. Failures are retried with exponential backoff.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import User, OutboundEmail
+
+BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 100)
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 6)
+BACKOFF_SECONDS = getattr(settings, 'OUTBOX_BACKOFF_SECONDS', 60)
+# Emails wait this long before their first send so a burst for one user goes out as a digest
+DIGEST_DELAY = timedelta(seconds=getattr(settings, 'OUTBOX_DIGEST_SECONDS', 60))
+# How long a worker may hold claimed rows before another may retry them
+LEASE = timedelta(minutes=10)
+
+
+def queue(notifications):
+    """Add an email for each notification whose user has an address"""
+    addresses = dict(
+        User.objects.filter(pk__in={n.user_id for n in notifications}, is_active=True)
+        .exclude(email='').values_list('pk', 'email')
+    )
+    send_after = timezone.now() + DIGEST_DELAY
+    return OutboundEmail.objects.bulk_create([
+        OutboundEmail(
+            user_id=notification.user_id,
+            to_address=addresses[notification.user_id],
+            subject=notification.title,
+            body=notification.message,
+            link=notification.link,
+            next_attempt_at=send_after,
+        )
+        for notification in notifications
+        if notification.user_id in addresses
+    ])
+
+
+def backoff(attempts):
+    """Delay before retry number ``attempts``: 1, 2, 4, ... minutes, capped at a day"""
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), 86400))
+
+
+@transaction.atomic
+def _claim(batch_size):
+    """Mark a batch of due rows as sending and return them"""
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(
+        Q(status='queued') | Q(status='sending'),  # 'sending' past its lease was abandoned
+        next_attempt_at__lte=now,
+    ).select_related('user').order_by('next_attempt_at', 'id')
+    if connection.features.has_select_for_update_skip_locked:
+        due = due.select_for_update(skip_locked=True, of=('self',))
+    rows = list(due[:batch_size])
+    OutboundEmail.objects.filter(pk__in=[row.pk for row in rows]).update(
+        status='sending', next_attempt_at=now + LEASE,
+    )
+    return rows
+
+
+def _site_url(link):
+    return getattr(settings, 'SITE_URL', '').rstrip('/') + link if link else ''
+
+
+def _messages(rows):
+    """One message per recipient: the email itself, or a digest of several"""
+    by_address = {}
+    for row in rows:
+        by_address.setdefault(row.to_address, []).append(row)
+
+    for address, group in by_address.items():
+        items = [{'subject': row.subject, 'body': row.body, 'url': _site_url(row.link)} for row in group]
+        context = {'user': group[0].user, 'items': items}
+        if len(group) == 1:
+            subject = group[0].subject
+            body = render_to_string('emails/notification.txt', context)
+        else:
+            subject = f"{len(group)} new notifications"
+            body = render_to_string('emails/digest.txt', context)
+        yield group, EmailMessage(subject=subject, body=body, to=[address])
+
+
+def _failed(rows, error):
+    now = timezone.now()
+    for row in rows:
+        attempts = row.attempts + 1
+        OutboundEmail.objects.filter(pk=row.pk).update(
+            status='queued' if attempts < MAX_ATTEMPTS else 'failed',
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + backoff(attempts),
+            last_error=str(error)[:1000],
+        )
+
+
+def drain(batch_size=BATCH_SIZE):
+    """
+    Send one batch of due emails over a single SMTP connection.
+    Returns (rows sent, rows that will be retried or have failed).
+    """
+    rows = _claim(batch_size)
+    if not rows:
+        return 0, 0
+
+    sent, failed = [], []
+    try:
+        with get_connection(fail_silently=False) as mail:
+            for group, message in _messages(rows):
+                message.connection = mail
+                try:
+                    message.send()
+                except Exception as e:
+                    _failed(group, e)
+                    failed += group
+                else:
+                    sent += group
+    except Exception as e:
+        # Could not open (or cleanly close) the connection
+        unsent = [row for row in rows if row not in sent and row not in failed]
+        _failed(unsent, e)
+        failed += unsent
+
+    OutboundEmail.objects.filter(pk__in=[row.pk for row in sent]).update(
+        status='sent', sent_at=timezone.now(), last_error='',
+    )
+    return len(sent), len(failed)
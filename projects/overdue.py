@@ -0,0 +1,85 @@
+# projects/overdue.py
+"""
+Overdue flags and aging buckets for projects and stages.
+
+flag_overdue() runs nightly from the jobs worker. It rewrites the stored flags
+with a handful of set-based UPDATEs, so overdue filters and counts everywhere
+else are index lookups on (is_overdue, aging_bucket). Items that became
+overdue in this run are reported to their owners, one notification each.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Project, ProjectStage, Notification
+from . import notifications
+
+# Item still open whose deadline has passed
+PROJECT_OVERDUE = Q(status='in_progress', approved_end_date__isnull=False)
+STAGE_OVERDUE = Q(due_date__isnull=False) & ~Q(status='completed') & ~Q(project__status__in=['completed', 'cancelled'])
+
+
+def _bucket(deadline, today):
+    return Case(
+        When(**{f'{deadline}__gte': today - timedelta(days=7)}, then=Value('0-7')),
+        When(**{f'{deadline}__gte': today - timedelta(days=30)}, then=Value('8-30')),
+        default=Value('30+'),
+    )
+
+
+def _flag(queryset, overdue, deadline, today):
+    """Clear items no longer overdue, flag the rest; return the newly overdue ones"""
+    overdue = overdue & Q(**{f'{deadline}__lt': today})
+    queryset.filter(is_overdue=True).exclude(overdue).update(is_overdue=False, overdue_since=None, aging_bucket='')
+
+    late = queryset.filter(overdue)
+    newly = list(late.filter(is_overdue=False))
+    late.update(
+        is_overdue=True,
+        overdue_since=Coalesce('overdue_since', Value(today)),
+        aging_bucket=_bucket(deadline, today),
+    )
+    return newly
+
+
+def _notify_owners(projects, stages):
+    """One notification per owner listing everything that just became overdue"""
+    by_owner = {}
+    for project in projects:
+        owner = project.project_manager_id or project.created_by_id
+        by_owner.setdefault(owner, []).append(
+            f"Project {project.project_id} (due {project.approved_end_date:%d %b %Y})")
+    for stage in stages:
+        owner = stage.assigned_to_id or stage.project.project_manager_id or stage.project.created_by_id
+        by_owner.setdefault(owner, []).append(
+            f"{stage.get_stage_type_display()} on {stage.project_id} (due {stage.due_date:%d %b %Y})")
+
+    notifications.notify_each([
+        Notification(
+            user_id=owner,
+            title=f"{len(items)} item(s) now overdue",
+            message="The following are past their due date:\n" + "\n".join(items),
+            link=reverse('project_list'),
+        )
+        for owner, items in by_owner.items() if owner
+    ])
+
+
+@transaction.atomic
+def flag_overdue(today=None):
+    today = today or timezone.localdate()
+    new_projects = _flag(
+        Project.objects.only('project_id', 'approved_end_date', 'project_manager', 'created_by'),
+        PROJECT_OVERDUE, 'approved_end_date', today,
+    )
+    new_stages = _flag(
+        ProjectStage.objects.select_related('project').only(
+            'stage_type', 'due_date', 'assigned_to', 'project__project_manager', 'project__created_by'),
+        STAGE_OVERDUE, 'due_date', today,
+    )
+    _notify_owners(new_projects, new_stages)
+    return {'projects': len(new_projects), 'stages': len(new_stages)}
@@ -5,87 +5,63 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.units import inch, cm
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from reportlab.pdfgen import canvas
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 import os
 from django.conf import settings
 import tempfile
 from decimal import Decimal
 from datetime import datetime
+from functools import lru_cache
+from .money import amount_in_words, format_amount, format_amounts
 
-def generate_boq_pdf(project, stage, boq_items, form_data):
-    """Generate BOQ/BEME PDF document"""
-    
-    # Create temporary file
-    temp_dir = tempfile.mkdtemp()
-    filename = f"BOQ_{project.project_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    filepath = os.path.join(temp_dir, filename)
-    
-    # Create document with landscape orientation for wide tables
-    doc = SimpleDocTemplate(
-        filepath,
-        pagesize=landscape(A4),
-        rightMargin=0.5*inch,
-        leftMargin=0.5*inch,
-        topMargin=0.5*inch,
-        bottomMargin=0.5*inch
-    )
-    
-    # Register fonts
-    try:
-        pdfmetrics.registerFont(TTFont('Helvetica', 'Helvetica.ttf'))
-        pdfmetrics.registerFont(TTFont('Helvetica-Bold', 'Helvetica-Bold.ttf'))
-    except:
-        pass  # Use default fonts
-    
-    # Create styles
+@lru_cache(maxsize=None)
+def _boq_styles():
+    """Paragraph styles for the BEME, shared by every document this process renders"""
     styles = getSampleStyleSheet()
     
-    # Custom styles
-    title_style = ParagraphStyle(
+    styles.add(ParagraphStyle(
         'CustomTitle',
         parent=styles['Heading1'],
         fontSize=16,
         alignment=TA_CENTER,
         spaceAfter=12,
         fontName='Helvetica-Bold'
-    )
+    ))
     
-    subtitle_style = ParagraphStyle(
+    styles.add(ParagraphStyle(
         'CustomSubtitle',
         parent=styles['Heading2'],
         fontSize=12,
         alignment=TA_CENTER,
         spaceAfter=6,
         fontName='Helvetica'
-    )
+    ))
     
-    header_style = ParagraphStyle(
+    styles.add(ParagraphStyle(
         'TableHeader',
         parent=styles['Normal'],
         fontSize=9,
         alignment=TA_CENTER,
         fontName='Helvetica-Bold',
         textColor=colors.white
-    )
+    ))
     
-    cell_style = ParagraphStyle(
+    styles.add(ParagraphStyle(
         'TableCell',
         parent=styles['Normal'],
         fontSize=8,
         alignment=TA_LEFT,
         fontName='Helvetica'
-    )
+    ))
     
-    amount_style = ParagraphStyle(
+    styles.add(ParagraphStyle(
         'AmountCell',
         parent=styles['Normal'],
         fontSize=8,
         alignment=TA_RIGHT,
         fontName='Helvetica'
-    )
+    ))
     
-    section_style = ParagraphStyle(
+    styles.add(ParagraphStyle(
         'SectionHeader',
         parent=styles['Normal'],
         fontSize=9,
@@ -93,8 +69,41 @@ def generate_boq_pdf(project, stage, boq_items, form_data):
         fontName='Helvetica-Bold',
         backColor=colors.lightgrey,
         textColor=colors.black
+    ))
+    
+    styles.add(ParagraphStyle('WordsStyle', parent=styles['Normal'], fontSize=9))
+    styles.add(ParagraphStyle('Disclaimer', parent=styles['Normal'], fontSize=8, alignment=TA_CENTER))
+    return styles
+
+def generate_boq_pdf(project, stage, boq_items, form_data, output=None):
+    """Generate BOQ/BEME PDF document, into ``output`` (a file object) if given"""
+    
+    if output is None:
+        # Create temporary file
+        temp_dir = tempfile.mkdtemp()
+        filename = f"BOQ_{project.project_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        filepath = os.path.join(temp_dir, filename)
+    
+    # Create document with landscape orientation for wide tables
+    doc = SimpleDocTemplate(
+        output or filepath,
+        pagesize=landscape(A4),
+        rightMargin=0.5*inch,
+        leftMargin=0.5*inch,
+        topMargin=0.5*inch,
+        bottomMargin=0.5*inch,
+        invariant=output is not None,  # same content, same bytes
     )
     
+    # Styles are built once per process; Helvetica is a built-in PDF font
+    styles = _boq_styles()
+    title_style = styles['CustomTitle']
+    subtitle_style = styles['CustomSubtitle']
+    header_style = styles['TableHeader']
+    cell_style = styles['TableCell']
+    amount_style = styles['AmountCell']
+    section_style = styles['SectionHeader']
+    
     # Build story
     story = []
     
@@ -186,18 +195,21 @@ def generate_boq_pdf(project, stage, boq_items, form_data):
         ])
         row_index += 1
         
-        # Add items in this section
+        # Add items in this section, formatting each figure column at once
+        amounts = [item.quantity * item.rate for item in items]
+        quantities = format_amounts(item.quantity for item in items)
+        rates = format_amounts(item.rate for item in items)
+        amount_figures = format_amounts(amounts)
         for idx, item in enumerate(items, 1):
-            amount = item.quantity * item.rate
-            section_total += amount
+            section_total += amounts[idx - 1]
             
             table_data.append([
                 Paragraph(str(idx), cell_style),
                 Paragraph(item.description, cell_style),
-                Paragraph(f"{item.quantity:,.2f}", amount_style),
+                Paragraph(quantities[idx - 1], amount_style),
                 Paragraph(item.unit.upper(), cell_style),
-                Paragraph(f"{item.rate:,.2f}", amount_style),
-                Paragraph(f"{amount:,.2f}", amount_style),
+                Paragraph(rates[idx - 1], amount_style),
+                Paragraph(amount_figures[idx - 1], amount_style),
                 Paragraph(item.notes or "", cell_style),
             ])
             row_index += 1
@@ -212,7 +224,7 @@ def generate_boq_pdf(project, stage, boq_items, form_data):
             Paragraph("", cell_style),
             Paragraph("", cell_style),
             Paragraph("", cell_style),
-            Paragraph(f"<b>{section_total:,.2f}</b>", amount_style),
+            Paragraph(f"<b>{format_amount(section_total)}</b>", amount_style),
             Paragraph("", cell_style),
         ])
         row_index += 1
@@ -273,10 +285,10 @@ def generate_boq_pdf(project, stage, boq_items, form_data):
     
     summary_data = [
         ["SUMMARY", "AMOUNT (₦)"],
-        ["Total Cost of Works:", f"{grand_total:,.2f}"],
-        [f"Contingency ({contingency_percent}%):", f"{contingency:,.2f}"],
-        [f"VAT ({vat_percent}%):", f"{vat:,.2f}"],
-        ["<b>GRAND TOTAL:</b>", f"<b>{grand_total_with_taxes:,.2f}</b>"],
+        ["Total Cost of Works:", format_amount(grand_total)],
+        [f"Contingency ({contingency_percent}%):", format_amount(contingency)],
+        [f"VAT ({vat_percent}%):", format_amount(vat)],
+        ["<b>GRAND TOTAL:</b>", f"<b>{format_amount(grand_total_with_taxes)}</b>"],
     ]
     
     summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
@@ -299,9 +311,9 @@ def generate_boq_pdf(project, stage, boq_items, form_data):
     story.append(Spacer(1, 0.2*inch))
     
     # Amount in words
-    amount_words = number_to_words(grand_total_with_taxes)
+    amount_words = amount_in_words(grand_total_with_taxes)
     words_para = Paragraph(f"<b>Amount in Words:</b> {amount_words}", 
-                          ParagraphStyle('WordsStyle', parent=styles['Normal'], fontSize=9))
+                          styles['WordsStyle'])
     story.append(words_para)
     
     # Footer
@@ -311,7 +323,7 @@ def generate_boq_pdf(project, stage, boq_items, form_data):
         ["_________________________", "_________________________", "_________________________"],
         ["Prepared By", "Reviewed By", "Approved By"],
         [form_data.get('prepared_by', ''), form_data.get('reviewed_by', ''), form_data.get('approved_by', '')],
-        ["", "", f"Date: {datetime.now().strftime('%d-%m-%Y')}"],
+        ["", "", f"Date: {form_data.get('boq_date', datetime.now().strftime('%d-%m-%Y'))}"],
     ]
     
     footer_table = Table(footer_data, colWidths=[doc.width/3]*3)
@@ -326,7 +338,7 @@ def generate_boq_pdf(project, stage, boq_items, form_data):
     # Disclaimer
     disclaimer = Paragraph(
         "<i>This is a computer-generated document. No signature is required.</i>",
-        ParagraphStyle('Disclaimer', parent=styles['Normal'], fontSize=8, alignment=TA_CENTER)
+        styles['Disclaimer']
     )
     story.append(Spacer(1, 0.2*inch))
     story.append(disclaimer)
@@ -334,51 +346,10 @@ def generate_boq_pdf(project, stage, boq_items, form_data):
     # Build PDF
     doc.build(story)
     
+    if output is not None:
+        return output
     return filepath, filename
 
-def number_to_words(num):
-    """Convert number to words (Nigerian format)"""
-    if isinstance(num, Decimal):
-        num = float(num)
-    
-    import math
-    
-    def convert_to_words(n):
-        ones = ["", "One", "Two", "Three", "Four", "Five", "Six", "Seven", "Eight", "Nine", 
-                "Ten", "Eleven", "Twelve", "Thirteen", "Fourteen", "Fifteen", "Sixteen", 
-                "Seventeen", "Eighteen", "Nineteen"]
-        tens = ["", "", "Twenty", "Thirty", "Forty", "Fifty", "Sixty", "Seventy", "Eighty", "Ninety"]
-        
-        if n < 20:
-            return ones[n]
-        elif n < 100:
-            return tens[n // 10] + (" " + ones[n % 10] if n % 10 != 0 else "")
-        elif n < 1000:
-            return ones[n // 100] + " Hundred" + (" " + convert_to_words(n % 100) if n % 100 != 0 else "")
-        elif n < 1000000:
-            return convert_to_words(n // 1000) + " Thousand" + (" " + convert_to_words(n % 1000) if n % 1000 != 0 else "")
-        elif n < 1000000000:
-            return convert_to_words(n // 1000000) + " Million" + (" " + convert_to_words(n % 1000000) if n % 1000000 != 0 else "")
-        else:
-            return convert_to_words(n // 1000000000) + " Billion" + (" " + convert_to_words(n % 1000000000) if n % 1000000000 != 0 else "")
-    
-    # Separate naira and kobo
-    naira = int(num)
-    kobo = int(round((num - naira) * 100))
-    
-    words = ""
-    if naira > 0:
-        words = convert_to_words(naira) + " Naira"
-    if kobo > 0:
-        if words:
-            words += " "
-        words += convert_to_words(kobo) + " Kobo"
-    
-    if not words:
-        words = "Zero Naira"
-    
-    return words + " Only"
-
 def add_page_number(canvas, doc):
     """Add page numbers to PDF"""
     page_num = canvas.getPageNumber()
@@ -0,0 +1,193 @@
+# projects/rates.py
+"""
+The rate catalog: what past BOQs paid for each item, for the BEME editor's
+rate suggestions.
+
+Descriptions are normalised (lower case, punctuation and spacing collapsed)
+so "Excavation, in firm soil" and "excavation in firm soil " are one item.
+Each saved BOQ stage records one RateObservation per catalog entry it uses,
+both for all locations (location '') and for its project's location. When
+a BEME is saved again its observations are replaced, and the median, last,
+lowest and highest rates of the entries it touches are recomputed, so the
+catalog grows incrementally and never counts a BOQ twice.
+
+On PostgreSQL suggestions are matched by trigram word similarity against a
+GIN (gin_trgm_ops) index on the description key, which stays fast at a
+million historical lines; elsewhere they fall back to substring search.
+"""
+import re
+import statistics
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from jobs.queue import enqueue
+from .models import BOQItem, ProjectStage, RateCatalogEntry, RateObservation
+from .money import to_decimal
+
+MIN_QUERY_LENGTH = 3
+_separators = re.compile(r'[\W_]+')
+
+
+def normalize(description):
+    """Catalog key for a description, e.g. 'Excavation, in  firm soil.' -> 'excavation in firm soil'"""
+    key = _separators.sub(' ', description or '').strip().lower()
+    return key[:RateCatalogEntry._meta.get_field('description_key').max_length].rstrip()
+
+
+def record_stage(stage_id):
+    """Replace a BOQ stage's observations with its current items; returns the number recorded"""
+    location = ProjectStage.objects.filter(pk=stage_id).values_list('project__location', flat=True).first()
+    if location is None:  # the stage was deleted; its observations went with it
+        return 0
+
+    # The last line wins when a BOQ repeats an item
+    latest = {}
+    items = (BOQItem.objects.filter(project_stage_id=stage_id).order_by('order', 'item_number')
+             .values_list('description', 'unit', 'rate'))
+    for description, unit, rate in items:
+        key = normalize(description)
+        if key and rate and rate > 0:
+            latest[(key, unit)] = (' '.join(description.split()), rate)
+
+    now = timezone.now()
+    with transaction.atomic():
+        old = RateObservation.objects.filter(stage_id=stage_id)
+        affected = set(old.values_list('entry_id', flat=True))
+        old.delete()
+
+        descriptions, observations = {}, []
+        for (key, unit, _), entry in _entries(latest, location).items():
+            description, rate = latest[(key, unit)]
+            descriptions[entry.pk] = description
+            observations.append(RateObservation(entry=entry, stage_id=stage_id, rate=rate, observed_at=now))
+        RateObservation.objects.bulk_create(observations)
+        _refresh(affected | set(descriptions), descriptions)
+    return len(observations)
+
+
+def queue(stage_id):
+    """Record a stage in the background, once however many saves are waiting"""
+    enqueue('projects.record_rates', key=f"rates:{stage_id}", stage_id=stage_id)
+
+
+def _entries(latest, location):
+    """{(key, unit, location): entry} for every item, overall and at the location, created as needed"""
+    locations = {'', location}
+    wanted = {(key, unit, place) for key, unit in latest for place in locations}
+    if not wanted:
+        return {}
+
+    def existing():
+        entries = RateCatalogEntry.objects.filter(
+            description_key__in={key for key, unit in latest}, location__in=locations)
+        return {(e.description_key, e.unit, e.location): e for e in entries
+                if (e.description_key, e.unit, e.location) in wanted}
+
+    entries = existing()
+    missing = wanted - entries.keys()
+    if missing:
+        # Another BOQ may add the same entry meanwhile, so ignore conflicts and read back
+        RateCatalogEntry.objects.bulk_create(
+            [RateCatalogEntry(description_key=key, description=latest[(key, unit)][0], unit=unit, location=place)
+             for key, unit, place in missing],
+            ignore_conflicts=True,
+        )
+        entries = existing()
+    return entries
+
+
+def _refresh(entry_ids, descriptions=None):
+    """Recompute the statistics of these entries from their observations"""
+    descriptions = descriptions or {}
+    observed = {}
+    rows = (RateObservation.objects.filter(entry_id__in=entry_ids)
+            .order_by('entry_id', 'observed_at', 'pk').values_list('entry_id', 'rate', 'observed_at'))
+    for entry_id, rate, observed_at in rows:
+        observed.setdefault(entry_id, []).append((rate, observed_at))
+
+    RateCatalogEntry.objects.filter(pk__in=set(entry_ids) - observed.keys()).delete()
+    entries = RateCatalogEntry.objects.in_bulk(list(observed))
+    for entry_id, entry in entries.items():
+        rates = [rate for rate, _ in observed[entry_id]]
+        entry.uses = len(rates)
+        entry.median_rate = to_decimal(statistics.median(rates))
+        entry.last_rate, entry.last_used_at = observed[entry_id][-1]
+        entry.min_rate = min(rates)
+        entry.max_rate = max(rates)
+        entry.description = descriptions.get(entry_id, entry.description)
+    RateCatalogEntry.objects.bulk_update(
+        entries.values(),
+        ['uses', 'median_rate', 'last_rate', 'last_used_at', 'min_rate', 'max_rate', 'description'],
+        batch_size=500,
+    )
+
+
+def suggest(query, unit=None, location=None, limit=10):
+    """
+    Catalog entries whose description matches ``query``, best first, each
+    with its statistics over all locations and, given a location, there.
+    """
+    key = normalize(query)
+    if len(key) < MIN_QUERY_LENGTH:
+        return []
+
+    entries = RateCatalogEntry.objects.filter(location='')
+    if unit:
+        entries = entries.filter(unit=unit)
+    if connection.vendor == 'postgresql':
+        ids = _similar_ids(key, unit, limit)
+        found = entries.in_bulk(ids)
+        matches = [found[pk] for pk in ids if pk in found]
+    else:
+        matches = list(entries.filter(description_key__contains=key).order_by('-uses', 'description_key')[:limit])
+
+    local = {}
+    if location and matches:
+        for entry in RateCatalogEntry.objects.filter(
+                location=location, description_key__in=[match.description_key for match in matches]):
+            local[(entry.description_key, entry.unit)] = entry
+    return [
+        {
+            'description': match.description,
+            'unit': match.unit,
+            **_statistics(match),
+            'location': _statistics(local[(match.description_key, match.unit)])
+            if (match.description_key, match.unit) in local else None,
+        }
+        for match in matches
+    ]
+
+
+def _similar_ids(key, unit, limit):
+    # <% is word similarity: the typed words against any part of the
+    # description, so a few letters find long descriptions; it uses the
+    # trigram index created in migration 0020
+    table = RateCatalogEntry._meta.db_table
+    unit_filter = 'AND unit = %s' if unit else ''
+    params = [key] + ([unit] if unit else []) + [key, limit]
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            SELECT id FROM {table}
+            WHERE location = '' AND %s <%% description_key {unit_filter}
+            ORDER BY word_similarity(%s, description_key) DESC, uses DESC
+            LIMIT %s
+        ''', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _statistics(entry):
+    return {
+        'uses': entry.uses,
+        'median_rate': entry.median_rate,
+        'last_rate': entry.last_rate,
+        'min_rate': entry.min_rate,
+        'max_rate': entry.max_rate,
+        'last_used_at': entry.last_used_at,
+    }
+
+
+def rebuild():
+    """Record every BOQ stage with items, e.g. to build the catalog from existing BOQs"""
+    stage_ids = BOQItem.objects.order_by().values_list('project_stage_id', flat=True).distinct()
+    return sum(record_stage(stage_id) for stage_id in list(stage_ids))
@@ -0,0 +1,25 @@
+# projects/render_pool.py
+"""
+Entry points for the PDF rendering processes used by batch exports.
+
+Worker processes are spawned, so they import this module before Django is
+set up; keep model imports inside the functions.
+"""
+import django
+
+
+def init():
+    django.setup()
+
+
+def render_chunk(source_keys):
+    """Render a chunk of documents; returns [(source_key, pdf bytes or None, error)]"""
+    from . import artefacts
+
+    results = []
+    for source_key in source_keys:
+        try:
+            results.append((source_key, artefacts.render(source_key), ''))
+        except Exception as e:
+            results.append((source_key, None, str(e) or e.__class__.__name__))
+    return results
@@ -0,0 +1,137 @@
+# projects/snapshots.py
+"""
+BEME versions: every save of a stage's BOQ items is kept as an immutable
+BEMEVersion, so reviewers can see what changed between any two saves.
+
+A BOQ line's content (section, description, quantity, unit, rate, notes) is
+hashed with SHA-256 and stored once as a BEMERow; a version is the ordered
+list of its lines' item numbers and hashes. Lines that did not change
+between saves are shared, so a save that edits three lines of a 5,000-line
+BEME adds three rows and one version.
+
+diff() compares two versions by joining on the hashes in dictionaries, in
+time linear in the number of lines: identical lines match on their hash,
+lines edited in place then match on section and description, and what is
+left was added or removed.
+"""
+import hashlib
+import json
+from collections import defaultdict, deque
+
+from .models import BEMERow, BEMEVersion, ProjectStage
+from .money import to_decimal
+from .rates import normalize
+
+COMPARED_FIELDS = ['item_number', 'description', 'quantity', 'unit', 'rate', 'amount', 'notes']
+
+
+def row_hash(section, description, quantity, unit, rate, notes):
+    content = [section, description, str(to_decimal(quantity)), unit, str(to_decimal(rate)), notes]
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+def record(stage, user=None):
+    """
+    Store the stage's current items as a new version, or return the latest
+    version if nothing changed since. Call inside the transaction that
+    saved the items.
+    """
+    # Lock the stage so concurrent saves get consecutive numbers
+    ProjectStage.objects.select_for_update().only('pk').get(pk=stage.pk)
+    items = stage.boq_items.order_by('order', 'item_number').values_list(
+        'item_number', 'section', 'description', 'quantity', 'unit', 'rate', 'amount', 'notes')
+
+    contents, entries, subtotal = {}, [], to_decimal(0)
+    for item_number, section, description, quantity, unit, rate, amount, notes in items:
+        content_hash = row_hash(section, description, quantity, unit, rate, notes)
+        contents.setdefault(content_hash, (section, description, quantity, unit, rate, amount, notes))
+        entries.append([item_number, content_hash])
+        subtotal += amount
+    content_hash = hashlib.sha256(json.dumps(entries).encode()).hexdigest()
+
+    latest = stage.beme_versions.order_by('-number').first()
+    if latest is not None and latest.content_hash == content_hash:
+        return latest
+
+    stored = set(BEMERow.objects.filter(pk__in=list(contents)).values_list('pk', flat=True))
+    BEMERow.objects.bulk_create([
+        BEMERow(content_hash=key, section=section, description=description, quantity=quantity, unit=unit,
+                rate=rate, amount=amount, notes=notes)
+        for key, (section, description, quantity, unit, rate, amount, notes) in contents.items()
+        if key not in stored
+    ], batch_size=500, ignore_conflicts=True)
+    return BEMEVersion.objects.create(
+        stage=stage,
+        number=latest.number + 1 if latest else 1,
+        rows=entries,
+        content_hash=content_hash,
+        item_count=len(entries),
+        subtotal=subtotal,
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def _line(item_number, row):
+    return {'item_number': item_number, 'section': row.section, 'description': row.description,
+            'quantity': row.quantity, 'unit': row.unit, 'rate': row.rate, 'amount': row.amount,
+            'notes': row.notes}
+
+
+def diff(old, new):
+    """
+    The lines of two versions as dicts with status 'unchanged', 'changed',
+    'added' or 'removed', 'old' and 'new' lines and the changed 'fields';
+    in the new version's order, with removed lines after the line they
+    followed. Returns (lines, counts per status).
+    """
+    hashes = {content_hash for _, content_hash in old.rows} | {content_hash for _, content_hash in new.rows}
+    rows = BEMERow.objects.in_bulk(list(hashes))
+    old_lines = [_line(number, rows[content_hash]) for number, content_hash in old.rows]
+    new_lines = [_line(number, rows[content_hash]) for number, content_hash in new.rows]
+
+    # Pass 1: identical content, matched on the hash
+    by_hash = defaultdict(deque)
+    for i, (_, content_hash) in enumerate(old.rows):
+        by_hash[content_hash].append(i)
+    matches = [None] * len(new_lines)  # new index -> old index
+    for j, (_, content_hash) in enumerate(new.rows):
+        if by_hash[content_hash]:
+            matches[j] = by_hash[content_hash].popleft()
+
+    # Pass 2: lines edited in place, matched on section and description
+    matched_old = set(i for i in matches if i is not None)
+    by_identity = defaultdict(deque)
+    for i, line in enumerate(old_lines):
+        if i not in matched_old:
+            by_identity[(line['section'], normalize(line['description']))].append(i)
+    for j, line in enumerate(new_lines):
+        if matches[j] is None:
+            candidates = by_identity[(line['section'], normalize(line['description']))]
+            if candidates:
+                matches[j] = candidates.popleft()
+
+    # Removed lines go after the new position of the nearest matched line before them
+    new_position = {i: j for j, i in enumerate(matches) if i is not None}
+    removed_after = defaultdict(list)
+    anchor = -1
+    for i, line in enumerate(old_lines):
+        if i in new_position:
+            anchor = new_position[i]
+        else:
+            removed_after[anchor].append({'status': 'removed', 'old': line, 'new': None, 'fields': []})
+
+    lines = list(removed_after[-1])
+    for j, line in enumerate(new_lines):
+        i = matches[j]
+        if i is None:
+            lines.append({'status': 'added', 'old': None, 'new': line, 'fields': []})
+        else:
+            fields = [name for name in COMPARED_FIELDS if old_lines[i][name] != line[name]]
+            lines.append({'status': 'changed' if fields else 'unchanged', 'old': old_lines[i], 'new': line,
+                          'fields': fields})
+        lines.extend(removed_after[j])
+
+    counts = dict.fromkeys(['unchanged', 'changed', 'added', 'removed'], 0)
+    for line in lines:
+        counts[line['status']] += 1
+    return lines, counts
@@ -0,0 +1,39 @@
+# projects/tasks.py
+"""Background tasks run by the jobs worker"""
+from datetime import timedelta
+
+from jobs.queue import task
+from . import artefacts, exports, notifications, outbox, overdue, rates
+
+@task(name='projects.send_outbox', every=timedelta(seconds=30), max_attempts=1)
+def send_outbox():
+    sent = failed = 0
+    while True:
+        batch_sent, batch_failed = outbox.drain()
+        sent, failed = sent + batch_sent, failed + batch_failed
+        if batch_sent + batch_failed < outbox.BATCH_SIZE:
+            return {'sent': sent, 'deferred': failed}
+
+@task(name='projects.rebuild_notification_counters', every=timedelta(days=1))
+def rebuild_notification_counters():
+    notifications.rebuild_counters()
+
+@task(name='projects.flag_overdue', every=timedelta(days=1))
+def flag_overdue():
+    return overdue.flag_overdue()
+
+@task(name='projects.render_artefact')
+def render_artefact(source_key):
+    return artefacts.rerender(source_key)
+
+@task(name='projects.record_rates')
+def record_rates(stage_id):
+    return rates.record_stage(stage_id)
+
+@task(name='projects.export_documents', max_attempts=1, pass_job_id=True)
+def export_documents(job_id, **filters):
+    return exports.export_documents(job_id, **filters)
+
+@task(name='projects.purge_exports', every=timedelta(days=1))
+def purge_exports():
+    return exports.purge()
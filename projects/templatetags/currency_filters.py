@@ -1,23 +1,15 @@
 from django import template
-import locale
+
+from projects.money import format_amount, format_currency
 
 register = template.Library()
 
 @register.filter
 def currency(value):
-    """Format a number as currency with commas"""
-    try:
-        value = float(value)
-        # Format with commas and 2 decimal places
-        return f"₦{value:,.2f}"
-    except (ValueError, TypeError):
-        return "₦0.00"
+    """Format a number as currency with commas, e.g. ₦1,234.50"""
+    return format_currency(value)
 
 @register.filter
 def commafy(value):
     """Add commas to a number without currency symbol"""
-    try:
-        value = float(value)
-        return f"{value:,.2f}"
-    except (ValueError, TypeError):
-        return "0.00"
\ No newline at end of file
+    return format_amount(value)
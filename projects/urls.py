@@ -29,6 +29,20 @@ urlpatterns = [
 
     # API
     path('api/budgets/by-department/', views.api_budgets_by_department, name='api_budgets_by_department'),
+    path('api/rates/suggest/', views.api_rate_suggestions, name='api_rate_suggestions'),
+
+    # Notifications
+    path('notifications/', views.notification_list, name='notification_list'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
+    path('notifications/<int:notification_id>/', views.notification_open, name='notification_open'),
+    path('notifications/mark-all-read/', views.notification_mark_all_read, name='notification_mark_all_read'),
+
+    # Batch export of certificates and BEMEs
+    path('exports/', views.document_export, name='document_export'),
+    path('exports/<uuid:job_id>/download/', views.export_download, name='export_download'),
+
+    # Stored certificate and BEME PDFs
+    path('documents/<uuid:document_id>/<str:content_hash>.pdf', views.artefact_download, name='artefact_download'),
 
     path('contractors/<uuid:contractor_id>/', views.contractor_detail, name='contractor_detail'),
     path('contractors/<uuid:contractor_id>/edit/', views.contractor_update, name='contractor_update'),
@@ -37,6 +51,7 @@ urlpatterns = [
     
     
     path('<str:project_id>/update/', views.ProjectUpdateView.as_view(), name='project_update'),
+    path('<str:project_id>/clone/', views.project_clone_view, name='project_clone'),
     
     # Project Stages
     path('<str:project_id>/stage/<uuid:stage_id>/', views.update_stage, name='update_stage'),
@@ -52,6 +67,8 @@ urlpatterns = [
     # Replace or add these specific stage URLs
     path('<str:project_id>/stage/boq-beme/<uuid:stage_id>/', 
         views.boq_beme_view, name='boq_beme'),
+    path('<str:project_id>/stage/boq-beme/<uuid:stage_id>/versions/', 
+        views.beme_history_view, name='beme_history'),
     path('<str:project_id>/stage/boq-beme/<uuid:stage_id>/pdf/', 
      views.generate_beme_pdf, name='beme_pdf'),
     
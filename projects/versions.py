@@ -0,0 +1,144 @@
+# projects/versions.py
+"""
+Version counters and conditional GET for project and budget pages.
+
+Project.version and Budget.version are bumped with an UPDATE whenever the
+record or any of its children is saved or deleted. BOQ items are written in
+bulk, so their writers call bump_projects() once per save instead. Pages
+decorated with conditional_page() derive an ETag from those versions plus what the page shows
+about the viewer, and answer 304 Not Modified before the view runs.
+"""
+import hashlib
+
+from django.contrib import messages
+from django.db.models import Count, F, Sum
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from approvals import inbox
+from . import notifications
+from .context_processors import quick_stats
+from .models import (Project, ProjectStage, ProgressReport, ProjectDocument, Budget, BudgetItem,
+                     ProjectBudgetAllocation, ProjectNomination, PaymentCertificate, CertificateLedger,
+                     TechnicalReview)
+
+
+def bump_projects(*project_ids):
+    Project.objects.filter(pk__in=project_ids).update(version=F('version') + 1)
+
+
+def bump_budgets(*budget_ids):
+    Budget.objects.filter(pk__in=budget_ids).update(version=F('version') + 1)
+
+
+# Child model -> how to reach the parents whose pages show it
+PROJECT_CHILDREN = {
+    ProjectStage: lambda obj: obj.project_id,
+    ProgressReport: lambda obj: obj.project_id,
+    ProjectDocument: lambda obj: obj.project_id,
+    ProjectBudgetAllocation: lambda obj: obj.project_id,
+    ProjectNomination: lambda obj: obj.project_id,
+    PaymentCertificate: lambda obj: obj.project_id,
+    CertificateLedger: lambda obj: obj.project_id,
+    TechnicalReview: lambda obj: obj.project_id,
+}
+BUDGET_CHILDREN = {
+    BudgetItem: lambda obj: obj.budget_id,
+    ProjectBudgetAllocation: lambda obj: obj.budget_id,
+}
+
+
+def _own_write(sender, instance, **kwargs):
+    if sender is Project:
+        bump_projects(instance.pk)
+    else:
+        bump_budgets(instance.pk)
+
+
+def _project_child_write(sender, instance, **kwargs):
+    bump_projects(PROJECT_CHILDREN[sender](instance))
+
+
+def _budget_child_write(sender, instance, **kwargs):
+    budget_id = BUDGET_CHILDREN[sender](instance)
+    if budget_id:
+        bump_budgets(budget_id)
+
+
+def connect():
+    """Hook the bumps up to model signals; called from ProjectsConfig.ready()"""
+    for signal in (post_save, post_delete):
+        for model in (Project, Budget):
+            signal.connect(_own_write, sender=model, dispatch_uid=f'version-{model.__name__}-{signal is post_save}')
+        for model in PROJECT_CHILDREN:
+            signal.connect(_project_child_write, sender=model,
+                           dispatch_uid=f'version-project-{model.__name__}-{signal is post_save}')
+        for model in BUDGET_CHILDREN:
+            signal.connect(_budget_child_write, sender=model,
+                           dispatch_uid=f'version-budget-{model.__name__}-{signal is post_save}')
+
+
+def _viewer(request):
+    """What every page shows about the viewer besides the object itself"""
+    user = request.user
+    stats = quick_stats(user)
+    return [
+        user.pk, user.office, user.department, user.is_superuser,
+        inbox.open_count(user), notifications.unread_count(user),
+        # Sidebar counts: they change with projects the page may not show
+        stats['total_projects'], stats['active_projects'], stats['overdue_projects'],
+        # Nightly jobs (overdue flags) change pages without bumping versions
+        timezone.localdate().isoformat(),
+    ]
+
+
+def conditional_page(versions):
+    """
+    ETag-based conditional GET for a function view. ``versions(request, **kwargs)``
+    returns a list of values that change whenever the page content would.
+    Requests with pending flash messages are always rendered.
+    """
+    def etag(request, *args, **kwargs):
+        if not request.user.is_authenticated or len(messages.get_messages(request)):
+            return None
+        parts = [request.resolver_match.view_name, request.GET.urlencode()]
+        parts += versions(request, *args, **kwargs) + _viewer(request)
+        return hashlib.md5(repr(parts).encode()).hexdigest()
+
+    def decorator(view):
+        conditional = condition(etag_func=etag)(view)
+
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                # Revalidate on every visit instead of trusting a cached copy
+                response['Cache-Control'] = 'private, no-cache'
+            return response
+        wrapper.__wrapped__ = view
+        wrapper.__name__ = view.__name__
+        wrapper.__doc__ = view.__doc__
+        return wrapper
+    return decorator
+
+
+# Version sources for the decorated pages
+
+def project_version(request, project_id, **kwargs):
+    return list(Project.objects.filter(project_id=project_id).values_list('version', flat=True)[:1])
+
+
+def budget_version(request, budget_id, **kwargs):
+    return list(Budget.objects.filter(budget_id=budget_id).values_list('version', flat=True)[:1])
+
+
+def project_list_version(queryset):
+    """Count and sum of versions over the listed projects: any edit, add or delete moves one"""
+    totals = queryset.order_by().aggregate(n=Count('pk', distinct=True), v=Sum('version'))
+    return [totals['n'], totals['v']]
+
+
+def budget_department_version(department):
+    """Count and sum of versions over a department's budgets"""
+    totals = Budget.objects.filter(department=department).aggregate(n=Count('pk'), v=Sum('version'))
+    return [totals['n'], totals['v']]
@@ -4,18 +4,25 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
 from django.urls import reverse_lazy
 from django.contrib import messages
+from django.db import IntegrityError, transaction
 from django.db.models import Q
-from .models import User, PaymentCertificate, Project, ProjectStage, ProjectDocument, ProgressReport, Contractor, BOQItem
+from .models import User, PaymentCertificate, Project, ProjectStage, ProjectDocument, ProgressReport, Contractor, BOQItem, StageTransition
 from .forms import ProjectForm, ProjectStageForm, ProjectDocumentForm, ProgressReportForm, SiteInspectionForm, ProjectProposalForm, ContractAwardForm, DueDiligenceForm, PaymentCertificateForm, ProjectNominationForm
 from django.utils import timezone
-from .forms import ContractorForm, BudgetForm
-from django.db.models import Sum
-from .models import Budget, BudgetItem, ProjectBudgetAllocation
+from .forms import ContractorForm, BudgetForm, ProjectCloneForm
+from django.db.models import Sum, F, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from decimal import Decimal
+from .models import Budget, BudgetItem, ProjectBudgetAllocation, BEMESummary, BEMEVersion
 from django.urls import reverse  # Add this line
 
 # projects/views.py
 from django.http import JsonResponse
 from .models import ProjectNomination, Notification
+from . import artefacts, beme, certificate_pdf, cloning, rates, snapshots, workflows, certificates, versions
+from .money import amount_in_words
+from npa_core import singleflight
+from django.utils.decorators import method_decorator
 
 
 @login_required
@@ -118,7 +125,7 @@ def delete_nomination_view(request, nomination_id):
         return redirect('nomination_list', project_id=nomination.project.project_id)
     
     if request.method == 'POST':
-        nomination.delete()
+        workflows.withdraw_nomination(nomination)
         messages.success(request, "Nomination deleted successfully.")
         return redirect('nomination_list', project_id=nomination.project.project_id)
     
@@ -161,61 +168,17 @@ def nomination_supervisor_view(request, project_id, stage_id):
             sups = form.cleaned_data.get('supervisors')
             project_location = form.cleaned_data.get('project_location')
             
-            # Get GM and ED users for notification
-            gm_users = User.objects.filter(
-                office='general_manager',
-                is_active=True
-            )
-            ed_users = User.objects.filter(
-                office='executive_director',
-                is_active=True
-            )
-            
-            # Create PM nominations
-            for pm in pms:
-                nomination = ProjectNomination.objects.create(
-                    project=project,
-                    nomination_type='project_manager',
-                    nominee=pm,
-                    project_location=project_location,
-                    nominated_by=request.user,
-                    status='pending_gm'
-                )
-                
-                # Notify GM
-                for gm in gm_users:
-                    Notification.objects.create(
-                        user=gm,
-                        title=f"Project Manager Nomination - {project.project_id}",
-                        message=f"{request.user.get_full_name()} ({request.user.get_office_display()}) has nominated {pm.get_full_name()} as Project Manager",
-                        link=reverse('approve_nomination', args=[nomination.nomination_id])
-                    )
-            
-            # Create Supervisor nominations
-            for sup in sups:
-                nomination = ProjectNomination.objects.create(
-                    project=project,
-                    nomination_type='supervisor',
-                    nominee=sup,
-                    project_location=project_location,
-                    nominated_by=request.user,
-                    status='pending_gm'
-                )
-                
-                # Notify GM
-                for gm in gm_users:
-                    Notification.objects.create(
-                        user=gm,
-                        title=f"Supervisor Nomination - {project.project_id}",
-                        message=f"{request.user.get_full_name()} ({request.user.get_office_display()}) has nominated {sup.get_full_name()} as Project Supervisor",
-                        link=reverse('approve_nomination', args=[nomination.nomination_id])
-                    )
+            workflows.create_nominations(project, pms, 'project_manager', project_location, request.user)
+            workflows.create_nominations(project, sups, 'supervisor', project_location, request.user)
             
             messages.success(request, f"{pms.count() + sups.count()} nomination(s) submitted successfully for GM approval.")
             
             # Update stage status
+            previous_status = stage.status
             stage.status = 'requires_approval'
             stage.save()
+            # The nominations themselves carry the approval items
+            StageTransition.record(stage, previous_status, request.user)
             
             return redirect('nomination_list', project_id=project_id)
         else:
@@ -252,62 +215,19 @@ def approve_nomination_view(request, nomination_id):
         action = request.POST.get('action')
         rejection_reason = request.POST.get('rejection_reason', '')
         
-        if action == 'approve':
-            if is_gm and nomination.status == 'pending_gm':
-                nomination.status = 'pending_ed'
-                nomination.gm_approved_by = request.user
-                nomination.gm_approved_at = timezone.now()
-                
-                # Notify ED
-                ed_users = User.objects.filter(office='executive_director', is_active=True)
-                for ed in ed_users:
-                    Notification.objects.create(
-                        user=ed,
-                        title=f"Final Approval Required - {nomination.project.project_id}",
-                        message=f"GM has approved {nomination.nominee.get_full_name()} as {nomination.get_nomination_type_display()}. Your approval is required.",
-                        link=reverse('approve_nomination', args=[nomination.nomination_id])
-                    )
-                
-                messages.success(request, f"Nominated {nomination.nominee.get_full_name()} forwarded to ED for final approval.")
-                
-            elif is_ed and nomination.status == 'pending_ed':
-                nomination.status = 'approved'
-                nomination.ed_approved_by = request.user
-                nomination.ed_approved_at = timezone.now()
-                
-                # Update project with nominated personnel
-                if nomination.nomination_type == 'project_manager':
-                    nomination.project.project_manager = nomination.nominee
+        try:
+            if action == 'approve':
+                new_status = workflows.approve_nomination(nomination, request.user)
+                if new_status == 'pending_ed':
+                    messages.success(request, f"Nominated {nomination.nominee.get_full_name()} forwarded to ED for final approval.")
                 else:
-                    nomination.project.supervisor = nomination.nominee
-                nomination.project.save()
-                
-                messages.success(request, f"{nomination.get_nomination_type_display()} approved successfully!")
-                
-                # Notify nominator
-                Notification.objects.create(
-                    user=nomination.nominated_by,
-                    title=f"Nomination Approved - {nomination.project.project_id}",
-                    message=f"Your nomination of {nomination.nominee.get_full_name()} as {nomination.get_nomination_type_display()} has been fully approved.",
-                )
-            else:
-                messages.error(request, "Invalid approval action.")
-                
-        elif action == 'reject':
-            nomination.status = 'rejected'
-            nomination.rejection_reason = rejection_reason
-            nomination.save()
-            
-            # Notify nominator
-            Notification.objects.create(
-                user=nomination.nominated_by,
-                title=f"Nomination Rejected - {nomination.project.project_id}",
-                message=f"Your nomination of {nomination.nominee.get_full_name()} as {nomination.get_nomination_type_display()} was rejected. Reason: {rejection_reason}",
-            )
-            
-            messages.warning(request, f"Nomination rejected.")
+                    messages.success(request, f"{nomination.get_nomination_type_display()} approved successfully!")
+            elif action == 'reject':
+                workflows.reject_nomination(nomination, request.user, rejection_reason)
+                messages.warning(request, f"Nomination rejected.")
+        except workflows.WorkflowError as e:
+            messages.error(request, str(e))
         
-        nomination.save()
         return redirect('dashboard')
     
     context = {
@@ -320,15 +240,48 @@ def approve_nomination_view(request, nomination_id):
 
 @login_required
 def api_budgets_by_department(request):
+    """
+    Budget heads with their allocated, unallocated and remaining amounts.
+    remaining is total less what certificates have spent, read from the
+    allocations' maintained balances.
+    """
     department = request.GET.get('department')
     if department:
-        budgets = Budget.objects.filter(department=department).values(
-            'id', 'budget_code', 'budget_head', 'total_amount'
+        # Any budget or allocation change moves the department's version
+        # total, so the cached figures are never behind the ledger
+        heads = versions.budget_department_version(department)
+        budgets = singleflight.get_or_compute(
+            f"budgets:availability:{department}:{heads[0]}:{heads[1]}",
+            lambda: _budget_availability(department), fresh=300, stale=0,
         )
-        return JsonResponse(list(budgets), safe=False)
+        return JsonResponse(budgets, safe=False)
     return JsonResponse([], safe=False)
 
 
+@login_required
+def api_rate_suggestions(request):
+    """Rates past BOQs paid for items like ``q``, for the BEME editor"""
+    suggestions = rates.suggest(
+        request.GET.get('q', ''),
+        unit=request.GET.get('unit') or None,
+        location=request.GET.get('location') or None,
+    )
+    return JsonResponse(suggestions, safe=False)
+
+
+def _budget_availability(department):
+    zero = Value(Decimal('0'))
+    return list(Budget.objects.filter(department=department).annotate(
+        allocated=Coalesce(Sum('project_allocations__allocated_amount'), zero),
+        unspent=Coalesce(Sum('project_allocations__remaining_balance'), zero),
+    ).annotate(
+        unallocated=F('total_amount') - F('allocated'),
+        remaining=F('total_amount') - F('allocated') + F('unspent'),
+    ).values(
+        'id', 'budget_code', 'budget_head', 'total_amount', 'allocated', 'unallocated', 'remaining'
+    ))
+
+
 @login_required
 def budget_list_view(request):
     budgets = Budget.objects.all().order_by('-year', 'department')
@@ -420,6 +373,7 @@ def budget_create_view(request):
     return render(request, 'budgets/budget_form.html', context)
 
 @login_required
+@versions.conditional_page(versions.budget_version)
 def budget_detail_view(request, budget_id):
     budget = get_object_or_404(Budget, budget_id=budget_id)
     items = budget.items.all().order_by('section', 'order')
@@ -572,6 +526,10 @@ class ProjectListView(LoginRequiredMixin, ListView):
     context_object_name = 'projects'
     paginate_by = 10
     
+    def get(self, request, *args, **kwargs):
+        list_version = lambda request, *args, **kwargs: versions.project_list_version(self.get_queryset())
+        return versions.conditional_page(list_version)(super().get)(request, *args, **kwargs)
+    
     def get_queryset(self):
         user = self.request.user
         queryset = super().get_queryset()
@@ -611,7 +569,10 @@ class ProjectListView(LoginRequiredMixin, ListView):
         if priority:
             queryset = queryset.filter(priority=priority)
         
-        return queryset
+        # BEME grand total from the stored summaries, not the line items
+        beme_total = (BEMESummary.objects.filter(project=OuterRef('pk')).order_by()
+                      .values('project').annotate(total=Sum('grand_total')).values('total'))
+        return queryset.annotate(beme_total=Subquery(beme_total))
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -622,6 +583,7 @@ class ProjectListView(LoginRequiredMixin, ListView):
         return context
 
 # Project Detail View
+@method_decorator(versions.conditional_page(versions.project_version), name='get')
 class ProjectDetailView(LoginRequiredMixin, DetailView):
     model = Project
     template_name = 'projects/project_detail.html'
@@ -701,12 +663,37 @@ class ProjectCreateView(LoginRequiredMixin, CreateView):
             ('final_report', 18),
         ]
         
+        transitions = []
         for stage_type, order in stages_data:
-            ProjectStage.objects.create(
+            stage = ProjectStage.objects.create(
                 project=project,
                 stage_type=stage_type,
                 order=order
             )
+            transitions.append(StageTransition.from_stage(stage, user=self.request.user))
+        StageTransition.objects.bulk_create(transitions)
+
+@login_required
+def project_clone_view(request, project_id):
+    """Start a new draft project from a copy of this one's stages and BOQs"""
+    project = get_object_or_404(Project, project_id=project_id)
+    form = ProjectCloneForm(request.POST or None, initial={'title': f"{project.title} (copy)"})
+    if request.method == 'POST' and form.is_valid():
+        try:
+            clone = cloning.clone_project(project, request.user, form.cleaned_data['title'],
+                                          include_boq=form.cleaned_data['include_boq'])
+        except IntegrityError:
+            form.add_error(None, 'A new project ID could not be allocated. Please try again.')
+        else:
+            messages.success(request, f'Project {clone.project_id} created from {project.project_id}.')
+            return redirect('project_detail', project_id=clone.project_id)
+    
+    context = {
+        'project': project,
+        'form': form,
+        'page_title': f'Clone Project: {project.title}',
+    }
+    return render(request, 'projects/project_clone.html', context)
 
 # Project Update View
 class ProjectUpdateView(LoginRequiredMixin, UpdateView):
@@ -731,7 +718,7 @@ class ProjectUpdateView(LoginRequiredMixin, UpdateView):
         # Only creator or admin can edit
         if not (request.user == project.created_by or request.user.is_superuser):
             messages.error(request, "You don't have permission to edit this project.")
-            return redirect('project_detail', pk=project.pk)
+            return redirect('project_detail', project_id=project.pk)
         return super().dispatch(request, *args, **kwargs)
     
     def form_valid(self, form):
@@ -820,6 +807,7 @@ def update_stage(request, project_id, stage_id):
         return redirect('project_detail', project_id=project_id)  # Changed from pk= to project_id=
     
     if request.method == 'POST':
+        previous_status = stage.status
         form = ProjectStageForm(request.POST, request.FILES, instance=stage)
         if form.is_valid():
             stage = form.save()
@@ -829,6 +817,8 @@ def update_stage(request, project_id, stage_id):
                 stage.end_date = timezone.now().date()
                 stage.save()
             
+            workflows.stage_changed(stage, previous_status, request.user)
+            
             messages.success(request, f'{stage.get_stage_type_display()} stage updated!')
             return redirect('project_detail', project_id=project_id)  # Changed from pk= to project_id=
     else:
@@ -921,14 +911,12 @@ def submit_project(request, project_id):
     
     if request.user != project.created_by:
         messages.error(request, "Only the project creator can submit for approval.")
-        return redirect('project_detail', pk=project_id)
+        return redirect('project_detail', project_id=project_id)
     
-    project.status = 'submitted'
-    project.submitted_at = timezone.now()
-    project.save()
+    workflows.submit_project(project, request.user)
     
     messages.success(request, 'Project submitted for approval!')
-    return redirect('project_detail', pk=project_id)
+    return redirect('project_detail', project_id=project_id)
 
 @login_required
 def approve_project(request, project_id):
@@ -937,15 +925,16 @@ def approve_project(request, project_id):
     # Only management can approve
     if not request.user.office in ['executive_director', 'general_manager']:
         messages.error(request, "Only management can approve projects.")
-        return redirect('project_detail', pk=project_id)
+        return redirect('project_detail', project_id=project_id)
     
-    project.status = 'approved'
-    project.approved_by = request.user
-    project.approved_at = timezone.now()
-    project.save()
+    try:
+        workflows.approve_project(project, request.user)
+    except workflows.WorkflowError as e:
+        messages.error(request, str(e))
+        return redirect('project_detail', project_id=project_id)
     
     messages.success(request, 'Project approved!')
-    return redirect('project_detail', pk=project_id)
+    return redirect('project_detail', project_id=project_id)
 
 @login_required
 def complete_project(request, project_id):
@@ -955,14 +944,14 @@ def complete_project(request, project_id):
     if not (request.user == project.project_manager or 
             request.user.office in ['executive_director', 'general_manager']):
         messages.error(request, "Only project manager or management can complete projects.")
-        return redirect('project_detail', pk=project_id)
+        return redirect('project_detail', project_id=project_id)
     
     project.status = 'completed'
     project.actual_end_date = timezone.now().date()
     project.save()
     
     messages.success(request, 'Project marked as completed!')
-    return redirect('project_detail', pk=project_id)
+    return redirect('project_detail', project_id=project_id)
 
 @login_required
 def site_inspection_view(request, project_id, stage_id):
@@ -986,6 +975,7 @@ def contract_award_view(request, project_id, stage_id):
         return redirect('project_detail', project_id=project_id)
     
     if request.method == 'POST':
+        previous_status = stage.status
         form = ContractAwardForm(request.POST, request.FILES, instance=stage)
         
         if form.is_valid():
@@ -1026,6 +1016,8 @@ def contract_award_view(request, project_id, stage_id):
                 stage.end_date = timezone.now().date()
                 stage.save()
             
+            workflows.stage_changed(stage, previous_status, request.user)
+            
             messages.success(request, 'Contract awarded successfully!')
             return redirect('project_detail', project_id=project_id)
         else:
@@ -1060,6 +1052,7 @@ def contract_award_view(request, project_id, stage_id):
 
 # Stage-specific view functions
 from django.http import HttpResponse, FileResponse
+import io
 import json
 import os
 from .pdf_utils import generate_boq_pdf
@@ -1069,7 +1062,41 @@ from decimal import Decimal
 import json
 from django.core.serializers.json import DjangoJSONEncoder
 
+def _replace_boq_items(stage, beme_items):
+    """
+    Replace a stage's BOQ items with the rows posted from the BEME form.
+    BOQ items send no per-row signals, so this bumps the project version and
+    marks the finalized BEME stale once; call it inside a transaction.
+    """
+    # Delete existing BOQ items for this stage
+    stage.boq_items.all().delete()
+    
+    # Create new BOQ items in one INSERT per batch
+    items = []
+    for order, item_data in enumerate(beme_items):
+        # Convert string values to Decimal
+        quantity = Decimal(str(item_data.get('quantity', '0'))) if item_data.get('quantity') else Decimal('0')
+        rate = Decimal(str(item_data.get('rate', '0'))) if item_data.get('rate') else Decimal('0')
+        amount = quantity * rate
+        
+        items.append(BOQItem(
+            project_stage=stage,
+            section=item_data.get('section', 'Main Section'),
+            item_number=item_data.get('sn', str(order + 1)),
+            description=item_data.get('description', ''),
+            quantity=quantity,
+            unit=item_data.get('unit', 'item'),
+            rate=rate,
+            amount=amount,
+            order=order
+        ))
+    BOQItem.objects.bulk_create(items, batch_size=1000)
+    versions.bump_projects(stage.project_id)
+    artefacts.mark_beme_stale(stage)
+
+
 @login_required
+@versions.conditional_page(versions.project_version)
 def boq_beme_view(request, project_id, stage_id):
     project = get_object_or_404(Project, project_id=project_id)
     stage = get_object_or_404(ProjectStage, stage_id=stage_id, project=project)
@@ -1090,6 +1117,7 @@ def boq_beme_view(request, project_id, stage_id):
     
     if request.method == 'POST':
         # Handle the form submission
+        previous_forward_to_id = stage.forward_to_id
         stage.notes = request.POST.get('notes', stage.notes)
         
         # Handle document upload
@@ -1097,7 +1125,13 @@ def boq_beme_view(request, project_id, stage_id):
             stage.document = request.FILES['document']
             stage.is_document_uploaded = True
         
+        # Forward the BEME to another officer for review
+        forward_to = request.POST.get('forward_to')
+        if forward_to:
+            stage.forward_to = User.objects.filter(pk=forward_to, is_active=True).first()
+        
         stage.save()
+        workflows.stage_changed(stage, stage.status, request.user, previous_forward_to_id)
         
         # Get BEME data from the hidden field
         beme_data = request.POST.get('beme_data', '[]')
@@ -1105,32 +1139,20 @@ def boq_beme_view(request, project_id, stage_id):
         try:
             beme_items = json.loads(beme_data)
             
-            # Delete existing BOQ items for this stage
-            stage.boq_items.all().delete()
-            
-            # Create new BOQ items
-            order = 0
-            for item_data in beme_items:
-                # Convert string values to Decimal
-                quantity = Decimal(str(item_data.get('quantity', '0'))) if item_data.get('quantity') else Decimal('0')
-                rate = Decimal(str(item_data.get('rate', '0'))) if item_data.get('rate') else Decimal('0')
-                amount = quantity * rate
-                
-                BOQItem.objects.create(
-                    project_stage=stage,
-                    section=item_data.get('section', 'Main Section'),
-                    item_number=item_data.get('sn', str(order + 1)),
-                    description=item_data.get('description', ''),
-                    quantity=quantity,
-                    unit=item_data.get('unit', 'item'),
-                    rate=rate,
-                    amount=amount,
-                    order=order
-                )
-                order += 1
+            # Replace the items in one transaction; bulk writes send no signals, so summarise
+            # the BEME, queue its prices for the rate catalog and keep it as a new version here
+            with transaction.atomic():
+                _replace_boq_items(stage, beme_items)
+                beme.refresh_summary(stage.pk)
+                rates.queue(stage.pk)
+                snapshots.record(stage, request.user)
             
             messages.success(request, 'BEME saved successfully!')
             
+            if 'finalize' in request.POST:
+                artefacts.finalize(project, artefacts.beme_key(stage), f"BEME - {project.title}", request.user)
+                messages.success(request, 'BEME finalized.')
+            
             # Check if this is a PDF generation request
             if 'generate_pdf' in request.POST:
                 return redirect('beme_pdf', project_id=project.project_id, stage_id=stage.stage_id)
@@ -1144,9 +1166,8 @@ def boq_beme_view(request, project_id, stage_id):
         
         return redirect('project_detail', project_id=project_id)
     
-    # Generate BEME sequence number
-    beme_count = stage.boq_items.count()
-    beme_sequence = f"{beme_count + 1:03d}"
+    # Generate BEME sequence number; the items are loaded for the form anyway
+    beme_sequence = f"{len(existing_items) + 1:03d}"
     
     # Prepare initial data for the template
     initial_items = []
@@ -1175,6 +1196,41 @@ def boq_beme_view(request, project_id, stage_id):
     }
     return render(request, 'stages/boq_beme_simple.html', context)
 
+
+@login_required
+def beme_history_view(request, project_id, stage_id):
+    """A BEME's saved versions, and what changed between two of them"""
+    project = get_object_or_404(Project, project_id=project_id)
+    stage = get_object_or_404(ProjectStage, stage_id=stage_id, project=project, stage_type='prepare_boq')
+    beme_versions = list(stage.beme_versions.select_related('created_by').defer('rows'))
+    
+    lines, counts, old, new = [], {}, None, None
+    if beme_versions:
+        numbers = {str(version.number): version for version in beme_versions}
+        # Latest against the one before it, unless two versions are chosen
+        new = numbers.get(request.GET.get('to')) or beme_versions[0]
+        old = numbers.get(request.GET.get('from')) or numbers.get(str(new.number - 1)) or new
+        fetched = BEMEVersion.objects.select_related('created_by').in_bulk([old.pk, new.pk])
+        old, new = fetched[old.pk], fetched[new.pk]
+        lines, counts = snapshots.diff(old, new)
+    
+    changes_only = request.GET.get('all') != '1'
+    if changes_only:
+        lines = [line for line in lines if line['status'] != 'unchanged']
+    
+    context = {
+        'project': project,
+        'stage': stage,
+        'beme_versions': beme_versions,
+        'old': old,
+        'new': new,
+        'lines': lines,
+        'counts': counts,
+        'changes_only': changes_only,
+        'page_title': 'BEME Versions',
+    }
+    return render(request, 'stages/beme_history.html', context)
+
 # projects/views.py
 from django.http import HttpResponse
 from django.template.loader import render_to_string
@@ -1182,79 +1238,42 @@ from django.utils import timezone
 from decimal import Decimal
 import json
 
+def beme_totals(stage, boq_items):
+    """Items grouped by section, with the section totals, subtotal, contingency, VAT and grand total from the database"""
+    rows, subtotal = beme.section_totals(stage.pk)
+    sections = {section: [] for section, total, count in rows}
+    for item in boq_items:
+        sections.setdefault(item.section, []).append(item)
+    return {
+        'sections': sections,
+        'section_totals': {section: total for section, total, count in rows},
+        'item_count': sum(count for section, total, count in rows),
+        **beme.figures(subtotal),
+    }
+
+
 @login_required
 def generate_beme_pdf(request, project_id, stage_id):
     project = get_object_or_404(Project, project_id=project_id)
     stage = get_object_or_404(ProjectStage, stage_id=stage_id, project=project)
     
+    # A finalized BEME is served from its stored PDF
+    document = artefacts.current(artefacts.beme_key(stage))
+    if document:
+        return redirect(artefacts.download_url(document))
+    
     # Get BOQ items
     boq_items = stage.boq_items.all().order_by('order', 'item_number')
+    totals = beme_totals(stage, boq_items)
     
-    # Group items by section and calculate section totals
-    sections = {}
-    section_totals = {}
-    
-    for item in boq_items:
-        if item.section not in sections:
-            sections[item.section] = []
-            section_totals[item.section] = Decimal('0')
-        sections[item.section].append(item)
-        section_totals[item.section] += item.amount
-    
-    # Calculate overall totals
-    subtotal = sum(item.amount for item in boq_items)
-    contingency = subtotal * Decimal('0.05')
-    vat = subtotal * Decimal('0.075')
-    grand_total = subtotal + contingency + vat
-    
-    # Convert number to words
-    def number_to_words(num):
-        num = int(round(num))
-        ones = ['', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine',
-                'Ten', 'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 
-                'Seventeen', 'Eighteen', 'Nineteen']
-        tens = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety']
-        
-        if num == 0:
-            return 'Zero Naira Only'
-        
-        def convert_less_than_thousand(n):
-            if n == 0:
-                return ''
-            elif n < 20:
-                return ones[n]
-            elif n < 100:
-                return tens[n // 10] + (' ' + ones[n % 10] if n % 10 != 0 else '')
-            else:
-                return ones[n // 100] + ' Hundred ' + convert_less_than_thousand(n % 100)
-        
-        result = ''
-        if num >= 1000000000:
-            result += convert_less_than_thousand(num // 1000000000) + ' Billion '
-            num %= 1000000000
-        if num >= 1000000:
-            result += convert_less_than_thousand(num // 1000000) + ' Million '
-            num %= 1000000
-        if num >= 1000:
-            result += convert_less_than_thousand(num // 1000) + ' Thousand '
-            num %= 1000
-        if num > 0:
-            result += convert_less_than_thousand(num)
-        
-        return result.strip() + ' Naira Only'
     
     context = {
         'project': project,
         'stage': stage,
-        'sections': sections,
-        'section_totals': section_totals,
-        'subtotal': subtotal,
-        'contingency': contingency,
-        'vat': vat,
-        'grand_total': grand_total,
-        'grand_total_words': number_to_words(grand_total),
+        **totals,
+        'grand_total_words': amount_in_words(totals['grand_total']),
         'prepared_by': request.user,
-        'beme_number': f"BEME/{project.project_id}/{timezone.now().year}/{boq_items.count() + 1:03d}",
+        'beme_number': f"BEME/{project.project_id}/{timezone.now().year}/{totals['item_count'] + 1:03d}",
         'generated_date': timezone.now(),
     }
     
@@ -1266,42 +1285,6 @@ def due_diligence_view(request, project_id, stage_id):
                               'due_diligence', DueDiligenceForm,
                               'stages/due_diligence.html')
 
-# Convert number to words
-def number_to_words(num):
-        num = int(round(num))
-        ones = ['', 'One', 'Two', 'Three', 'Four', 'Five', 'Six', 'Seven', 'Eight', 'Nine',
-                'Ten', 'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen', 'Sixteen', 
-                'Seventeen', 'Eighteen', 'Nineteen']
-        tens = ['', '', 'Twenty', 'Thirty', 'Forty', 'Fifty', 'Sixty', 'Seventy', 'Eighty', 'Ninety']
-        
-        if num == 0:
-            return 'Zero Naira Only'
-        
-        def convert_less_than_thousand(n):
-            if n == 0:
-                return ''
-            elif n < 20:
-                return ones[n]
-            elif n < 100:
-                return tens[n // 10] + (' ' + ones[n % 10] if n % 10 != 0 else '')
-            else:
-                return ones[n // 100] + ' Hundred ' + convert_less_than_thousand(n % 100)
-        
-        result = ''
-        if num >= 1000000000:
-            result += convert_less_than_thousand(num // 1000000000) + ' Billion '
-            num %= 1000000000
-        if num >= 1000000:
-            result += convert_less_than_thousand(num // 1000000) + ' Million '
-            num %= 1000000
-        if num >= 1000:
-            result += convert_less_than_thousand(num // 1000) + ' Thousand '
-            num %= 1000
-        if num > 0:
-            result += convert_less_than_thousand(num)
-        
-        return result.strip() + ' Naira Only'
-    
 
 # projects/views.py
 @login_required
@@ -1313,23 +1296,33 @@ def project_certification_view(request, project_id, stage_id):
         messages.error(request, "This is not a payment certification stage")
         return redirect('project_detail', project_id=project_id)
     
-    # Get or create payment certificate for this stage
+    # Edit the requested (or this stage's latest) certificate, or start the project's next one
     from .models import PaymentCertificate
-    certificate, created = PaymentCertificate.objects.get_or_create(
-        stage=stage,
-        project=project,
-        defaults={
-            'certificate_no': f"CERT/{project.project_id}/{timezone.now().year}/001",
-            'certificate_date': timezone.now().date(),
-            'work_completed_to_date': project.contract_sum or 0,
-            
-        }
-    )
+    stage_certificates = stage.payment_certificates.order_by('-sequence')
+    certificate_id = request.GET.get('certificate')
+    if certificate_id:
+        certificate = get_object_or_404(PaymentCertificate, certificate_id=certificate_id, project=project)
+    elif 'new' in request.GET:
+        certificate = None
+    else:
+        certificate = stage_certificates.first()
+    
+    if certificate is None:
+        today = timezone.now().date()
+        certificate = PaymentCertificate(
+            project=project,
+            stage=stage,
+            certificate_no=certificates.next_certificate_no(project, today),
+            certificate_date=today,
+            work_completed_to_date=project.contract_sum or 0,
+            amount_previously_certified=certificates.previously_certified(project),
+        )
     
     if request.method == 'POST':
         form = PaymentCertificateForm(request.POST, instance=certificate)
         
         # Handle stage completion
+        previous_status = stage.status
         stage.status = request.POST.get('stage_status', stage.status)
         stage.notes = request.POST.get('notes', stage.notes)
         
@@ -1338,10 +1331,19 @@ def project_certification_view(request, project_id, stage_id):
             stage.is_document_uploaded = True
         
         stage.save()
+        workflows.stage_changed(stage, previous_status, request.user)
         
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Payment certificate saved successfully!')
+            if certificate.pk:
+                certificates.revise(form.instance)
+            else:
+                certificates.issue(form.instance)
+            messages.success(request, f'Payment certificate {certificate.certificate_no} saved successfully!')
+            
+            if 'finalize' in request.POST:
+                artefacts.finalize(project, artefacts.certificate_key(certificate),
+                                   f"Payment Certificate {certificate.certificate_no}", request.user)
+                messages.success(request, f'Payment certificate {certificate.certificate_no} finalized.')
             
             if 'generate_pdf' in request.POST:
                 return redirect('certificate_pdf', project_id=project.project_id, 
@@ -1358,6 +1360,8 @@ def project_certification_view(request, project_id, stage_id):
         'project': project,
         'stage': stage,
         'certificate': certificate,
+        'project_certificates': project.payment_certificates.select_related('stage')
+                                .with_figures('amount_now_payable').order_by('sequence'),
         'page_title': 'Payment Certificate',
         
     }
@@ -1366,15 +1370,20 @@ def project_certification_view(request, project_id, stage_id):
 @login_required
 def certificate_pdf_view(request, project_id, certificate_id):
     project = get_object_or_404(Project, project_id=project_id)
-    certificate = get_object_or_404(PaymentCertificate, certificate_id=certificate_id, project=project)
-    grand_total = certificate.amount_now_payable if certificate else 0
-    context = {
-        'project': project,
-        'certificate': certificate,
-        'generated_date': timezone.now(),
-        'grand_total_words': number_to_words(grand_total),
-    }
-    return render(request, 'stages/certificate_pdf_print.html', context)
+    certificate = get_object_or_404(PaymentCertificate.objects.select_related('project__contractor'),
+                                    certificate_id=certificate_id, project=project)
+    
+    # A finalized certificate is served from its stored PDF
+    document = artefacts.current(artefacts.certificate_key(certificate))
+    if document:
+        return redirect(artefacts.download_url(document))
+    
+    # Otherwise render it live with the same renderer the stored PDF comes from
+    response = HttpResponse(certificate_pdf.render([certificate], io.BytesIO()).getvalue(),
+                            content_type='application/pdf')
+    filename = certificate.certificate_no.replace('/', '-')
+    response['Content-Disposition'] = f'inline; filename="{filename}.pdf"'
+    return response
 
 @login_required
 def contract_award_view(request, project_id, stage_id):
@@ -1386,6 +1395,7 @@ def contract_award_view(request, project_id, stage_id):
         return redirect('project_detail', project_id=project_id)
     
     if request.method == 'POST':
+        previous_status = stage.status
         form = ContractAwardForm(request.POST, request.FILES, instance=stage)
         
         if form.is_valid():
@@ -1447,6 +1457,8 @@ def contract_award_view(request, project_id, stage_id):
                 stage.end_date = timezone.now().date()
                 stage.save()
             
+            workflows.stage_changed(stage, previous_status, request.user)
+            
             messages.success(request, 'Contract awarded successfully! All project contract information updated.')
             return redirect('project_detail', project_id=project_id)
         else:
@@ -1523,9 +1535,11 @@ def stage_specific_view(request, project_id, stage_id, stage_type, form_class, t
         return redirect('project_detail', project_id=project_id)
     
     if request.method == 'POST':
+        previous_status = stage.status
         form = form_class(request.POST, request.FILES, instance=stage)
         if form.is_valid():
             stage = form.save()
+            workflows.stage_changed(stage, previous_status, user)
             
             # Additional logic for specific stages
             if stage_type == 'contract_award' and stage.status == 'completed':
@@ -1550,4 +1564,132 @@ def stage_specific_view(request, project_id, stage_id, stage_type, form_class, t
         'stage': stage,
         'page_title': stage.get_stage_type_display(),
     }
-    return render(request, template_name, context)
\ No newline at end of file
+    return render(request, template_name, context)
+
+
+# Notifications
+from . import notifications, live
+from django.views.decorators.http import require_POST
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+import asyncio
+
+STREAM_HEARTBEAT = 25  # seconds; keeps proxies from closing idle streams
+
+@login_required
+def notification_list(request):
+    """The user's notifications, newest first, a page at a time"""
+    try:
+        before = int(request.GET['before']) if request.GET.get('before') else None
+    except ValueError:
+        return HttpResponseBadRequest('Invalid page cursor.')
+    page, next_cursor = notifications.page(request.user, before=before)
+    context = {
+        'notifications': page,
+        'next_cursor': next_cursor,
+        'unread_count': notifications.unread_count(request.user),
+        'page_title': 'Notifications',
+    }
+    return render(request, 'notifications/notification_list.html', context)
+
+@login_required
+def notification_open(request, notification_id):
+    """Mark a notification read and follow its link"""
+    notification = get_object_or_404(Notification, pk=notification_id, user=request.user)
+    notifications.mark_read(request.user, notification.pk)
+    return redirect(notification.link or 'notification_list')
+
+@login_required
+@require_POST
+def notification_mark_all_read(request):
+    updated = notifications.mark_all_read(request.user)
+    messages.success(request, f'{updated} notification(s) marked as read.')
+    return redirect('notification_list')
+
+async def notification_stream(request):
+    """
+    Server-Sent Events stream of new notifications and count changes for the
+    signed-in user. Needs the ASGI server (npa_core.asgi); a waiting
+    connection holds only a queue and does no database work.
+    """
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return HttpResponse(status=401)
+
+    initial = await sync_to_async(live.counts)([user.pk])
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        live.subscribe(user.pk, loop, queue)
+        try:
+            yield "retry: 5000\n\n"
+            yield live.event('counts', initial[user.pk])
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            live.unsubscribe(user.pk, loop, queue)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+from django.http import Http404, HttpResponseNotModified
+
+@login_required
+def artefact_download(request, document_id, content_hash):
+    """A stored certificate or BEME PDF; the URL changes whenever the file does"""
+    document = get_object_or_404(ProjectDocument, document_id=document_id)
+    if not document.content_hash:
+        raise Http404("Document has not been rendered")
+    if document.content_hash != content_hash:
+        return redirect(artefacts.download_url(document))
+    
+    etag = f'"{content_hash}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(document.file.open('rb'), content_type='application/pdf',
+                                filename=os.path.basename(document.file.name))
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from jobs.models import Job
+from jobs.queue import enqueue
+from .forms import DocumentExportForm
+
+@login_required
+def document_export(request):
+    """Queue a batch export of certificates or BEMEs and follow its progress"""
+    form = DocumentExportForm(request.POST or None)
+    if request.method == 'POST' and form.is_valid():
+        job = enqueue('projects.export_documents', user=request.user, **form.export_filters())
+        return redirect(f"{reverse('document_export')}?job={job.job_id}")
+    
+    job = None
+    try:
+        job = Job.objects.filter(job_id=request.GET.get('job'), name='projects.export_documents',
+                                 created_by=request.user).first()
+    except ValidationError:
+        pass
+    return render(request, 'projects/document_export.html', {'form': form, 'job': job})
+
+@login_required
+def export_download(request, job_id):
+    job = get_object_or_404(Job, job_id=job_id, name='projects.export_documents', status='succeeded')
+    if job.created_by_id != request.user.pk and not request.user.is_staff:
+        raise Http404
+    name = (job.result or {}).get('file')
+    if not name or not default_storage.exists(name):
+        raise Http404("Export has expired")
+    return FileResponse(default_storage.open(name, 'rb'), as_attachment=True,
+                        filename=job.result.get('download_name') or os.path.basename(name))
@@ -0,0 +1,433 @@
+# projects/workflows.py
+"""
+Approval workflows for projects, nominations and stages.
+
+Views (and the approvals inbox) call these instead of flipping statuses
+themselves, so the record, its notifications and the approvers' work items
+all change in one transaction.
+
+The batch functions (approve_projects() and friends) decide many records
+at once for the approvals inbox: they lock and check every record in one
+query, refuse the whole batch if any is not awaiting that decision, and
+apply it with bulk UPDATEs and one notification INSERT. UPDATEs send no
+signals, so they bump versions and mark artefacts stale themselves.
+"""
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.urls import reverse
+from django.utils import timezone
+
+from approvals import inbox
+from .models import User, Notification, Project, ProjectDocument, ProjectNomination, ProjectStage, StageTransition
+from . import artefacts, notifications, versions
+
+
+class WorkflowError(Exception):
+    """Raised when an action is not allowed in the record's current state"""
+
+
+PENDING_PROJECT_STATUSES = ['submitted', 'under_review']
+
+# Passed by views whose forms cannot change forward_to
+UNCHANGED = object()
+
+
+# Projects
+
+@transaction.atomic
+def submit_project(project, user):
+    project.status = 'submitted'
+    project.submitted_at = timezone.now()
+    project.save()
+
+    inbox.open_items(
+        'project', inbox.approvers(), project,
+        title=f"Project Approval - {project.project_id}",
+        summary=f"{user.get_full_name()} submitted \"{project.title}\" for approval.",
+        link=reverse('project_detail', args=[project.project_id]),
+    )
+
+
+@transaction.atomic
+def approve_project(project, user):
+    if project.status not in PENDING_PROJECT_STATUSES:
+        raise WorkflowError(f"Project {project.project_id} is not awaiting approval.")
+
+    project.status = 'approved'
+    project.approved_by = user
+    project.approved_at = timezone.now()
+    project.save()
+    inbox.resolve_items('project', 'approved', user, project=project)
+
+
+@transaction.atomic
+def reject_project(project, user, reason=''):
+    """Return a submitted project to its creator as a draft"""
+    if project.status not in PENDING_PROJECT_STATUSES:
+        raise WorkflowError(f"Project {project.project_id} is not awaiting approval.")
+
+    project.status = 'draft'
+    project.reviewed_by = user
+    project.save()
+    inbox.resolve_items('project', 'rejected', user, project=project)
+
+    notifications.notify(
+        [project.created_by],
+        title=f"Project Returned - {project.project_id}",
+        message=f"{project.title} was returned for revision. Reason: {reason}",
+        link=reverse('project_detail', args=[project.project_id]),
+    )
+
+
+def _lock_pending_projects(project_ids):
+    """The projects, locked, if all of them are awaiting approval"""
+    project_ids = set(project_ids)
+    projects = list(Project.objects.select_for_update().filter(pk__in=project_ids)
+                    .only('project_id', 'title', 'status', 'created_by_id'))
+    refused = sorted(project_ids - {p.pk for p in projects} |
+                     {p.pk for p in projects if p.status not in PENDING_PROJECT_STATUSES})
+    if refused:
+        raise WorkflowError(f"Not awaiting approval: {', '.join(refused)}.")
+    return projects
+
+
+def _projects_changed(project_ids, **changes):
+    """Apply changes with one UPDATE, doing what Project.save() signals would"""
+    Project.objects.filter(pk__in=project_ids).update(
+        **changes, version=F('version') + 1, updated_at=timezone.now())
+    artefacts.mark_stale(ProjectDocument.objects.filter(project__in=project_ids))
+
+
+@transaction.atomic
+def approve_projects(project_ids, user):
+    """Approve several projects at once; returns them"""
+    projects = _lock_pending_projects(project_ids)
+    ids = [project.pk for project in projects]
+    _projects_changed(ids, status='approved', approved_by=user, approved_at=timezone.now())
+    inbox.resolve_batch('project', 'approved', user, projects=ids)
+    return projects
+
+
+@transaction.atomic
+def reject_projects(project_ids, user, reason=''):
+    """Return several projects to their creators as drafts; returns them"""
+    projects = _lock_pending_projects(project_ids)
+    ids = [project.pk for project in projects]
+    _projects_changed(ids, status='draft', reviewed_by=user)
+    inbox.resolve_batch('project', 'rejected', user, projects=ids)
+
+    notifications.notify_each([
+        Notification(
+            user_id=project.created_by_id,
+            title=f"Project Returned - {project.project_id}",
+            message=f"{project.title} was returned for revision. Reason: {reason}",
+            link=reverse('project_detail', args=[project.project_id]),
+        )
+        for project in projects
+    ])
+    return projects
+
+
+# Nominations
+
+@transaction.atomic
+def create_nominations(project, nominees, nomination_type, project_location, user):
+    """Create pending nominations and queue them for the GMs"""
+    gm_users = list(inbox.approvers(['general_manager']))
+    label = dict(ProjectNomination.NOMINATION_TYPES)[nomination_type]
+
+    nominations = []
+    gm_notices = []
+    for nominee in nominees:
+        nomination = ProjectNomination.objects.create(
+            project=project,
+            nomination_type=nomination_type,
+            nominee=nominee,
+            project_location=project_location,
+            nominated_by=user,
+            status='pending_gm'
+        )
+        nominations.append(nomination)
+        link = reverse('approve_nomination', args=[nomination.nomination_id])
+        message = f"{user.get_full_name()} ({user.get_office_display()}) has nominated {nominee.get_full_name()} as {label}"
+
+        # Notify GM
+        gm_notices += [
+            Notification(user=gm, title=f"{label} Nomination - {project.project_id}", message=message, link=link)
+            for gm in gm_users
+        ]
+        inbox.open_items(
+            'nomination_gm', gm_users, project,
+            title=f"{label} Nomination - {project.project_id}",
+            summary=message, link=link, nomination=nomination,
+        )
+    notifications.notify_each(gm_notices)
+    return nominations
+
+
+@transaction.atomic
+def approve_nomination(nomination, user):
+    """
+    Move a nomination one step up the GM -> ED chain.
+    Returns the nomination's new status.
+    """
+    link = reverse('approve_nomination', args=[nomination.nomination_id])
+
+    if user.office == 'general_manager' and nomination.status == 'pending_gm':
+        nomination.status = 'pending_ed'
+        nomination.gm_approved_by = user
+        nomination.gm_approved_at = timezone.now()
+        nomination.save()
+        inbox.resolve_items('nomination_gm', 'approved', user, nomination=nomination)
+
+        # Notify ED
+        ed_users = list(inbox.approvers(['executive_director']))
+        message = (f"GM has approved {nomination.nominee.get_full_name()} as "
+                   f"{nomination.get_nomination_type_display()}. Your approval is required.")
+        notifications.notify(
+            ed_users,
+            title=f"Final Approval Required - {nomination.project.project_id}",
+            message=message,
+            link=link
+        )
+        inbox.open_items(
+            'nomination_ed', ed_users, nomination.project,
+            title=f"Final Approval Required - {nomination.project.project_id}",
+            summary=message, link=link, nomination=nomination,
+        )
+
+    elif user.office == 'executive_director' and nomination.status == 'pending_ed':
+        nomination.status = 'approved'
+        nomination.ed_approved_by = user
+        nomination.ed_approved_at = timezone.now()
+        nomination.save()
+        inbox.resolve_items('nomination_ed', 'approved', user, nomination=nomination)
+
+        # Update project with nominated personnel
+        if nomination.nomination_type == 'project_manager':
+            nomination.project.project_manager = nomination.nominee
+        else:
+            nomination.project.supervisor = nomination.nominee
+        nomination.project.save()
+
+        # Notify nominator
+        notifications.notify(
+            [nomination.nominated_by],
+            title=f"Nomination Approved - {nomination.project.project_id}",
+            message=f"Your nomination of {nomination.nominee.get_full_name()} as {nomination.get_nomination_type_display()} has been fully approved.",
+        )
+    else:
+        raise WorkflowError("Invalid approval action.")
+
+    return nomination.status
+
+
+@transaction.atomic
+def reject_nomination(nomination, user, reason=''):
+    if nomination.status not in ['pending_gm', 'pending_ed']:
+        raise WorkflowError("Only pending nominations can be rejected.")
+
+    kind = 'nomination_gm' if nomination.status == 'pending_gm' else 'nomination_ed'
+    nomination.status = 'rejected'
+    nomination.rejection_reason = reason
+    nomination.save()
+    inbox.resolve_items(kind, 'rejected', user, nomination=nomination)
+
+    # Notify nominator
+    notifications.notify(
+        [nomination.nominated_by],
+        title=f"Nomination Rejected - {nomination.project.project_id}",
+        message=f"Your nomination of {nomination.nominee.get_full_name()} as {nomination.get_nomination_type_display()} was rejected. Reason: {reason}",
+    )
+
+
+def _lock_nominations(nomination_ids, statuses):
+    """The nominations, locked, if all of them have one of these statuses"""
+    nomination_ids = set(nomination_ids)
+    nominations = list(ProjectNomination.objects.select_for_update(of=('self',)).filter(pk__in=nomination_ids)
+                       .select_related('project', 'nominee').order_by('created_at'))
+    refused = len(nomination_ids) - sum(nomination.status in statuses for nomination in nominations)
+    if refused:
+        raise WorkflowError(f"{refused} of the selected nominations cannot be decided at this step.")
+    return nominations
+
+
+def _nominations_changed(nominations, **changes):
+    ProjectNomination.objects.filter(pk__in=[n.pk for n in nominations]).update(**changes, updated_at=timezone.now())
+    versions.bump_projects(*{n.project_id for n in nominations})
+
+
+@transaction.atomic
+def approve_nominations(nomination_ids, user):
+    """
+    Move several nominations one step up the GM -> ED chain, as
+    approve_nomination() does for one. Returns them.
+    """
+    if user.office == 'general_manager':
+        step = 'pending_gm'
+    elif user.office == 'executive_director':
+        step = 'pending_ed'
+    else:
+        raise WorkflowError("Invalid approval action.")
+    nominations = _lock_nominations(nomination_ids, [step])
+    now = timezone.now()
+
+    if step == 'pending_gm':
+        _nominations_changed(nominations, status='pending_ed', gm_approved_by=user, gm_approved_at=now)
+        inbox.resolve_batch('nomination_gm', 'approved', user, nominations=nominations)
+
+        # Notify ED
+        ed_users = list(inbox.approvers(['executive_director']))
+        notices, entries = [], []
+        for nomination in nominations:
+            title = f"Final Approval Required - {nomination.project.project_id}"
+            message = (f"GM has approved {nomination.nominee.get_full_name()} as "
+                       f"{nomination.get_nomination_type_display()}. Your approval is required.")
+            link = reverse('approve_nomination', args=[nomination.nomination_id])
+            notices += [Notification(user=ed, title=title, message=message, link=link) for ed in ed_users]
+            entries.append({'project': nomination.project, 'nomination': nomination,
+                            'title': title, 'summary': message, 'link': link})
+        notifications.notify_each(notices)
+        inbox.open_batch('nomination_ed', ed_users, entries)
+    else:
+        _nominations_changed(nominations, status='approved', ed_approved_by=user, ed_approved_at=now)
+        inbox.resolve_batch('nomination_ed', 'approved', user, nominations=nominations)
+
+        # Update projects with nominated personnel; the latest nomination wins
+        for field in ['project_manager', 'supervisor']:
+            chosen = {n.project_id: n.nominee_id for n in nominations
+                      if (n.nomination_type == 'project_manager') == (field == 'project_manager')}
+            if chosen:
+                _projects_changed(list(chosen), **{field: Case(
+                    *[When(pk=project_id, then=Value(nominee_id)) for project_id, nominee_id in chosen.items()])})
+
+        # Notify nominators
+        notifications.notify_each([
+            Notification(
+                user_id=nomination.nominated_by_id,
+                title=f"Nomination Approved - {nomination.project.project_id}",
+                message=f"Your nomination of {nomination.nominee.get_full_name()} as {nomination.get_nomination_type_display()} has been fully approved.",
+            )
+            for nomination in nominations
+        ])
+    return nominations
+
+
+@transaction.atomic
+def reject_nominations(nomination_ids, user, reason=''):
+    """Reject several pending nominations at once; returns them"""
+    nominations = _lock_nominations(nomination_ids, ['pending_gm', 'pending_ed'])
+    _nominations_changed(nominations, status='rejected', rejection_reason=reason)
+    for kind, status in [('nomination_gm', 'pending_gm'), ('nomination_ed', 'pending_ed')]:
+        decided = [nomination for nomination in nominations if nomination.status == status]
+        if decided:
+            inbox.resolve_batch(kind, 'rejected', user, nominations=decided)
+
+    # Notify nominators
+    notifications.notify_each([
+        Notification(
+            user_id=nomination.nominated_by_id,
+            title=f"Nomination Rejected - {nomination.project.project_id}",
+            message=f"Your nomination of {nomination.nominee.get_full_name()} as {nomination.get_nomination_type_display()} was rejected. Reason: {reason}",
+        )
+        for nomination in nominations
+    ])
+    return nominations
+
+
+@transaction.atomic
+def withdraw_nomination(nomination):
+    """Delete a pending nomination and clear it from every inbox"""
+    for kind in ['nomination_gm', 'nomination_ed']:
+        inbox.resolve_items(kind, 'closed', nomination=nomination)
+    nomination.delete()
+
+
+# Stages
+
+def _stage_link(stage):
+    return reverse('project_detail', args=[stage.project.project_id])
+
+
+def _clear_overdue(stage):
+    # Don't leave a finished stage flagged until the next overdue run
+    if stage.status == 'completed' and stage.is_overdue:
+        ProjectStage.objects.filter(pk=stage.pk).update(is_overdue=False, overdue_since=None, aging_bucket='')
+        versions.bump_projects(stage.project_id)
+
+
+@transaction.atomic
+def stage_changed(stage, previous_status, user, previous_forward_to_id=UNCHANGED):
+    """
+    Log a stage's status change and keep its approval items in step:
+    entering 'requires_approval' queues it for the approvers, leaving it
+    withdraws those items, and a new forward_to gets its own item.
+    """
+    StageTransition.record(stage, previous_status, user)
+    project = stage.project
+    _clear_overdue(stage)
+
+    if stage.status != previous_status:
+        if stage.status == 'requires_approval':
+            inbox.open_items(
+                'stage', inbox.approvers(), project,
+                title=f"{stage.get_stage_type_display()} - {project.project_id}",
+                summary=f"{user.get_full_name()} marked this stage as requiring approval.",
+                link=_stage_link(stage), stage=stage,
+            )
+        elif previous_status == 'requires_approval':
+            inbox.resolve_items('stage', 'closed', user, stage=stage)
+
+    if previous_forward_to_id is not UNCHANGED and stage.forward_to_id != previous_forward_to_id:
+        inbox.resolve_items('stage_forward', 'closed', user, stage=stage)
+        if stage.forward_to_id:
+            inbox.open_items(
+                'stage_forward', [stage.forward_to_id], project,
+                title=f"{stage.get_stage_type_display()} - {project.project_id}",
+                summary=f"Forwarded to you by {user.get_full_name()}.",
+                link=_stage_link(stage), stage=stage,
+            )
+
+
+@transaction.atomic
+def approve_stage(stage, user):
+    if stage.status != 'requires_approval':
+        raise WorkflowError("This stage is not awaiting approval.")
+
+    previous_status = stage.status
+    stage.status = 'completed'
+    stage.approved_by = user
+    stage.approval_date = timezone.now()
+    if not stage.end_date:
+        stage.end_date = timezone.now().date()
+    stage.save()
+    StageTransition.record(stage, previous_status, user)
+    _clear_overdue(stage)
+    inbox.resolve_items('stage', 'approved', user, stage=stage)
+
+
+@transaction.atomic
+def reject_stage(stage, user, reason=''):
+    """Send a stage back to in-progress"""
+    if stage.status != 'requires_approval':
+        raise WorkflowError("This stage is not awaiting approval.")
+
+    previous_status = stage.status
+    stage.status = 'in_progress'
+    if reason:
+        stage.notes = f"{stage.notes}\nReturned by {user.get_full_name()}: {reason}".strip()
+    stage.save()
+    StageTransition.record(stage, previous_status, user)
+    inbox.resolve_items('stage', 'rejected', user, stage=stage)
+
+
+@transaction.atomic
+def acknowledge_forward(stage, user, accept=True):
+    """Accept or hand back a stage forwarded to this user"""
+    if stage.forward_to_id != user.pk:
+        raise WorkflowError("This stage was not forwarded to you.")
+
+    if not accept:
+        stage.forward_to = None
+        stage.save()
+    inbox.resolve_items('stage_forward', 'approved' if accept else 'rejected', user, stage=stage)
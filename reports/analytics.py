@@ -0,0 +1,133 @@
+# reports/analytics.py
+"""
+Stage bottleneck analytics computed from the append-only
+projects.StageTransition log.
+
+Every query walks the log once with LEAD() over each stage's history, which
+is served by the covering index on (stage, changed_at, id). ProjectStage and
+Project are never joined.
+"""
+from django.db import connection
+from django.utils import timezone
+
+from projects.models import ProjectStage, StageTransition, DEPARTMENT_CHOICES, PORT_LOCATION_CHOICES
+
+GROUP_BY_CHOICES = {
+    'department': dict(DEPARTMENT_CHOICES),
+    'location': dict(PORT_LOCATION_CHOICES),
+}
+
+STAGE_LABELS = dict(ProjectStage.STAGE_CHOICES)
+STATUS_LABELS = dict(ProjectStage.STATUS_CHOICES)
+
+# Seconds between two timestamps, per database vendor
+DURATION_SQL = {
+    'postgresql': "EXTRACT(EPOCH FROM ({end} - {start}))",
+    'sqlite': "((julianday({end}) - julianday({start})) * 86400.0)",
+    'mysql': "TIMESTAMPDIFF(SECOND, {start}, {end})",
+}
+
+INTERVALS_CTE = """
+WITH intervals AS (
+    SELECT t.stage_id, t.stage_type, t.{group_by} AS grp, t.to_status,
+           t.changed_at AS entered_at,
+           LEAD(t.changed_at) OVER (
+               PARTITION BY t.stage_id ORDER BY t.changed_at, t.id
+           ) AS left_at
+    FROM {table} t
+),
+timed AS (
+    SELECT stage_type, grp, to_status, left_at,
+           {duration} AS seconds
+    FROM intervals
+    WHERE to_status <> 'completed'
+)
+"""
+
+SECONDS_PER_DAY = 86400.0
+
+
+def _intervals_sql(group_by):
+    if group_by not in GROUP_BY_CHOICES:
+        raise ValueError(f"Cannot group stage analytics by {group_by!r}")
+    duration = DURATION_SQL.get(connection.vendor, DURATION_SQL['postgresql'])
+    return INTERVALS_CTE.format(
+        group_by=group_by,
+        table=connection.ops.quote_name(StageTransition._meta.db_table),
+        duration=duration.format(start='entered_at', end='COALESCE(left_at, %s)'),
+    )
+
+
+def _now_param():
+    return connection.ops.adapt_datetimefield_value(timezone.now())
+
+
+def _fetch(sql, params, group_by):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    labels = GROUP_BY_CHOICES[group_by]
+    for row in rows:
+        row['stage_label'] = STAGE_LABELS.get(row['stage_type'], row['stage_type'])
+        row['group_label'] = labels.get(row['grp'], row['grp'])
+        if 'to_status' in row:
+            row['status_label'] = STATUS_LABELS.get(row['to_status'], row['to_status'])
+        for key in ('avg_days', 'max_days', 'total_days'):
+            if key in row and row[key] is not None:
+                row[key] = round(float(row[key]) / SECONDS_PER_DAY, 1)
+    return rows
+
+
+def time_in_stage(group_by='department'):
+    """Average and longest time spent in each status, for closed intervals."""
+    sql = _intervals_sql(group_by) + """
+    SELECT stage_type, grp, to_status,
+           COUNT(*) AS samples,
+           AVG(seconds) AS avg_days,
+           MAX(seconds) AS max_days
+    FROM timed
+    WHERE left_at IS NOT NULL
+    GROUP BY stage_type, grp, to_status
+    ORDER BY stage_type, grp, to_status
+    """
+    return _fetch(sql, [_now_param()], group_by)
+
+
+def queue_age(group_by='department'):
+    """Stages currently waiting in a non-completed status, with their age."""
+    sql = _intervals_sql(group_by) + """
+    SELECT stage_type, grp, to_status,
+           COUNT(*) AS waiting,
+           AVG(seconds) AS avg_days,
+           MAX(seconds) AS max_days
+    FROM timed
+    WHERE left_at IS NULL
+    GROUP BY stage_type, grp, to_status
+    ORDER BY max_days DESC
+    """
+    return _fetch(sql, [_now_param()], group_by)
+
+
+def bottlenecks(group_by='department', top=3):
+    """The stage types holding work the longest within each group."""
+    sql = _intervals_sql(group_by) + """
+    , per_stage AS (
+        SELECT stage_type, grp,
+               COUNT(*) AS samples,
+               SUM(seconds) AS total_days,
+               AVG(seconds) AS avg_days
+        FROM timed
+        GROUP BY stage_type, grp
+    )
+    SELECT stage_type, grp, samples, total_days, avg_days, rnk
+    FROM (
+        SELECT per_stage.*,
+               RANK() OVER (PARTITION BY grp ORDER BY avg_days DESC) AS rnk
+        FROM per_stage
+    ) ranked
+    WHERE rnk <= %s
+    ORDER BY grp, rnk
+    """
+    return _fetch(sql, [_now_param(), top], group_by)
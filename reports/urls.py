@@ -8,4 +8,5 @@ urlpatterns = [
     path('financial/', views.financial_reports, name='financial_reports'),
     path('status/', views.status_reports, name='status_reports'),
     path('generate/<str:report_type>/', views.generate_report, name='generate_report'),
+    path('stage-bottlenecks/', views.stage_bottlenecks, name='stage_bottlenecks'),
 ]
\ No newline at end of file
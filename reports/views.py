@@ -1,6 +1,7 @@
 # reports/views.py
-from django.shortcuts import render
+from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
+from . import analytics
 
 @login_required
 def report_list(request):
@@ -41,4 +42,23 @@ def generate_report(request, report_type):
         'page_title': f'Generate {report_type} Report',
         'report_type': report_type,
     }
-    return render(request, 'reports/generate_report.html', context)
\ No newline at end of file
+    return render(request, 'reports/generate_report.html', context)
+
+@login_required
+def stage_bottlenecks(request):
+    """Time-in-stage, queue age and bottleneck stages across the portfolio"""
+    if request.user.office not in ['executive_director', 'general_manager', 'assistant_general_manager']:
+        return redirect('dashboard')
+    
+    group_by = request.GET.get('group_by', 'department')
+    if group_by not in analytics.GROUP_BY_CHOICES:
+        group_by = 'department'
+    
+    context = {
+        'page_title': 'Stage Bottlenecks',
+        'group_by': group_by,
+        'time_in_stage': analytics.time_in_stage(group_by),
+        'queue_age': analytics.queue_age(group_by),
+        'bottlenecks': analytics.bottlenecks(group_by),
+    }
+    return render(request, 'reports/stage_bottlenecks.html', context)